@@ -0,0 +1,491 @@
+#!/usr/bin/env python3
+"""End-to-end load test of the proxy against a local mock upstream.
+
+Starts ``benchmarks/mock_upstream.py`` and ``prompt-passage`` (the real CLI,
+optionally with ``--workers``) as separate processes, then drives them with a
+concurrent closed-loop load generator. Each scenario runs against the mock
+directly and then through the proxy. A third, paired run sends every request
+both ways back to back, alternating which goes first. The difference in each
+pair is what the proxy added to that request, and the proxy-added quantiles
+are taken over those differences:
+
+``chat``
+    non-streaming completions; proxy-added p50/p99/p99.9 latency and requests
+    per CPU-second of the proxy processes (requests per second per core)
+``stream``
+    streamed completions sent as fast as the mock can; proxy-added p50/p99/p99.9
+    time to first byte and proxy CPU time per MB relayed
+``open_streams``
+    many slow streams held open at once; proxy resident memory per open stream
+
+CPU and memory are read from ``/proc`` for the proxy and its worker processes,
+so those figures are only reported on Linux. The load generator shares the
+machine with the proxy: pin them apart (``taskset``) for stable numbers.
+Results are printed and, with ``--output``, written as JSON; ``--baseline``
+compares against an earlier JSON file to show regressions between commits.
+
+    python benchmarks/bench_load.py --duration 10 --concurrency 32 --output load.json
+    python benchmarks/bench_load.py --baseline load.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Iterator
+
+import httpx
+import yaml
+
+BENCH = Path(__file__).resolve().parent
+SRC = BENCH.parent / "src"
+_QUANTILES = {"p50": 0.5, "p99": 0.99, "p99.9": 0.999}
+# Metrics compared with --baseline, and whether a higher value is better.
+_HEADLINE = {
+    ("chat", "added_latency_ms", "p50"): False,
+    ("chat", "added_latency_ms", "p99"): False,
+    ("chat", "added_latency_ms", "p99.9"): False,
+    ("chat", "rps_per_core"): True,
+    ("stream", "added_ttfb_ms", "p50"): False,
+    ("stream", "added_ttfb_ms", "p99"): False,
+    ("stream", "cpu_ms_per_mb"): False,
+    ("open_streams", "kib_per_stream"): False,
+}
+
+
+def _percentile(samples: list[float], pct: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+
+def _quantiles_ms(samples: list[float]) -> dict[str, float | None]:
+    return {name: round(_percentile(samples, q) * 1000, 3) if samples else None for name, q in _QUANTILES.items()}
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port: int = sock.getsockname()[1]
+        return port
+
+
+# --- /proc accounting for the proxy's process tree ---------------------------
+
+
+def _tree(root: int) -> list[int]:
+    """Return *root* and all of its descendants."""
+    parents: dict[int, int] = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            stat = Path(f"/proc/{entry}/stat").read_text()
+        except OSError:
+            continue
+        parents[int(entry)] = int(stat.rsplit(")", 1)[1].split()[1])
+    pids = [root]
+    for pid in pids:
+        pids.extend(child for child, parent in parents.items() if parent == pid)
+    return pids
+
+
+def _cpu_seconds(root: int) -> float | None:
+    if not sys.platform.startswith("linux"):
+        return None
+    ticks = os.sysconf("SC_CLK_TCK")
+    total = 0.0
+    for pid in _tree(root):
+        with contextlib.suppress(OSError):
+            fields = Path(f"/proc/{pid}/stat").read_text().rsplit(")", 1)[1].split()
+            total += (int(fields[11]) + int(fields[12])) / ticks  # utime, stime
+    return total
+
+
+def _rss_bytes(root: int) -> int | None:
+    if not sys.platform.startswith("linux"):
+        return None
+    total = 0
+    for pid in _tree(root):
+        with contextlib.suppress(OSError):
+            for line in Path(f"/proc/{pid}/status").read_text().splitlines():
+                if line.startswith("VmRSS:"):
+                    total += int(line.split()[1]) * 1024
+    return total
+
+
+# --- processes ----------------------------------------------------------------
+
+
+@contextlib.contextmanager
+def _serve(cmd: list[str], url: str, log: Path, env: dict[str, str] | None = None) -> Iterator[subprocess.Popen[bytes]]:
+    with open(log, "wb") as out:
+        proc = subprocess.Popen(cmd, stdout=out, stderr=subprocess.STDOUT, env=env)
+    try:
+        deadline = time.monotonic() + 30
+        while True:
+            if proc.poll() is not None:
+                raise RuntimeError(f"{cmd[1]} exited with {proc.returncode}:\n{log.read_text()[-2000:]}")
+            try:
+                httpx.get(url, timeout=1)
+                break
+            except httpx.HTTPError:
+                if time.monotonic() > deadline:
+                    raise RuntimeError(f"{cmd[1]} did not start:\n{log.read_text()[-2000:]}") from None
+                time.sleep(0.1)
+        yield proc
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(30)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            proc.wait()
+
+
+def _write_config(path: Path, upstream: str, connections: int) -> None:
+    provider = {
+        "endpoints": {"base_url": upstream},
+        "model": "mock",
+        "auth": {"type": "apikey", "key": "k"},
+        "pool": {"max_connections": connections, "max_keepalive_connections": connections},
+        # Failures injected by the mock should reach the client, not be retried away.
+        "retry": {"max_retries": 0},
+    }
+    path.write_text(yaml.dump({"providers": {"bench": provider}}))
+
+
+# --- load generation ----------------------------------------------------------
+
+
+@dataclass
+class _Run:
+    latencies: list[float] = field(default_factory=list)
+    first_bytes: list[float] = field(default_factory=list)
+    errors: int = 0
+    bytes: int = 0
+    elapsed: float = 0.0
+    # Paired runs only: proxied minus direct, per pair of requests.
+    added_latencies: list[float] = field(default_factory=list)
+    added_first_bytes: list[float] = field(default_factory=list)
+
+
+async def _load(
+    url: str, body: dict[str, Any], concurrency: int, duration: float, paired_with: str | None = None
+) -> _Run:
+    """Send *body* from *concurrency* clients back to back for *duration* seconds.
+
+    With *paired_with*, each client sends every request to that URL as well,
+    and the run records the per-pair differences (*url* minus *paired_with*).
+    """
+    content = json.dumps(body).encode()
+    headers = {"Content-Type": "application/json"}
+    stream = bool(body.get("stream"))
+    run = _Run()
+    limits = httpx.Limits(max_connections=concurrency * 2, max_keepalive_connections=concurrency * 2)
+    async with httpx.AsyncClient(limits=limits, timeout=60) as client:
+        deadline = time.perf_counter() + duration
+
+        async def _send(target: str) -> tuple[float, float | None] | None:
+            """Return the latency and time to first byte of one request, or None if it failed."""
+            started = time.perf_counter()
+            first = None
+            try:
+                async with client.stream("POST", target, content=content, headers=headers) as resp:
+                    async for chunk in resp.aiter_raw():
+                        if first is None:
+                            first = time.perf_counter()
+                        run.bytes += len(chunk)
+            except httpx.HTTPError:
+                run.errors += 1
+                return None
+            if resp.status_code != 200:
+                run.errors += 1
+                return None
+            return time.perf_counter() - started, first - started if first is not None else None
+
+        async def _client() -> None:
+            while time.perf_counter() < deadline:
+                result = await _send(url)
+                if result is None:
+                    continue
+                run.latencies.append(result[0])
+                if stream and result[1] is not None:
+                    run.first_bytes.append(result[1])
+
+        async def _paired_client(direct: str) -> None:
+            proxied_first = False
+            while time.perf_counter() < deadline:
+                # Alternated so drift within a pair does not favour either side.
+                proxied_first = not proxied_first
+                if proxied_first:
+                    proxied, base = await _send(url), await _send(direct)
+                else:
+                    base, proxied = await _send(direct), await _send(url)
+                if proxied is None or base is None:
+                    continue
+                run.added_latencies.append(proxied[0] - base[0])
+                if stream and proxied[1] is not None and base[1] is not None:
+                    run.added_first_bytes.append(proxied[1] - base[1])
+
+        started = time.perf_counter()
+        clients = (_client() if paired_with is None else _paired_client(paired_with) for _ in range(concurrency))
+        await asyncio.gather(*clients)
+        run.elapsed = time.perf_counter() - started
+    return run
+
+
+async def _measured(url: str, body: dict[str, Any], args: argparse.Namespace, pid: int) -> tuple[_Run, float | None]:
+    """Run the load through the proxy; returns the run and the proxy's CPU seconds."""
+    await _load(url, body, args.concurrency, args.warmup)
+    cpu_before = _cpu_seconds(pid)
+    run = await _load(url, body, args.concurrency, args.duration)
+    cpu_after = _cpu_seconds(pid)
+    cpu = cpu_after - cpu_before if cpu_before is not None and cpu_after is not None else None
+    return run, cpu
+
+
+async def _chat(direct: str, proxied: str, pid: int, args: argparse.Namespace) -> dict[str, Any]:
+    body = {"model": "mock", "messages": [{"role": "user", "content": "hello"}], "max_tokens": args.tokens}
+    await _load(direct, body, args.concurrency, args.warmup)
+    base = await _load(direct, body, args.concurrency, args.duration)
+    run, cpu = await _measured(proxied, body, args, pid)
+    pairs = await _load(proxied, body, args.concurrency, args.duration, paired_with=direct)
+    direct_ms, proxied_ms = _quantiles_ms(base.latencies), _quantiles_ms(run.latencies)
+    return {
+        "requests": len(run.latencies),
+        "errors": run.errors,
+        "rps": round(len(run.latencies) / run.elapsed, 1),
+        "direct_rps": round(len(base.latencies) / base.elapsed, 1),
+        "cpu_seconds": round(cpu, 3) if cpu is not None else None,
+        "rps_per_core": round(len(run.latencies) / cpu, 1) if cpu else None,
+        "latency_ms": {"direct": direct_ms, "proxied": proxied_ms},
+        "pairs": len(pairs.added_latencies),
+        "added_latency_ms": _quantiles_ms(pairs.added_latencies),
+    }
+
+
+async def _stream(direct: str, proxied: str, pid: int, args: argparse.Namespace) -> dict[str, Any]:
+    body = {
+        "model": "mock",
+        "messages": [{"role": "user", "content": "hello"}],
+        "max_tokens": args.stream_tokens,
+        "stream": True,
+        "mock": {"ttft": 0.0, "token_rate": 0},
+    }
+    await _load(direct, body, args.concurrency, args.warmup)
+    base = await _load(direct, body, args.concurrency, args.duration)
+    run, cpu = await _measured(proxied, body, args, pid)
+    pairs = await _load(proxied, body, args.concurrency, args.duration, paired_with=direct)
+    direct_ms, proxied_ms = _quantiles_ms(base.first_bytes), _quantiles_ms(run.first_bytes)
+    mb = run.bytes / 1_000_000
+    return {
+        "streams": len(run.latencies),
+        "errors": run.errors,
+        "mb_streamed": round(mb, 2),
+        "cpu_seconds": round(cpu, 3) if cpu is not None else None,
+        "cpu_ms_per_mb": round(cpu * 1000 / mb, 2) if cpu is not None and mb else None,
+        "ttfb_ms": {"direct": direct_ms, "proxied": proxied_ms},
+        "pairs": len(pairs.added_first_bytes),
+        "added_ttfb_ms": _quantiles_ms(pairs.added_first_bytes),
+        "duration_ms": _quantiles_ms(run.latencies),
+    }
+
+
+async def _open_streams(proxied: str, pid: int, args: argparse.Namespace) -> dict[str, Any]:
+    # One event a second for an hour: the streams stay open until they are closed here.
+    body = {
+        "model": "mock",
+        "messages": [{"role": "user", "content": "hello"}],
+        "max_tokens": 3600,
+        "stream": True,
+        "mock": {"ttft": 0.0, "token_rate": 1},
+    }
+    content = json.dumps(body).encode()
+    headers = {"Content-Type": "application/json"}
+
+    async def _hold_open() -> tuple[int | None, int | None]:
+        """Open every stream, and return the proxy's RSS before and while they are open."""
+        opened = 0
+        ready = asyncio.Event()
+        release = asyncio.Event()
+        async with httpx.AsyncClient(limits=httpx.Limits(max_connections=args.streams), timeout=60) as client:
+
+            async def _hold() -> None:
+                nonlocal opened
+                async with client.stream("POST", proxied, content=content, headers=headers) as resp:
+                    await resp.aiter_raw().__anext__()
+                    opened += 1
+                    if opened == args.streams:
+                        ready.set()
+                    await release.wait()
+
+            before = _rss_bytes(pid)
+            tasks = [asyncio.create_task(_hold()) for _ in range(args.streams)]
+            try:
+                await asyncio.wait_for(ready.wait(), 60)
+                await asyncio.sleep(1.0)  # let the proxy settle with every stream open
+                return before, _rss_bytes(pid)
+            finally:
+                release.set()
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+
+    # The first round grows pools and allocator arenas once; the second measures the streams.
+    await _hold_open()
+    await asyncio.sleep(1.0)
+    before, during = await _hold_open()
+
+    per_stream = (during - before) / args.streams if before is not None and during is not None else None
+    return {
+        "streams": args.streams,
+        "rss_mib_idle": round(before / 2**20, 1) if before is not None else None,
+        "rss_mib_open": round(during / 2**20, 1) if during is not None else None,
+        "kib_per_stream": round(per_stream / 1024, 1) if per_stream is not None else None,
+    }
+
+
+async def _scenarios(mock: str, proxy: str, pid: int, args: argparse.Namespace) -> dict[str, Any]:
+    direct = f"{mock}/chat/completions"
+    proxied = f"{proxy}/provider/bench/chat/completions"
+    results: dict[str, Any] = {}
+    if "chat" in args.scenarios:
+        results["chat"] = await _chat(direct, proxied, pid, args)
+    if "stream" in args.scenarios:
+        results["stream"] = await _stream(direct, proxied, pid, args)
+    if "open_streams" in args.scenarios:
+        results["open_streams"] = await _open_streams(proxied, pid, args)
+    return results
+
+
+# --- reporting ----------------------------------------------------------------
+
+
+def _commit() -> str | None:
+    try:
+        out = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BENCH, capture_output=True, text=True, check=True
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return out.stdout.strip() or None
+
+
+def _lookup(results: dict[str, Any], path: tuple[str, ...]) -> float | None:
+    value: Any = results
+    for key in path:
+        if not isinstance(value, dict):
+            return None
+        value = value.get(key)
+    return value if isinstance(value, (int, float)) else None
+
+
+def _report(results: dict[str, Any], baseline: dict[str, Any] | None, threshold: float) -> None:
+    header = f"{'metric':<40} {'value':>12}"
+    if baseline is not None:
+        header += f" {'baseline':>12} {'change':>9}"
+    print(header)
+    for path, higher_is_better in _HEADLINE.items():
+        value = _lookup(results["scenarios"], path)
+        if value is None:
+            continue
+        line = f"{'.'.join(path):<40} {value:>12.2f}"
+        if baseline is not None:
+            old = _lookup(baseline.get("scenarios", {}), path)
+            if old is not None:
+                line += f" {old:>12.2f}"
+                if old:
+                    change = (value - old) / abs(old) * 100
+                    worse = change < 0 if higher_is_better else change > 0
+                    line += f" {change:>+8.1f}%{' !' if worse and abs(change) >= threshold else ''}"
+        print(line)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument(
+        "--scenarios", nargs="+", choices=["chat", "stream", "open_streams"], default=["chat", "stream", "open_streams"]
+    )
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds of load per run")
+    parser.add_argument("--warmup", type=float, default=1.0, help="seconds of unmeasured load before each run")
+    parser.add_argument("--concurrency", type=int, default=16, help="clients sending requests back to back")
+    parser.add_argument("--tokens", type=int, default=64, help="completion tokens of a non-streaming response")
+    parser.add_argument("--stream-tokens", type=int, default=1000, help="events in each streamed response")
+    parser.add_argument("--streams", type=int, default=200, help="streams held open by open_streams")
+    parser.add_argument("--workers", type=int, default=1, help="proxy worker processes")
+    parser.add_argument("--latency", type=float, default=0.0, help="mock latency of non-streaming responses")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of mock responses that fail")
+    parser.add_argument("--output", type=Path, help="write the results to this JSON file")
+    parser.add_argument("--baseline", type=Path, help="compare with the results of an earlier run")
+    parser.add_argument("--threshold", type=float, default=10.0, help="percent change flagged as a regression")
+    args = parser.parse_args()
+
+    mock_port, proxy_port = _free_port(), _free_port()
+    mock = f"http://127.0.0.1:{mock_port}"
+    proxy = f"http://127.0.0.1:{proxy_port}"
+    env = {**os.environ, "PYTHONPATH": os.pathsep.join(filter(None, [str(SRC), os.environ.get("PYTHONPATH")]))}
+    with tempfile.TemporaryDirectory() as tmp:
+        config = Path(tmp) / "config.yaml"
+        _write_config(config, mock, max(args.concurrency, args.streams) + 8)
+        mock_cmd = [
+            sys.executable,
+            str(BENCH / "mock_upstream.py"),
+            f"--port={mock_port}",
+            f"--latency={args.latency}",
+            f"--error-rate={args.error_rate}",
+        ]
+        proxy_cmd = [
+            sys.executable,
+            "-m",
+            "prompt_passage.cli",
+            f"--config={config}",
+            "--host=127.0.0.1",
+            f"--port={proxy_port}",
+            f"--workers={args.workers}",
+        ]
+        with (
+            _serve(mock_cmd, mock, Path(tmp) / "mock.log"),
+            _serve(proxy_cmd, f"{proxy}/health", Path(tmp) / "proxy.log", env) as proxy_proc,
+        ):
+            scenarios = asyncio.run(_scenarios(mock, proxy, proxy_proc.pid, args))
+
+    results = {
+        "commit": _commit(),
+        "created": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "settings": {
+            key: getattr(args, key)
+            for key in (
+                "duration",
+                "concurrency",
+                "tokens",
+                "stream_tokens",
+                "streams",
+                "workers",
+                "latency",
+                "error_rate",
+            )
+        },
+        "scenarios": scenarios,
+    }
+    baseline = json.loads(args.baseline.read_text()) if args.baseline else None
+    _report(results, baseline, args.threshold)
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2) + "\n")
+
+
+if __name__ == "__main__":
+    main()
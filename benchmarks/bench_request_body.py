@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""Compare request body preparation against the old decode/re-encode path.
+
+For chat bodies from 1 KB to 10 MB this reports CPU time per request and the
+peak memory allocated while preparing one body, for a body whose model already
+matches the provider and for one whose model must be rewritten.
+
+    python benchmarks/bench_request_body.py
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+import time
+from functools import partial
+import tracemalloc
+from pathlib import Path
+from typing import Callable
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from prompt_passage import body as body_mod
+from prompt_passage.body import prepare_request_body
+
+SIZES = [1_000, 10_000, 100_000, 1_000_000, 10_000_000]
+
+
+def _legacy(raw: bytes, model: str) -> bytes:
+    """The proxy's previous unconditional json.loads + json.dumps."""
+    obj = json.loads(raw.decode("utf-8"))
+    if "model" in obj:
+        obj["model"] = model
+    bool(obj.get("stream", False))
+    return json.dumps(obj).encode("utf-8")
+
+
+def _make_body(size: int, model: str) -> bytes:
+    turn = {"role": "user", "content": "Lorem ipsum dolor sit amet, consectetur adipiscing elit. " * 4}
+    messages = []
+    raw = b""
+    while len(raw) < size:
+        messages.append(turn)
+        raw = json.dumps({"model": model, "messages": messages, "temperature": 0}).encode("utf-8")
+    return raw
+
+
+def _measure(fn: Callable[[], object], budget: float) -> tuple[float, int]:
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    runs = 0
+    started = time.process_time()
+    while True:
+        fn()
+        runs += 1
+        elapsed = time.process_time() - started
+        if elapsed >= budget:
+            return elapsed / runs, peak
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--budget", type=float, default=0.5, help="CPU seconds spent per measurement")
+    parser.add_argument("--codec", choices=["auto", "json"], default="auto", help="force the stdlib json codec")
+    parser.add_argument("--max-size", type=int, default=SIZES[-1])
+    args = parser.parse_args()
+
+    if args.codec == "json":
+        body_mod.orjson = None
+    codec = "orjson" if body_mod.orjson is not None else "json"
+    print(f"codec: {codec}")
+    print(f"{'size':>10} {'case':<10} {'legacy cpu':>12} {'new cpu':>12} {'legacy peak':>13} {'new peak':>12}")
+    for size in [s for s in SIZES if s <= args.max_size]:
+        for case, client_model in (("match", "remote"), ("rewrite", "local")):
+            raw = _make_body(size, client_model)
+            old_cpu, old_peak = _measure(partial(_legacy, raw, "remote"), args.budget)
+            new_cpu, new_peak = _measure(partial(prepare_request_body, raw, "remote"), args.budget)
+            print(
+                f"{len(raw):>10} {case:<10} {old_cpu * 1e6:>9.0f} us {new_cpu * 1e6:>9.0f} us "
+                f"{old_peak / 1024:>10.0f} KB {new_peak / 1024:>9.0f} KB"
+            )
+
+
+if __name__ == "__main__":
+    main()
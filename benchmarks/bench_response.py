@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""Proxy-added latency for large non-streaming completions.
+
+A JSON-mode style completion of each size is served by an in-memory upstream
+(``httpx.MockTransport``), first directly and then through the proxy app over
+ASGI. The difference between the two is the latency the proxy adds.
+
+    python benchmarks/bench_response.py --sizes 10000 100000 1000000 5000000
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import statistics
+import sys
+import time
+from pathlib import Path
+
+import httpx
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from prompt_passage import proxy_app
+from prompt_passage.config import parse_config
+
+
+def _completion(size: int) -> bytes:
+    row = {"id": 1, "name": "widget", "tags": ["a", "b"], "price": 9.99}
+    rows = [row] * max(1, size // len(json.dumps(row)))
+    return json.dumps(
+        {
+            "id": "chatcmpl-1",
+            "object": "chat.completion",
+            "model": "m",
+            "choices": [
+                {
+                    "index": 0,
+                    "message": {"role": "assistant", "content": json.dumps({"rows": rows})},
+                    "finish_reason": "stop",
+                }
+            ],
+            "usage": {"prompt_tokens": 10, "completion_tokens": size // 4, "total_tokens": size // 4 + 10},
+        }
+    ).encode("utf-8")
+
+
+def _percentile(samples: list[float], pct: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+
+async def _run(size: int, requests: int) -> dict[str, float]:
+    payload = _completion(size)
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(200, content=payload, headers={"content-type": "application/json"})
+
+    upstream = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    cfg = parse_config(
+        {
+            "providers": {
+                "p": {
+                    "endpoints": {"base_url": "https://mock.upstream"},
+                    "model": "m",
+                    "auth": {"type": "apikey", "key": "k"},
+                    "body_log": {"level": "debug"},
+                }
+            }
+        }
+    )
+    app = proxy_app.create_app(cfg)
+    request_body = {"model": "m", "messages": [{"role": "user", "content": "rows please"}]}
+
+    direct: list[float] = []
+    proxied: list[float] = []
+    async with app.router.lifespan_context(app):
+        assert proxy_app._forwarder is not None
+        proxy_app._forwarder.pool("https://mock.upstream").client = upstream
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://proxy") as client:
+            for _ in range(requests):
+                started = time.perf_counter()
+                resp = await upstream.post("https://mock.upstream/chat/completions", json=request_body)
+                resp.read()
+                direct.append(time.perf_counter() - started)
+
+                started = time.perf_counter()
+                resp = await client.post("/provider/p/chat/completions", json=request_body)
+                assert resp.status_code == 200 and len(resp.content) == len(payload)
+                proxied.append(time.perf_counter() - started)
+
+    added = [p - d for p, d in zip(proxied, direct)]
+    return {
+        "size": len(payload),
+        "p50_ms": statistics.median(added) * 1000,
+        "p99_ms": _percentile(added, 0.99) * 1000,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000, 5_000_000])
+    parser.add_argument("--requests", type=int, default=50)
+    args = parser.parse_args()
+
+    print(f"{'size':>10} {'added p50':>12} {'added p99':>12}")
+    for size in args.sizes:
+        result = asyncio.run(_run(size, args.requests))
+        print(f"{result['size']:>10} {result['p50_ms']:>9.2f} ms {result['p99_ms']:>9.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
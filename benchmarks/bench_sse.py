@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""Per-chunk cost of stream accounting.
+
+A chat completions stream of ``--tokens`` deltas (plus the final usage chunk)
+is fed to :class:`StreamAccountant` as the upstream would write it: one event
+per chunk, several events per chunk, and events split across small chunks.
+The relay loop without accounting is timed as the baseline.
+
+    python benchmarks/bench_sse.py --tokens 2000
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+from typing import Callable
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from prompt_passage.sse import StreamAccountant
+
+
+def _events(tokens: int) -> list[bytes]:
+    events = []
+    for i in range(tokens):
+        chunk = {
+            "id": "chatcmpl-1",
+            "object": "chat.completion.chunk",
+            "model": "m",
+            "choices": [{"index": 0, "delta": {"content": f" word{i}"}, "finish_reason": None}],
+            "usage": None,
+        }
+        events.append(b"data: " + json.dumps(chunk).encode("utf-8") + b"\n\n")
+    usage = {"prompt_tokens": 10, "completion_tokens": tokens, "total_tokens": tokens + 10}
+    events.append(b"data: " + json.dumps({"choices": [], "usage": usage}).encode("utf-8") + b"\n\n")
+    events.append(b"data: [DONE]\n\n")
+    return events
+
+
+def _chunkings(events: list[bytes]) -> dict[str, list[bytes]]:
+    stream = b"".join(events)
+    return {
+        "event per chunk": events,
+        "8 events per chunk": [b"".join(events[i : i + 8]) for i in range(0, len(events), 8)],
+        "64-byte chunks": [stream[i : i + 64] for i in range(0, len(stream), 64)],
+    }
+
+
+def _time(fn: Callable[[], None], budget: float) -> float:
+    fn()
+    runs = 0
+    started = time.perf_counter()
+    while time.perf_counter() - started < budget:
+        fn()
+        runs += 1
+    return (time.perf_counter() - started) / runs
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tokens", type=int, default=2000)
+    parser.add_argument("--budget", type=float, default=1.0, help="seconds spent per measurement")
+    args = parser.parse_args()
+
+    print(f"{'chunking':<20} {'chunks':>7} {'relay':>10} {'accounted':>10} {'overhead/chunk':>15}")
+    for name, chunks in _chunkings(_events(args.tokens)).items():
+
+        def relay(chunks: list[bytes] = chunks) -> None:
+            size = 0
+            for chunk in chunks:
+                size += len(chunk)
+
+        def accounted(chunks: list[bytes] = chunks) -> None:
+            accountant = StreamAccountant()
+            size = 0
+            for chunk in chunks:
+                accountant.feed(chunk)
+                size += len(chunk)
+            assert accountant.usage is not None
+
+        base = _time(relay, args.budget)
+        full = _time(accounted, args.budget)
+        per_chunk = (full - base) / len(chunks)
+        print(f"{name:<20} {len(chunks):>7} {base * 1e3:>7.2f} ms {full * 1e3:>7.2f} ms {per_chunk * 1e9:>12.0f} ns")
+
+
+if __name__ == "__main__":
+    main()
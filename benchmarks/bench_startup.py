@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""Measure time to first served request as the number of providers grows.
+
+Each sample runs in a fresh interpreter so import and config costs are paid
+exactly as on a cold start. The child process loads the config, builds the app
+the same way ``prompt-passage`` does, and forwards one chat completion to a
+local stub upstream. The parent reports wall time from process spawn to the
+first response.
+
+    python benchmarks/bench_startup.py --providers 1 10 100 1000
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import yaml
+
+SRC = Path(__file__).resolve().parent.parent / "src"
+
+
+class _Upstream(BaseHTTPRequestHandler):
+    def do_POST(self) -> None:
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        body = b'{"choices": [], "usage": {"prompt_tokens": 1, "completion_tokens": 1}}'
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args: object) -> None:
+        pass
+
+
+def _write_config(path: Path, providers: int, base_url: str) -> None:
+    entries = {}
+    for i in range(providers):
+        entry: dict[str, object] = {
+            "endpoints": {"base_url": base_url},
+            "model": f"model-{i}",
+            "auth": {"type": "apikey", "key": "k"} if i % 4 else {"type": "azure"},
+        }
+        if i % 2:
+            entry["transform"] = ".messages as $m | .input=$m | del(.messages)"
+        entries[f"p{i}"] = entry
+    # The first provider is the one exercised, keep it on apikey auth.
+    entries["p0"]["auth"] = {"type": "apikey", "key": "k"}
+    path.write_text(yaml.dump({"providers": entries}))
+
+
+def _child(config_path: str) -> None:
+    started = time.perf_counter()
+    sys.path.insert(0, str(SRC))
+    from fastapi.testclient import TestClient
+
+    from prompt_passage.config import load_config
+    from prompt_passage.proxy_app import create_app
+
+    app = create_app(load_config(config_path))
+    with TestClient(app) as client:
+        resp = client.post("/provider/p0/chat/completions", json={"model": "x", "messages": []})
+        assert resp.status_code == 200, resp.text
+        print(json.dumps({"in_process_seconds": time.perf_counter() - started}))
+
+
+def _run(providers: int, repeat: int, base_url: str) -> dict[str, float]:
+    samples = []
+    in_process = []
+    with tempfile.TemporaryDirectory() as tmp:
+        cfg = Path(tmp) / "config.yaml"
+        _write_config(cfg, providers, base_url)
+        for _ in range(repeat):
+            started = time.perf_counter()
+            out = subprocess.run(
+                [sys.executable, __file__, "--child", str(cfg)],
+                check=True,
+                capture_output=True,
+                text=True,
+            ).stdout
+            samples.append(time.perf_counter() - started)
+            in_process.append(json.loads(out.strip().splitlines()[-1])["in_process_seconds"])
+    return {
+        "providers": providers,
+        "first_request_ms": min(samples) * 1000,
+        "in_process_ms": min(in_process) * 1000,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--providers", type=int, nargs="+", default=[1, 10, 100, 1000])
+    parser.add_argument("--repeat", type=int, default=3, help="samples per size, the fastest is reported")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        _child(args.child)
+        return
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _Upstream)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    print(f"{'providers':>10} {'first request':>15} {'in process':>12}")
+    for n in args.providers:
+        result = _run(n, args.repeat, base_url)
+        print(f"{n:>10} {result['first_request_ms']:>12.1f} ms {result['in_process_ms']:>9.1f} ms")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""A local OpenAI-compatible upstream for load tests.
+
+Every POST is answered as a chat completion, as JSON or, when the body sets
+``"stream": true``, as server-sent events with a final ``usage`` chunk and
+``data: [DONE]``. Timing and failures are set on the command line and can be
+overridden per request with a ``"mock"`` object in the body, which the proxy
+forwards untouched:
+
+``latency``
+    seconds before a non-streaming response is sent (plus up to ``jitter``)
+``ttft``
+    seconds before the first event of a stream
+``token_rate``
+    events per second once a stream has started; 0 sends them all at once
+``max_tokens``
+    completion tokens, one event each (the request's own ``max_tokens`` wins)
+``error_rate`` / ``throttle_rate``
+    share of requests answered with ``error_status`` or 429
+
+    python benchmarks/mock_upstream.py --port 9000 --ttft 0.2 --token-rate 50
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import random
+from typing import Any, Awaitable, Callable
+
+import uvicorn
+
+Scope = dict[str, Any]
+Receive = Callable[[], Awaitable[dict[str, Any]]]
+Send = Callable[[dict[str, Any]], Awaitable[None]]
+
+_TOKEN = " lorem"
+
+
+class MockUpstream:
+    """ASGI app answering every POST as a chat completion."""
+
+    def __init__(self, **defaults: Any):
+        self.defaults = {
+            "latency": 0.0,
+            "jitter": 0.0,
+            "ttft": 0.0,
+            "token_rate": 0.0,
+            "max_tokens": 16,
+            "error_rate": 0.0,
+            "throttle_rate": 0.0,
+            "error_status": 500,
+        }
+        self.defaults.update(defaults)
+        chunk = {
+            "id": "chatcmpl-mock",
+            "object": "chat.completion.chunk",
+            "model": "mock",
+            "choices": [{"index": 0, "delta": {"content": _TOKEN}, "finish_reason": None}],
+        }
+        self._event = f"data: {json.dumps(chunk)}\n\n".encode()
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        raw = b""
+        while True:
+            message = await receive()
+            raw += message.get("body", b"")
+            if not message.get("more_body"):
+                break
+        try:
+            body = json.loads(raw) if raw else {}
+        except ValueError:
+            body = {}
+        opts = {**self.defaults, **(body.get("mock") or {})}
+        tokens = int(body.get("max_tokens") or opts["max_tokens"])
+
+        roll = random.random()
+        if roll < opts["error_rate"]:
+            await self._json(send, int(opts["error_status"]), {"error": {"message": "mock failure"}})
+        elif roll < opts["error_rate"] + opts["throttle_rate"]:
+            await self._json(send, 429, {"error": {"message": "mock throttle"}})
+        elif body.get("stream"):
+            await self._stream(send, opts, tokens)
+        else:
+            await asyncio.sleep(opts["latency"] + random.uniform(0.0, opts["jitter"]))
+            await self._json(
+                send,
+                200,
+                {
+                    "id": "chatcmpl-mock",
+                    "object": "chat.completion",
+                    "model": body.get("model", "mock"),
+                    "choices": [
+                        {
+                            "index": 0,
+                            "message": {"role": "assistant", "content": _TOKEN * tokens},
+                            "finish_reason": "stop",
+                        }
+                    ],
+                    "usage": {"prompt_tokens": 8, "completion_tokens": tokens, "total_tokens": 8 + tokens},
+                },
+            )
+
+    async def _json(self, send: Send, status: int, payload: dict[str, Any]) -> None:
+        data = json.dumps(payload).encode()
+        headers = [(b"content-type", b"application/json"), (b"content-length", str(len(data)).encode())]
+        await send({"type": "http.response.start", "status": status, "headers": headers})
+        await send({"type": "http.response.body", "body": data})
+
+    async def _stream(self, send: Send, opts: dict[str, Any], tokens: int) -> None:
+        await asyncio.sleep(opts["ttft"])
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 200,
+                "headers": [(b"content-type", b"text/event-stream"), (b"cache-control", b"no-cache")],
+            }
+        )
+        loop = asyncio.get_running_loop()
+        rate = float(opts["token_rate"])
+        started = loop.time()
+        sent = 0
+        while sent < tokens:
+            # Events that fell due while sleeping go out together rather than drifting behind.
+            due = tokens if rate <= 0 else min(tokens, max(sent + 1, int((loop.time() - started) * rate)))
+            await send({"type": "http.response.body", "body": self._event * (due - sent), "more_body": True})
+            sent = due
+            if sent < tokens:
+                await asyncio.sleep(max(0.0, started + sent / rate - loop.time()))
+        final = {
+            "id": "chatcmpl-mock",
+            "object": "chat.completion.chunk",
+            "model": "mock",
+            "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": 8, "completion_tokens": tokens, "total_tokens": 8 + tokens},
+        }
+        tail = f"data: {json.dumps(final)}\n\ndata: [DONE]\n\n".encode()
+        await send({"type": "http.response.body", "body": tail})
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--ttft", type=float, default=0.0)
+    parser.add_argument("--token-rate", type=float, default=0.0)
+    parser.add_argument("--max-tokens", type=int, default=16)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--throttle-rate", type=float, default=0.0)
+    parser.add_argument("--error-status", type=int, default=500)
+    args = parser.parse_args()
+
+    app = MockUpstream(
+        latency=args.latency,
+        jitter=args.jitter,
+        ttft=args.ttft,
+        token_rate=args.token_rate,
+        max_tokens=args.max_tokens,
+        error_rate=args.error_rate,
+        throttle_rate=args.throttle_rate,
+        error_status=args.error_status,
+    )
+    uvicorn.run(app, host=args.host, port=args.port, lifespan="off", log_level="warning", access_log=False)
+
+
+if __name__ == "__main__":
+    main()
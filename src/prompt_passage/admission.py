@@ -0,0 +1,191 @@
+"""Admission control: concurrency limits, priority lanes and load shedding.
+
+Requests hold a :class:`Permit` while they are being served. When the global
+or the provider's concurrency limit is reached, new requests wait in the lane
+of their priority class. Freed slots go to the lanes in proportion to their
+``weight`` (stride scheduling), so batch traffic cannot starve interactive
+users and still makes progress itself. A request that has waited longer than
+its class's ``max_wait``, or arrives to a full queue, is shed with
+:class:`Overloaded`. Queue depth and waits are also exported as metrics,
+labelled by provider and priority class.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import time
+from collections import deque
+from typing import TYPE_CHECKING, Any, Mapping
+
+from .config import AdmissionCfg, PriorityClassCfg
+
+if TYPE_CHECKING:
+    from .metrics import Metrics
+
+
+class Overloaded(Exception):
+    """Raised when a request is shed instead of admitted."""
+
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(reason)
+        self.retry_after = retry_after
+
+
+class Permit:
+    """A slot held by one request; :meth:`release` may be called more than once."""
+
+    __slots__ = ("_controller", "provider", "_released")
+
+    def __init__(self, controller: AdmissionController, provider: str):
+        self._controller = controller
+        self.provider = provider
+        self._released = False
+
+    def release(self) -> None:
+        if not self._released:
+            self._released = True
+            self._controller._release(self.provider)
+
+
+class _Waiter:
+    __slots__ = ("provider", "future", "enqueued")
+
+    def __init__(self, provider: str, future: asyncio.Future[Permit]):
+        self.provider = provider
+        self.future = future
+        self.enqueued = time.monotonic()
+
+
+class _Lane:
+    """Wait queue and counters of one priority class."""
+
+    def __init__(self, name: str, cfg: PriorityClassCfg):
+        self.name = name
+        self.weight = cfg.weight
+        self.max_wait = cfg.max_wait
+        self.queue: deque[_Waiter] = deque()
+        self.pass_ = 0.0
+        self.admitted = 0
+        self.shed = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def record_wait(self, seconds: float) -> None:
+        self.admitted += 1
+        self.wait_total += seconds
+        if seconds > self.wait_max:
+            self.wait_max = seconds
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "queued": len(self.queue),
+            "admitted": self.admitted,
+            "shed": self.shed,
+            "wait_ms_avg": self.wait_total / self.admitted * 1000 if self.admitted else 0.0,
+            "wait_ms_max": self.wait_max * 1000,
+        }
+
+
+class AdmissionController:
+    """Global and per-provider concurrency limits with weighted-fair priority lanes."""
+
+    def __init__(self, cfg: AdmissionCfg, provider_limits: Mapping[str, int], metrics: Metrics | None = None):
+        self.cfg = cfg
+        self._metrics = metrics
+        self.max_concurrency = cfg.max_concurrency
+        self.provider_limits = dict(provider_limits)
+        self.lanes = {name: _Lane(name, lane) for name, lane in cfg.classes.items()}
+        self.in_flight = 0
+        self._provider_in_flight: dict[str, int] = {}
+        self._queued = 0
+        self._vtime = 0.0
+
+    def lane(self, name: str | None) -> _Lane:
+        """Return the lane for priority class *name*, or the default lane."""
+        lane = self.lanes.get(name) if name is not None else None
+        return lane if lane is not None else self.lanes[self.cfg.default_class]
+
+    def _has_room(self, provider: str) -> bool:
+        if self.max_concurrency is not None and self.in_flight >= self.max_concurrency:
+            return False
+        limit = self.provider_limits.get(provider)
+        return limit is None or self._provider_in_flight.get(provider, 0) < limit
+
+    def _grant(self, provider: str) -> Permit:
+        self.in_flight += 1
+        self._provider_in_flight[provider] = self._provider_in_flight.get(provider, 0) + 1
+        return Permit(self, provider)
+
+    def _admitted(self, lane: _Lane, provider: str, waited: float) -> None:
+        lane.record_wait(waited)
+        if self._metrics is not None:
+            self._metrics.queue_wait.observe((provider, lane.name), waited)
+
+    def _count_queued(self, lane: _Lane, provider: str, delta: int) -> None:
+        self._queued += delta
+        if self._metrics is not None:
+            self._metrics.queue_depth.inc((provider, lane.name), delta)
+
+    def _release(self, provider: str) -> None:
+        self.in_flight -= 1
+        self._provider_in_flight[provider] -= 1
+        self._dispatch()
+
+    async def admit(self, provider: str, priority: str | None) -> Permit:
+        """Wait for a slot for *provider* in lane *priority*; raise :class:`Overloaded` when shed."""
+        lane = self.lane(priority)
+        if not self._queued and self._has_room(provider):
+            self._admitted(lane, provider, 0.0)
+            return self._grant(provider)
+        if self._queued >= self.cfg.max_queue:
+            lane.shed += 1
+            raise Overloaded("Admission queue is full", self.cfg.retry_after)
+
+        waiter = _Waiter(provider, asyncio.get_running_loop().create_future())
+        if not lane.queue:
+            lane.pass_ = max(lane.pass_, self._vtime)
+        lane.queue.append(waiter)
+        self._count_queued(lane, provider, 1)
+        self._dispatch()
+        try:
+            return await asyncio.wait_for(waiter.future, lane.max_wait)
+        except (TimeoutError, asyncio.CancelledError) as exc:
+            if waiter.future.done() and not waiter.future.cancelled():
+                # Granted just as the wait ended: hand the slot back.
+                waiter.future.result().release()
+            else:
+                lane.queue.remove(waiter)
+                self._count_queued(lane, provider, -1)
+            if isinstance(exc, TimeoutError):
+                lane.shed += 1
+                raise Overloaded(f"Queue wait exceeded {lane.max_wait}s", self.cfg.retry_after) from None
+            raise
+
+    def _dispatch(self) -> None:
+        """Hand free slots to waiting requests, lanes taking turns by weight."""
+        while self._queued:
+            best: tuple[_Lane, _Waiter] | None = None
+            for lane in self.lanes.values():
+                if best is not None and lane.pass_ >= best[0].pass_:
+                    continue
+                runnable = next((w for w in lane.queue if self._has_room(w.provider)), None)
+                if runnable is not None:
+                    best = (lane, runnable)
+            if best is None:
+                return
+            lane, waiter = best
+            lane.queue.remove(waiter)
+            self._count_queued(lane, waiter.provider, -1)
+            self._vtime = lane.pass_
+            lane.pass_ += 1.0 / lane.weight
+            self._admitted(lane, waiter.provider, time.monotonic() - waiter.enqueued)
+            waiter.future.set_result(self._grant(waiter.provider))
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "in_flight": self.in_flight,
+            "max_concurrency": self.max_concurrency,
+            "queued": self._queued,
+            "providers": dict(self._provider_in_flight),
+            "classes": {name: lane.stats() for name, lane in self.lanes.items()},
+        }
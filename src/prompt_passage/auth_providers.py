@@ -1,22 +1,24 @@
 from __future__ import annotations
 
+import asyncio
+import logging
+import time
 from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import TYPE_CHECKING
 
-import logging
+if TYPE_CHECKING:
+    from azure.identity import DefaultAzureCredential
+    from azure.core.credentials import AccessToken
 
-from azure.identity import (
-    DefaultAzureCredential,
-    CredentialUnavailableError,
-)
-from azure.core.credentials import AccessToken
-from azure.core.exceptions import ClientAuthenticationError
+logger = logging.getLogger(__name__)
 
 
 class TokenProvider(ABC):
     """Abstract base class for retrieving bearer tokens."""
 
     @abstractmethod
-    def get_token(self) -> str:
+    async def get_token(self) -> str:
         """Return a bearer token string."""
         raise NotImplementedError
 
@@ -27,26 +29,99 @@ class ApiKeyProvider(TokenProvider):
     def __init__(self, key: str):
         self._key = key
 
-    def get_token(self) -> str:  # noqa: D401 - simple return
+    async def get_token(self) -> str:  # noqa: D401 - simple return
         """Return the stored API key."""
         return self._key
 
 
+@dataclass(frozen=True)
+class _CachedToken:
+    token: str
+    expires_on: float
+
+
+class AzureCredential:
+    """A ``DefaultAzureCredential`` with a per-scope token cache.
+
+    Tokens are served from the cache until they come within ``refresh_margin``
+    seconds of ``expires_on``; from then on the cached token is still returned
+    while a single background task fetches a replacement. Only when the cached
+    token is about to expire (``min_validity``) do callers wait on the fetch.
+    Concurrent fetches for the same scope share one in-flight task.
+    """
+
+    def __init__(self, refresh_margin: float = 300.0, min_validity: float = 30.0) -> None:
+        self._credential: DefaultAzureCredential | None = None
+        self._refresh_margin = refresh_margin
+        self._min_validity = min_validity
+        self._tokens: dict[str, _CachedToken] = {}
+        self._pending: dict[str, asyncio.Task[_CachedToken]] = {}
+
+    async def get_token(self, scope: str) -> str:
+        cached = self._tokens.get(scope)
+        now = time.time()
+        if cached is not None and now < cached.expires_on - self._refresh_margin:
+            return cached.token
+        if cached is not None and now < cached.expires_on - self._min_validity:
+            self._refresh(scope)
+            return cached.token
+        entry = await asyncio.shield(self._refresh(scope))
+        return entry.token
+
+    def _refresh(self, scope: str) -> asyncio.Task[_CachedToken]:
+        task = self._pending.get(scope)
+        if task is not None and not task.done() and task.get_loop() is asyncio.get_running_loop():
+            return task
+        task = asyncio.create_task(self._fetch(scope))
+        self._pending[scope] = task
+        task.add_done_callback(lambda t: self._refresh_done(scope, t))
+        return task
+
+    def _refresh_done(self, scope: str, task: asyncio.Task[_CachedToken]) -> None:
+        if self._pending.get(scope) is task:
+            del self._pending[scope]
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning("Azure token refresh for %s failed: %s", scope, task.exception())
+
+    async def _fetch(self, scope: str) -> _CachedToken:
+        # Imported on first use; apikey-only configs never pay for azure-identity.
+        from azure.identity import CredentialUnavailableError, DefaultAzureCredential
+        from azure.core.exceptions import ClientAuthenticationError
+
+        if self._credential is None:
+            self._credential = DefaultAzureCredential()
+        credential = self._credential
+        try:
+            access_token: AccessToken = await asyncio.to_thread(credential.get_token, scope)
+        except (CredentialUnavailableError, ClientAuthenticationError):
+            logger.error("=" * 60)
+            logger.error("Azure credentials required. Please run 'az login'.")
+            logger.error("=" * 60)
+            raise
+
+        entry = _CachedToken(access_token.token, float(access_token.expires_on))
+        self._tokens[scope] = entry
+        return entry
+
+
+_shared_credential: AzureCredential | None = None
+
+
+def shared_azure_credential() -> AzureCredential:
+    """Return the process-wide credential used by every ``azure`` provider."""
+    global _shared_credential
+    if _shared_credential is None:
+        _shared_credential = AzureCredential()
+    return _shared_credential
+
+
 class AzureCliProvider(TokenProvider):
     """Provider that fetches a token from Azure CLI credentials."""
 
     _SCOPE = "https://cognitiveservices.azure.com/.default"
 
-    def __init__(self) -> None:
-        self._credential = DefaultAzureCredential()
-
-    def get_token(self) -> str:
-        try:
-            access_token: AccessToken = self._credential.get_token(self._SCOPE)
-        except (CredentialUnavailableError, ClientAuthenticationError):
-            logging.error("=" * 60)
-            logging.error("Azure credentials required. Please run 'az login'.")
-            logging.error("=" * 60)
-            raise
+    def __init__(self, credential: AzureCredential | None = None) -> None:
+        self._credential = credential if credential is not None else shared_azure_credential()
 
-        return access_token.token
+    async def get_token(self) -> str:
+        return await self._credential.get_token(self._SCOPE)
@@ -0,0 +1,140 @@
+"""Choice of upstream deployment for providers with several of them.
+
+Each request samples two deployments at random in proportion to their
+``weight`` and goes to the one with the lower score ("power of two choices").
+At low load this spreads traffic by weight; under load it steers requests
+away from busy or slow deployments.
+
+``least_outstanding`` scores a deployment by its in-flight requests per unit
+of weight. ``ewma`` multiplies its load by an exponentially weighted moving
+average of its latency: the full response time for regular requests and the
+time to first byte for streams, which are tracked separately.
+"""
+
+from __future__ import annotations
+
+import random
+import time
+from typing import Any, Callable, Literal
+
+from .config import DeploymentCfg
+
+_ALPHA = 0.3  # weight of the newest latency sample in the moving averages
+
+
+class DeploymentState:
+    """Load and latency figures for one deployment."""
+
+    __slots__ = ("deployment", "outstanding", "requests", "failures", "latency", "ttft")
+
+    def __init__(self, deployment: DeploymentCfg):
+        self.deployment = deployment
+        self.outstanding = 0
+        self.requests = 0
+        self.failures = 0
+        self.latency: float | None = None
+        self.ttft: float | None = None
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "name": self.deployment.label,
+            "weight": self.deployment.weight,
+            "outstanding": self.outstanding,
+            "requests": self.requests,
+            "failures": self.failures,
+            "latency_ms": self.latency * 1000 if self.latency is not None else None,
+            "ttft_ms": self.ttft * 1000 if self.ttft is not None else None,
+        }
+
+
+def _ewma(current: float | None, sample: float) -> float:
+    return sample if current is None else current + _ALPHA * (sample - current)
+
+
+class Ticket:
+    """Tracks one request to a deployment from dispatch to completion."""
+
+    __slots__ = ("state", "stream", "started", "_done")
+
+    def __init__(self, state: DeploymentState, stream: bool):
+        self.state = state
+        self.stream = stream
+        self.started = time.perf_counter()
+        self._done = False
+        state.outstanding += 1
+        state.requests += 1
+
+    @property
+    def deployment(self) -> DeploymentCfg:
+        return self.state.deployment
+
+    def first_byte(self) -> None:
+        """Record the time to first byte of a stream."""
+        self.state.ttft = _ewma(self.state.ttft, time.perf_counter() - self.started)
+
+    def abandon(self) -> None:
+        """Release a request cancelled before it finished, such as the losing half of a hedge.
+
+        The time it had been running is recorded as a latency sample, a lower
+        bound that still marks the deployment as slow; it is not a failure.
+        """
+        if self._done:
+            return
+        self._done = True
+        self.state.outstanding -= 1
+        elapsed = time.perf_counter() - self.started
+        if self.stream:
+            self.state.ttft = _ewma(self.state.ttft, elapsed)
+        else:
+            self.state.latency = _ewma(self.state.latency, elapsed)
+
+    def done(self, ok: bool = True) -> None:
+        """Mark the request finished; later calls are ignored."""
+        if self._done:
+            return
+        self._done = True
+        self.state.outstanding -= 1
+        if not ok:
+            self.state.failures += 1
+        elif not self.stream:
+            self.state.latency = _ewma(self.state.latency, time.perf_counter() - self.started)
+
+
+class Balancer:
+    """Picks a deployment per request for one provider."""
+
+    def __init__(self, deployments: list[DeploymentCfg], strategy: Literal["least_outstanding", "ewma"]):
+        self.states = [DeploymentState(d) for d in deployments]
+        self.strategy = strategy
+        self._weights = [d.weight for d in deployments]
+
+    def _score(self, state: DeploymentState, stream: bool) -> float:
+        weight: float = state.deployment.weight
+        if self.strategy == "ewma":
+            latency = state.ttft if stream else state.latency
+            # Unmeasured deployments score zero so each is tried early on.
+            return (state.outstanding + 1) / weight * (latency or 0.0)
+        # Idle deployments tie, leaving the weighted sample to decide.
+        return state.outstanding / weight
+
+    def pick(self, stream: bool, available: Callable[[DeploymentCfg], bool] | None = None) -> Ticket:
+        """Choose a deployment and return a :class:`Ticket` for the request sent to it.
+
+        Deployments for which *available* returns ``False`` are skipped unless
+        none is left.
+        """
+        if len(self.states) == 1:
+            return Ticket(self.states[0], stream)
+        states, weights = self.states, self._weights
+        if available is not None:
+            usable = [i for i, state in enumerate(states) if available(state.deployment)]
+            if usable and len(usable) < len(states):
+                states = [states[i] for i in usable]
+                weights = [weights[i] for i in usable]
+        first, second = random.choices(states, weights, k=2)
+        if self._score(second, stream) < self._score(first, stream):
+            first = second
+        return Ticket(first, stream)
+
+    def stats(self) -> list[dict[str, Any]]:
+        return [state.stats() for state in self.states]
@@ -0,0 +1,321 @@
+"""Offline batch runs of JSONL request files.
+
+``prompt-passage batch requests.jsonl --provider NAME --output results.jsonl``
+sends every request in the input file through the proxy app in-process, so a
+batch uses the provider's transform, deployments, retries, rate limits and
+circuit breakers exactly as served traffic does.
+
+Each input line is either a request body or an OpenAI batch-style envelope
+``{"custom_id": ..., "url": "/v1/chat/completions", "body": {...}}``. Lines
+without a ``custom_id`` are named after their line number. Requests are sent
+without streaming.
+
+Results are appended to the output file as they complete, one line per request
+in the same envelope format as OpenAI batch output. Running the same command
+again after a crash skips every request that already has a result (and, with
+``--retry-failed``, re-sends those that failed). Rejections that ask the
+client to back off (429 and 503 with ``Retry-After``) pause every request in
+the batch for that long before the request is tried again.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import IO, Any, Iterable
+
+import httpx
+from fastapi import FastAPI
+
+from .body import extract_usage
+from .config import RetryCfg, default_config_path, load_config
+from .retry import backoff, retry_after
+
+logger = logging.getLogger(__name__)
+
+_RETRY_STATUS = frozenset({429, 500, 502, 503, 504})
+_BACKOFF = RetryCfg(backoff_base=1.0, backoff_max=30.0)
+
+
+@dataclass(frozen=True)
+class BatchRequest:
+    """One line of the input file."""
+
+    custom_id: str
+    route: str  # "chat/completions" or "responses"
+    body: bytes
+
+
+def _route(url: str | None, body: dict[str, Any], default: str | None) -> str:
+    trimmed = (url or "").rstrip("/")
+    if trimmed.endswith("chat/completions"):
+        return "chat/completions"
+    if trimmed.endswith("responses"):
+        return "responses"
+    if default is not None:
+        return default
+    return "responses" if "input" in body and "messages" not in body else "chat/completions"
+
+
+def load_requests(path: str | Path, endpoint: str | None = None) -> list[BatchRequest]:
+    """Read and validate the input file; raises ``ValueError`` naming the offending line.
+
+    *endpoint* is the route of lines that do not name one in their ``url``;
+    by default it is guessed from the body.
+    """
+    requests: list[BatchRequest] = []
+    seen: set[str] = set()
+    with open(path, encoding="utf-8") as f:
+        for number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            try:
+                entry = json.loads(line)
+            except ValueError as exc:
+                raise ValueError(f"Line {number} is not valid JSON: {exc}") from None
+            if not isinstance(entry, dict):
+                raise ValueError(f"Line {number} is not a JSON object")
+            envelope = isinstance(entry.get("body"), dict)
+            body: dict[str, Any] = entry["body"] if envelope else entry
+            custom_id = str(entry.get("custom_id") or f"line-{number}") if envelope else f"line-{number}"
+            if custom_id in seen:
+                raise ValueError(f"Line {number} repeats custom_id {custom_id!r}")
+            seen.add(custom_id)
+            body = {k: v for k, v in body.items() if k not in ("stream", "stream_options")}
+            route = _route(entry.get("url") if envelope else None, body, endpoint)
+            requests.append(BatchRequest(custom_id, route, json.dumps(body).encode("utf-8")))
+    return requests
+
+
+def _succeeded(record: dict[str, Any]) -> bool:
+    response = record.get("response") or {}
+    return record.get("error") is None and int(response.get("status_code", 0)) < 400
+
+
+def completed_ids(path: str | Path, include_failed: bool = True) -> set[str]:
+    """Return the ids that already have a result in the output file at *path*.
+
+    A last line cut short by a crash is removed. Failed requests are only
+    included when *include_failed* is set; the latest result of an id counts.
+    """
+    try:
+        f = open(path, "r+b")
+    except FileNotFoundError:
+        return set()
+    results: dict[str, bool] = {}
+    with f:
+        data = f.read()
+        if data and not data.endswith(b"\n"):
+            f.truncate(data.rfind(b"\n") + 1)
+            data = data[: data.rfind(b"\n") + 1]
+        for line in data.splitlines():
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if isinstance(record, dict) and "custom_id" in record:
+                results[str(record["custom_id"])] = _succeeded(record)
+    return {custom_id for custom_id, ok in results.items() if ok or include_failed}
+
+
+@dataclass
+class BatchReport:
+    """Totals of one batch run."""
+
+    total: int = 0
+    skipped: int = 0
+    succeeded: int = 0
+    failed: int = 0
+    retries: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    seconds: float = 0.0
+
+    @property
+    def sent(self) -> int:
+        return self.succeeded + self.failed
+
+    def add_usage(self, usage: dict[str, Any] | None) -> None:
+        if not usage:
+            return
+        prompt = usage.get("prompt_tokens", usage.get("input_tokens"))
+        completion = usage.get("completion_tokens", usage.get("output_tokens"))
+        self.prompt_tokens += prompt if isinstance(prompt, int) else 0
+        self.completion_tokens += completion if isinstance(completion, int) else 0
+
+    def lines(self) -> list[str]:
+        seconds = max(self.seconds, 1e-9)
+        tokens = self.prompt_tokens + self.completion_tokens
+        return [
+            f"  {'requests':<18} {self.total:>10} ({self.skipped} already done)",
+            f"  {'succeeded':<18} {self.succeeded:>10}",
+            f"  {'failed':<18} {self.failed:>10}",
+            f"  {'retries':<18} {self.retries:>10}",
+            f"  {'elapsed':<18} {self.seconds:>10.1f} s",
+            f"  {'throughput':<18} {self.sent / seconds:>10.2f} requests/s",
+            f"  {'prompt tokens':<18} {self.prompt_tokens:>10}",
+            f"  {'completion tokens':<18} {self.completion_tokens:>10}",
+            f"  {'token throughput':<18} {tokens / seconds:>10.1f} tokens/s",
+        ]
+
+
+class BatchRunner:
+    """Sends batch requests for *provider* through *app* and appends results to *output*."""
+
+    def __init__(
+        self,
+        app: FastAPI,
+        provider: str,
+        output: IO[str],
+        concurrency: int = 16,
+        max_attempts: int = 5,
+        auth_key: str | None = None,
+    ):
+        self.app = app
+        self.provider = provider
+        self.output = output
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self.headers = {"Content-Type": "application/json"}
+        if auth_key:
+            self.headers["Authorization"] = f"Bearer {auth_key}"
+        self.report = BatchReport()
+        self._resume_at = 0.0
+
+    async def run(self, requests: Iterable[BatchRequest], skip: set[str] | frozenset[str] = frozenset()) -> BatchReport:
+        """Send every request not in *skip*; the app's lifespan must be running."""
+        queue: asyncio.Queue[BatchRequest] = asyncio.Queue()
+        for request in requests:
+            self.report.total += 1
+            if request.custom_id in skip:
+                self.report.skipped += 1
+            else:
+                queue.put_nowait(request)
+
+        started = time.perf_counter()
+        transport = httpx.ASGITransport(app=self.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://batch", timeout=None) as client:
+
+            async def _worker() -> None:
+                while not queue.empty():
+                    await self._send(client, queue.get_nowait())
+
+            await asyncio.gather(*(_worker() for _ in range(self.concurrency)))
+        self.report.seconds = time.perf_counter() - started
+        return self.report
+
+    async def _send(self, client: httpx.AsyncClient, request: BatchRequest) -> None:
+        url = f"/provider/{self.provider}/{request.route}"
+        started = time.perf_counter()
+        attempt = 0
+        while True:
+            attempt += 1
+            pause = self._resume_at - time.monotonic()
+            if pause > 0:
+                await asyncio.sleep(pause)
+            try:
+                resp = await client.post(url, content=request.body, headers=self.headers)
+            except Exception as exc:
+                logger.warning("Request %s failed: %s", request.custom_id, exc)
+                self._write(request, None, {"message": str(exc)}, attempt, started)
+                return
+            if resp.status_code not in _RETRY_STATUS or attempt >= self.max_attempts:
+                break
+            self.report.retries += 1
+            delay = retry_after(resp.headers)
+            if delay is not None:
+                # The proxy or upstream asked the client to back off: hold the whole batch.
+                self._resume_at = max(self._resume_at, time.monotonic() + delay)
+                logger.warning("Status %s; pausing the batch for %.1f s", resp.status_code, delay)
+            else:
+                await asyncio.sleep(backoff(_BACKOFF, attempt - 1))
+        self._write(request, resp, None, attempt, started)
+
+    def _write(
+        self,
+        request: BatchRequest,
+        resp: httpx.Response | None,
+        error: dict[str, Any] | None,
+        attempts: int,
+        started: float,
+    ) -> None:
+        response = None
+        if resp is not None:
+            content = resp.content
+            try:
+                body: Any = json.loads(content)
+            except ValueError:
+                body = content.decode("utf-8", "replace")
+            response = {"status_code": resp.status_code, "body": body}
+            if resp.status_code >= 400:
+                error = {"message": f"Status {resp.status_code}"}
+            else:
+                self.report.add_usage(extract_usage(content))
+        record = {
+            "custom_id": request.custom_id,
+            "response": response,
+            "error": error,
+            "attempts": attempts,
+            "latency_ms": round((time.perf_counter() - started) * 1000, 1),
+        }
+        if error is None:
+            self.report.succeeded += 1
+        else:
+            self.report.failed += 1
+        self.output.write(json.dumps(record) + "\n")
+        self.output.flush()
+
+
+def main(argv: list[str] | None = None) -> int:
+    """Entry point of ``prompt-passage batch``; returns the exit status."""
+    parser = argparse.ArgumentParser(prog="prompt-passage batch", description="Run a JSONL file of requests.")
+    parser.add_argument("input", help="JSONL file of chat completions or responses requests")
+    parser.add_argument("-o", "--output", required=True, help="JSONL file results are appended to")
+    parser.add_argument("--provider", required=True)
+    parser.add_argument("--config", default="")
+    parser.add_argument("--concurrency", type=int, default=16, help="requests in flight at once")
+    parser.add_argument("--max-attempts", type=int, default=5, help="tries per request on 429 and 5xx")
+    parser.add_argument("--endpoint", choices=["chat/completions", "responses"], help="route of bare request bodies")
+    parser.add_argument("--retry-failed", action="store_true", help="re-send requests whose last result failed")
+    parser.add_argument("--verbose", action="store_true", help="log every request as the server does")
+    args = parser.parse_args(argv)
+
+    config_path = args.config or default_config_path()
+    if not os.path.exists(config_path):
+        logging.error(f"Configuration file '{config_path}' does not exist.")
+        return 1
+    cfg = load_config(config_path)
+    if args.provider not in cfg.providers:
+        logging.error(f"Provider '{args.provider}' is not in {config_path}.")
+        return 1
+    try:
+        requests = load_requests(args.input, args.endpoint)
+    except (OSError, ValueError) as exc:
+        logging.error(f"Cannot read {args.input}: {exc}")
+        return 1
+    skip = completed_ids(args.output, include_failed=not args.retry_failed)
+
+    from .proxy_app import create_app
+
+    if not args.verbose:
+        logging.getLogger().setLevel(logging.WARNING)
+    app = create_app(cfg, config_path)
+    auth_key = cfg.service.auth.key if cfg.service and cfg.service.auth else None
+
+    async def _run() -> BatchReport:
+        with open(args.output, "a", encoding="utf-8") as output:
+            runner = BatchRunner(app, args.provider, output, args.concurrency, args.max_attempts, auth_key)
+            async with app.router.lifespan_context(app):
+                return await runner.run(requests, skip)
+
+    report = asyncio.run(_run())
+    print(f"Batch results written to {args.output}")
+    for line in report.lines():
+        print(line)
+    return 1 if report.failed else 0
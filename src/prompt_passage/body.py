@@ -0,0 +1,190 @@
+"""Request and response body handling for the forwarding path.
+
+Most requests only need their top-level ``model`` replaced, and many already
+carry the configured model. :func:`prepare_request_body` forwards the original
+bytes whenever nothing changes, splices the new ``model`` value into the raw
+bytes when that is the only change, and falls back to a full re-encode only
+when a ``transform`` is configured. On the way back, :func:`extract_usage`
+reads the ``usage`` object from the tail of a response instead of parsing the
+whole completion. ``orjson`` is used for parsing and encoding when it is
+installed.
+"""
+
+from __future__ import annotations
+
+import json
+import re
+from dataclasses import dataclass
+from typing import Any, Callable
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional speedup
+    orjson = None  # type: ignore[assignment]
+
+
+def loads(data: bytes) -> Any:
+    """Parse JSON *data*, raising ``ValueError`` when it is not valid JSON."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def dumps(obj: Any) -> bytes:
+    """Encode *obj* as compact UTF-8 JSON."""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+def canonical_dumps(obj: Any) -> bytes:
+    """Encode *obj* with sorted keys, so equal objects give equal bytes."""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_SORT_KEYS)
+    return json.dumps(obj, sort_keys=True, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+_MODEL_TOKEN = b'"model"'
+_KEY_SEPARATOR = re.compile(rb"\s*:\s*")
+
+
+@dataclass(frozen=True)
+class PreparedBody:
+    """Outgoing request body plus the fields the proxy needs from it.
+
+    ``parsed`` is the (possibly transformed) JSON object, or ``None`` when the
+    body is empty or not a JSON object. ``rewritten`` tells whether ``content``
+    differs from the bytes the client sent.
+
+    A body prepared in another process (see :func:`detach`) carries only the
+    top-level scalar fields in ``parsed``, and its :func:`canonical_dumps`
+    encoding in ``canonical`` when one was asked for.
+    """
+
+    content: bytes
+    stream: bool
+    parsed: dict[str, Any] | None
+    rewritten: bool
+    canonical: bytes | None = None
+
+
+def _splice_model(body: bytes, old: str, new: str) -> bytes | None:
+    """Replace the value of the top-level ``model`` key without re-encoding.
+
+    Only attempted when the body contains a single ``"model":`` key (which must
+    then be the top-level one) whose raw value matches a standard encoding of
+    *old*; otherwise ``None`` is returned and the caller re-encodes.
+    """
+    # bytes.find is far faster than a regex scan over multi-megabyte bodies.
+    # Quotes inside JSON strings are always escaped, so an unescaped
+    # '"model"' followed by ':' is an object key.
+    start = -1
+    pos = body.find(_MODEL_TOKEN)
+    while pos != -1:
+        sep = _KEY_SEPARATOR.match(body, pos + len(_MODEL_TOKEN))
+        if sep is not None and (pos == 0 or body[pos - 1] != 0x5C):  # 0x5C == backslash
+            if start != -1:
+                return None
+            start = sep.end()
+        pos = body.find(_MODEL_TOKEN, pos + 1)
+    if start == -1:
+        return None
+    for encoded in (json.dumps(old).encode("utf-8"), json.dumps(old, ensure_ascii=False).encode("utf-8")):
+        if body.startswith(encoded, start):
+            return body[:start] + json.dumps(new).encode("utf-8") + body[start + len(encoded) :]
+    return None
+
+
+def prepare_request_body(
+    body: bytes,
+    model: str,
+    transform: Callable[[dict[str, Any]], dict[str, Any]] | None = None,
+) -> PreparedBody:
+    """Return *body* with ``model`` forced to *model* and *transform* applied.
+
+    Non-JSON bodies and JSON values other than objects are forwarded untouched.
+    """
+    if not body:
+        return PreparedBody(body, False, None, False)
+    try:
+        parsed = loads(body)
+    except ValueError:
+        return PreparedBody(body, False, None, False)
+    if not isinstance(parsed, dict):
+        return PreparedBody(body, False, None, False)
+
+    stream = bool(parsed.get("stream", False))
+    current = parsed.get("model", model)
+    if "model" in parsed:
+        parsed["model"] = model
+
+    if transform is not None:
+        parsed = transform(parsed)
+        return PreparedBody(dumps(parsed), stream, parsed, True)
+
+    if current == model:
+        return PreparedBody(body, stream, parsed, False)
+
+    spliced = _splice_model(body, current, model) if isinstance(current, str) else None
+    if spliced is not None:
+        return PreparedBody(spliced, stream, parsed, True)
+    return PreparedBody(dumps(parsed), stream, parsed, True)
+
+
+def detach(prepared: PreparedBody, canonical: bool) -> PreparedBody:
+    """Return *prepared* slimmed down to send back from a worker process.
+
+    Copying the parsed object between processes costs about as much as
+    parsing it again, and the proxy only reads top-level scalars such as
+    ``temperature`` and ``max_tokens`` from it. The nested values are dropped;
+    with *canonical* set, the canonical encoding the cache key is built from
+    is kept instead.
+    """
+    parsed = prepared.parsed
+    if parsed is None:
+        return prepared
+    scalars = {k: v for k, v in parsed.items() if v is None or isinstance(v, (str, int, float, bool))}
+    return PreparedBody(
+        prepared.content,
+        prepared.stream,
+        scalars,
+        prepared.rewritten,
+        canonical_dumps(parsed) if canonical else None,
+    )
+
+
+_USAGE_TOKEN = b'"usage"'
+# OpenAI-style APIs emit ``usage`` at (or very near) the end of the payload.
+_USAGE_TAIL_BYTES = 8192
+# Bodies up to this size are parsed in full when the tail scan finds nothing.
+_USAGE_FULL_PARSE_LIMIT = 64 * 1024
+_decoder = json.JSONDecoder()
+
+
+def extract_usage(content: bytes) -> dict[str, Any] | None:
+    """Return the top-level ``usage`` object of a JSON response body.
+
+    Only the last few KB are scanned for a ``"usage":`` key, so large
+    completions are never parsed in full. Small bodies without a usage key in
+    their tail fall back to a single full parse.
+    """
+    tail_start = max(0, len(content) - _USAGE_TAIL_BYTES)
+    pos = content.rfind(_USAGE_TOKEN, tail_start)
+    while pos != -1:
+        sep = _KEY_SEPARATOR.match(content, pos + len(_USAGE_TOKEN))
+        if sep is not None and (pos == 0 or content[pos - 1] != 0x5C) and content[sep.end() : sep.end() + 1] == b"{":
+            try:
+                usage, _ = _decoder.raw_decode(content[sep.end() :].decode("utf-8"))
+            except ValueError:
+                break
+            return usage if isinstance(usage, dict) else None
+        pos = content.rfind(_USAGE_TOKEN, tail_start, pos)
+
+    if len(content) > _USAGE_FULL_PARSE_LIMIT:
+        return None
+    try:
+        parsed = loads(content)
+    except ValueError:
+        return None
+    usage = parsed.get("usage") if isinstance(parsed, dict) else None
+    return usage if isinstance(usage, dict) else None
@@ -0,0 +1,181 @@
+"""Circuit breakers for upstream hosts.
+
+A breaker watches the outcome of the last ``window`` calls to a host. When the
+share of failed calls (transport errors and 5xx responses) or of calls slower
+than ``slow_call_seconds`` crosses its threshold, the circuit opens and calls
+fail immediately with :class:`CircuitOpenError` instead of waiting on a sick
+upstream.
+
+An open circuit recovers in one of two ways. Without a probe it turns
+half-open after ``open_seconds`` and lets ``half_open_calls`` requests through
+as a trial. With a probe configured, :class:`Prober` checks the host in the
+background and closes the circuit once it answers, so no user request is used
+as a trial.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, Callable
+
+import httpx
+
+from .config import CircuitBreakerCfg
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(httpx.RequestError):
+    """Raised instead of calling an upstream whose circuit is open."""
+
+    def __init__(self, origin: str, retry_after: float):
+        super().__init__(f"Circuit open for {origin}")
+        self.origin = origin
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """Closed / open / half-open state machine for one upstream host."""
+
+    def __init__(self, origin: str, cfg: CircuitBreakerCfg):
+        self.origin = origin
+        self.cfg = cfg
+        self._state = CLOSED
+        self._calls: deque[tuple[bool, bool]] = deque(maxlen=cfg.window)  # (failed, slow)
+        self._opened_at = 0.0
+        self._trials = 0
+        self._trial_successes = 0
+        self.opened = 0
+        self.rejected = 0
+
+    @property
+    def state(self) -> str:
+        if (
+            self._state == OPEN
+            and self.cfg.probe is None
+            and time.monotonic() - self._opened_at >= self.cfg.open_seconds
+        ):
+            self._state = HALF_OPEN
+            self._trials = 0
+            self._trial_successes = 0
+        return self._state
+
+    def before_call(self) -> None:
+        """Raise :class:`CircuitOpenError` unless a call may go to the upstream now."""
+        state = self.state
+        if state == CLOSED:
+            return
+        if state == HALF_OPEN and self._trials < self.cfg.half_open_calls:
+            self._trials += 1
+            return
+        self.rejected += 1
+        if self.cfg.probe is not None:
+            retry_after = self.cfg.probe.interval
+        else:
+            retry_after = max(0.0, self._opened_at + self.cfg.open_seconds - time.monotonic())
+        raise CircuitOpenError(self.origin, retry_after)
+
+    def record(self, ok: bool, seconds: float) -> None:
+        """Record the outcome of a call that :meth:`before_call` let through."""
+        state = self._state
+        if state == HALF_OPEN:
+            if not ok:
+                self._open()
+                return
+            self._trial_successes += 1
+            if self._trial_successes >= self.cfg.half_open_calls:
+                self._close()
+            return
+        if state == OPEN:
+            return
+        slow = self.cfg.slow_call_seconds is not None and seconds >= self.cfg.slow_call_seconds
+        self._calls.append((not ok, slow))
+        if len(self._calls) < self.cfg.min_calls:
+            return
+        failures = sum(1 for failed, _ in self._calls if failed)
+        slow_calls = sum(1 for _, s in self._calls if s)
+        if (
+            failures / len(self._calls) >= self.cfg.failure_rate
+            or slow_calls / len(self._calls) >= self.cfg.slow_call_rate
+        ):
+            self._open()
+
+    def abandon(self) -> None:
+        """Give back the slot of a call :meth:`before_call` let through that never finished.
+
+        A cancelled half-open trial has no outcome to record; without this its
+        slot would stay taken and the circuit would never leave half-open.
+        """
+        if self._state == HALF_OPEN and self._trials > 0:
+            self._trials -= 1
+
+    def probe_result(self, ok: bool) -> None:
+        """Apply the result of an active health probe."""
+        if self._state == CLOSED:
+            return
+        if ok:
+            self._close()
+        else:
+            self._opened_at = time.monotonic()
+
+    def _open(self) -> None:
+        logger.warning("Circuit for %s opened", self.origin)
+        self._state = OPEN
+        self._opened_at = time.monotonic()
+        self.opened += 1
+
+    def _close(self) -> None:
+        logger.info("Circuit for %s closed", self.origin)
+        self._state = CLOSED
+        self._calls.clear()
+
+    def stats(self) -> dict[str, Any]:
+        failures = sum(1 for failed, _ in self._calls if failed)
+        return {
+            "state": self.state,
+            "calls": len(self._calls),
+            "failure_rate": failures / len(self._calls) if self._calls else 0.0,
+            "opened": self.opened,
+            "rejected": self.rejected,
+        }
+
+
+class Prober:
+    """Background task that probes hosts whose circuit is not closed."""
+
+    def __init__(self, breaker: CircuitBreaker, url: str, client: Callable[[], httpx.AsyncClient]):
+        assert breaker.cfg.probe is not None
+        self.breaker = breaker
+        self.url = url
+        self.probe = breaker.cfg.probe
+        self._client = client
+        self._task: asyncio.Task[None] | None = None
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+
+    async def check(self) -> bool:
+        """Send one probe; any response below 500 means the host is serving."""
+        try:
+            resp = await self._client().get(self.url, timeout=self.probe.timeout)
+        except httpx.HTTPError:
+            return False
+        return resp.status_code < 500
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.probe.interval)
+            if self.breaker.state != CLOSED:
+                self.breaker.probe_result(await self.check())
@@ -0,0 +1,337 @@
+"""Response cache for deterministic completions.
+
+Responses are keyed on provider, upstream endpoint and a canonical hash of the
+outgoing request body (after the model override and ``transform``), so two
+clients sending the same prompt with differently ordered keys share an entry.
+Only requests that pin their output (``temperature: 0`` or a ``seed``) are
+cached unless a provider opts out of that check.
+
+Two tiers are available: :class:`MemoryResponseCache`, an in-process LRU, and
+:class:`DiskResponseCache`, a zlib-compressed SQLite store in WAL mode that
+survives restarts and is shared by every worker pointed at the same file.
+:class:`ResponseCache` puts them together for the proxy.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any
+
+from .body import canonical_dumps
+
+
+@dataclass(frozen=True)
+class CachedResponse:
+    """A complete upstream response as it was relayed to the client."""
+
+    status_code: int
+    headers: tuple[tuple[bytes, bytes], ...]
+    body: bytes
+    stream: bool
+
+    @property
+    def size(self) -> int:
+        return len(self.body) + sum(len(k) + len(v) for k, v in self.headers)
+
+
+def is_deterministic(body: dict[str, Any]) -> bool:
+    """Return ``True`` when *body* asks for a reproducible completion."""
+    return body.get("temperature") == 0 or body.get("seed") is not None
+
+
+def cache_key(provider: str, endpoint: str, body: dict[str, Any] | bytes) -> str:
+    """Return the cache key for *body* sent to *endpoint* of *provider*.
+
+    *body* is the parsed request, or its :func:`canonical_dumps` encoding.
+    """
+    digest = hashlib.sha256()
+    digest.update(provider.encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(endpoint.encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(body if isinstance(body, bytes) else canonical_dumps(body))
+    return digest.hexdigest()
+
+
+class MemoryResponseCache:
+    """In-process LRU cache bounded by the total size of its entries."""
+
+    def __init__(self, max_bytes: int, max_entry_bytes: int):
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self._entries: OrderedDict[str, tuple[float, CachedResponse]] = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: str) -> CachedResponse | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, response = entry
+        if expires_at <= time.monotonic():
+            self._remove(key)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return response
+
+    def put(self, key: str, response: CachedResponse, ttl: float) -> None:
+        size = response.size
+        if size > self.max_entry_bytes or size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (time.monotonic() + ttl, response)
+        self._bytes += size
+        while self._bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def _remove(self, key: str) -> None:
+        _, response = self._entries.pop(key)
+        self._bytes -= response.size
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+        }
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    expires_at REAL NOT NULL,
+    last_access REAL NOT NULL,
+    size INTEGER NOT NULL,
+    status INTEGER NOT NULL,
+    stream INTEGER NOT NULL,
+    headers BLOB NOT NULL,
+    body BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access);
+CREATE INDEX IF NOT EXISTS responses_expires_at ON responses (expires_at);
+CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER NOT NULL);
+INSERT OR IGNORE INTO meta SELECT 'bytes', COALESCE(SUM(size), 0) FROM responses;
+"""
+
+# Eviction frees space down to this fraction of ``max_bytes``, so the puts
+# that follow do not each have to evict again.
+_EVICT_TO = 0.9
+_EVICT_BATCH = 64
+# Access times of hits are written in batches rather than one write per hit.
+_TOUCH_BATCH = 64
+_TOUCH_INTERVAL = 1.0
+
+
+def _encode_headers(headers: tuple[tuple[bytes, bytes], ...]) -> bytes:
+    return b"\n".join(k + b":" + v for k, v in headers)
+
+
+def _decode_headers(data: bytes) -> tuple[tuple[bytes, bytes], ...]:
+    if not data:
+        return ()
+    return tuple((k, v) for k, _, v in (line.partition(b":") for line in data.split(b"\n")))
+
+
+class DiskResponseCache:
+    """SQLite-backed cache shared across processes and restarts.
+
+    Bodies are stored zlib-compressed and ``max_bytes`` bounds the compressed
+    size; the least recently used entries are evicted first. SQLite's WAL mode
+    lets many readers proceed while one process writes, and ``busy_timeout``
+    makes concurrent writers from other workers wait instead of failing. All
+    methods block and are meant to be called from a worker thread.
+
+    The total size is kept in the ``meta`` table and updated in the same
+    transaction as the entries, so a put never has to sum the table. Hits
+    only read; their access times are written in batches, at the latest
+    ``_TOUCH_INTERVAL`` seconds later or before the next put.
+    """
+
+    def __init__(self, path: Path, max_bytes: int, max_entry_bytes: int):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30.0, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._touched: dict[str, float] = {}
+        self._touched_since = 0.0
+
+    def close(self) -> None:
+        with self._lock:
+            self._flush_touched()
+            self._conn.close()
+
+    def get(self, key: str) -> tuple[float, CachedResponse] | None:
+        """Return ``(expires_at, response)`` for *key*; ``expires_at`` is wall-clock time."""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT expires_at, status, stream, headers, body FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or row[0] <= now:
+                self.misses += 1
+                return None
+            if not self._touched:
+                self._touched_since = now
+            self._touched[key] = now
+            if len(self._touched) >= _TOUCH_BATCH or now - self._touched_since >= _TOUCH_INTERVAL:
+                self._flush_touched()
+            self.hits += 1
+        expires_at, status_code, stream, headers, body = row
+        response = CachedResponse(status_code, _decode_headers(headers), zlib.decompress(body), bool(stream))
+        return expires_at, response
+
+    def put(self, key: str, response: CachedResponse, ttl: float) -> None:
+        if response.size > self.max_entry_bytes:
+            return
+        headers = _encode_headers(response.headers)
+        body = zlib.compress(response.body)
+        size = len(headers) + len(body)
+        if size > self.max_bytes:
+            return
+        now = time.time()
+        with self._lock:
+            # Written first so eviction sees the latest access times.
+            self._flush_touched()
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (key, now + ttl, now, size, response.status_code, int(response.stream), headers, body),
+                )
+                self._add_bytes(size - (row[0] if row is not None else 0))
+                self._evict(now)
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _add_bytes(self, delta: int) -> int:
+        self._conn.execute("UPDATE meta SET value = value + ? WHERE name = 'bytes'", (delta,))
+        (total,) = self._conn.execute("SELECT value FROM meta WHERE name = 'bytes'").fetchone()
+        return int(total)
+
+    def _evict(self, now: float) -> None:
+        (expired,) = self._conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM responses WHERE expires_at <= ?", (now,)
+        ).fetchone()
+        if expired:
+            self._conn.execute("DELETE FROM responses WHERE expires_at <= ?", (now,))
+        total = self._add_bytes(-expired)
+        if total <= self.max_bytes:
+            return
+        target = self.max_bytes * _EVICT_TO
+        while total > target:
+            oldest = self._conn.execute(
+                "SELECT key, size FROM responses ORDER BY last_access LIMIT ?", (_EVICT_BATCH,)
+            ).fetchall()
+            if not oldest:
+                break
+            victims, freed = [], 0
+            for key, size in oldest:
+                if total - freed <= target:
+                    break
+                victims.append((key,))
+                freed += size
+            self._conn.executemany("DELETE FROM responses WHERE key = ?", victims)
+            total = self._add_bytes(-freed)
+            self.evictions += len(victims)
+
+    def _flush_touched(self) -> None:
+        if not self._touched:
+            return
+        touched = [(at, key) for key, at in self._touched.items()]
+        self._touched.clear()
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            self._conn.executemany("UPDATE responses SET last_access = ? WHERE key = ?", touched)
+            self._conn.execute("COMMIT")
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            (entries,) = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()
+            (size,) = self._conn.execute("SELECT value FROM meta WHERE name = 'bytes'").fetchone()
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": entries,
+            "bytes": size,
+            "max_bytes": self.max_bytes,
+            "path": str(self.path),
+        }
+
+
+class ResponseCache:
+    """The cache used by the proxy: an optional memory tier over an optional disk tier.
+
+    Disk hits are promoted into memory. Disk access runs in a worker thread so
+    the event loop never waits on SQLite.
+    """
+
+    def __init__(self, memory: MemoryResponseCache | None, disk: DiskResponseCache | None):
+        self.memory = memory
+        self.disk = disk
+        tiers = [t.max_entry_bytes for t in (memory, disk) if t is not None]
+        self.max_entry_bytes = max(tiers, default=0)
+
+    async def get(self, key: str) -> CachedResponse | None:
+        if self.memory is not None:
+            response = self.memory.get(key)
+            if response is not None:
+                return response
+        if self.disk is None:
+            return None
+        found = await asyncio.to_thread(self.disk.get, key)
+        if found is None:
+            return None
+        expires_at, response = found
+        if self.memory is not None:
+            self.memory.put(key, response, expires_at - time.time())
+        return response
+
+    async def put(self, key: str, response: CachedResponse, ttl: float) -> None:
+        if self.memory is not None:
+            self.memory.put(key, response, ttl)
+        if self.disk is not None:
+            await asyncio.to_thread(self.disk.put, key, response, ttl)
+
+    def close(self) -> None:
+        if self.disk is not None:
+            self.disk.close()
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "memory": self.memory.stats() if self.memory is not None else None,
+            "disk": self.disk.stats() if self.disk is not None else None,
+        }
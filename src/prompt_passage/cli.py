@@ -1,19 +1,48 @@
 import argparse
+import asyncio
 import logging
 import os
+import sys
+import time
 from typing import Any
 import uvicorn
 
-from .proxy_app import app
 from .config import load_config, default_config_path, ServiceCfg
 
 
+def _profile_startup(timings: list[tuple[str, float]], app: Any) -> None:
+    """Run the app's startup hooks once and print how long each phase took."""
+
+    async def _startup() -> None:
+        async with app.router.lifespan_context(app):
+            pass
+
+    started = time.perf_counter()
+    asyncio.run(_startup())
+    timings.append(("app startup", time.perf_counter() - started))
+
+    print("Startup profile:")
+    for phase, seconds in timings:
+        print(f"  {phase:<14} {seconds * 1000:9.1f} ms")
+    print(f"  {'total':<14} {sum(s for _, s in timings) * 1000:9.1f} ms")
+
+
 def main() -> None:
+    if sys.argv[1:2] == ["batch"]:
+        from .batch import main as batch_main
+
+        exit(batch_main(sys.argv[2:]))
+
     parser = argparse.ArgumentParser()
     parser.add_argument("--config", default="")
     parser.add_argument("--host", default="0.0.0.0")
     parser.add_argument("--port", type=int, default=8095)
     parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument(
+        "--profile-startup",
+        action="store_true",
+        help="Report the time spent in each startup phase and exit without serving.",
+    )
     args = parser.parse_args()
 
     config_path = default_config_path()
@@ -27,7 +56,25 @@ def main() -> None:
     else:
         logging.info(f"Using configuration file: {config_path}")
 
+    timings: list[tuple[str, float]] = []
+    started = time.perf_counter()
     cfg = load_config(config_path)
+    timings.append(("load config", time.perf_counter() - started))
+
+    # Imported here so that config errors surface before the web stack is loaded.
+    started = time.perf_counter()
+    from .proxy_app import create_app
+
+    timings.append(("import app", time.perf_counter() - started))
+
+    started = time.perf_counter()
+    app = create_app(cfg, config_path)
+    timings.append(("build app", time.perf_counter() - started))
+
+    if args.profile_startup:
+        _profile_startup(timings, app)
+        return
+
     port = cfg.service.port if cfg and cfg.service else ServiceCfg().port
     if args.port:
         # Override port from command line argument if provided
@@ -49,6 +96,13 @@ def main() -> None:
     if ca_certs:
         uvicorn_kwargs["ssl_ca_certs"] = ca_certs
 
+    if args.workers > 1:
+        # Workers import the app by name and load the (already validated) file themselves.
+        from .supervisor import run_workers
+
+        os.environ["PROMPT_PASSAGE_CONFIG_PATH"] = os.path.abspath(config_path)
+        exit(run_workers(args.workers, uvicorn_kwargs))
+
     uvicorn.run(app, **uvicorn_kwargs)
 
 
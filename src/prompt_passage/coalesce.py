@@ -0,0 +1,82 @@
+"""Single-flight coalescing of identical in-flight requests.
+
+When several byte-identical non-streaming requests for the same provider and
+endpoint arrive while one of them is still waiting on the upstream, the later
+ones wait for that call instead of making their own, and every caller gets the
+same response.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+from typing import Awaitable, Callable, Generic, TypeVar
+
+T = TypeVar("T")
+
+
+def coalesce_key(provider: str, endpoint: str, body: bytes) -> str:
+    """Return the key under which requests with identical *body* are merged."""
+    digest = hashlib.sha256()
+    for part in (provider.encode("utf-8"), endpoint.encode("utf-8"), body):
+        digest.update(part)
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class _Flight(Generic[T]):
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: asyncio.Task[T]):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight(Generic[T]):
+    """Run at most one call per key at a time and share its result.
+
+    The shared call runs in its own task, so a caller that disconnects does not
+    cancel it for the others. Once ``max_waiters`` callers are attached to a
+    call, further callers run their own.
+    """
+
+    def __init__(self) -> None:
+        self._flights: dict[str, _Flight[T]] = {}
+        self.leaders = 0
+        self.coalesced = 0
+        self.overflow = 0
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[T]], max_waiters: int) -> T:
+        flight = self._flights.get(key)
+        if flight is not None:
+            if flight.waiters < max_waiters:
+                flight.waiters += 1
+                self.coalesced += 1
+                return await asyncio.shield(flight.task)
+            self.overflow += 1
+            return await fn()
+
+        async def _call() -> T:
+            return await fn()
+
+        task = asyncio.ensure_future(_call())
+        flight = _Flight(task)
+        self._flights[key] = flight
+        task.add_done_callback(lambda _: self._finish(key, flight))
+        self.leaders += 1
+        return await asyncio.shield(task)
+
+    def _finish(self, key: str, flight: _Flight[T]) -> None:
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+        if not flight.task.cancelled():
+            # Mark the exception retrieved when no caller is left to see it.
+            flight.task.exception()
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "upstream_calls": self.leaders + self.overflow,
+            "saved_calls": self.coalesced,
+            "overflow": self.overflow,
+            "in_flight": len(self._flights),
+        }
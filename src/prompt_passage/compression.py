@@ -0,0 +1,138 @@
+"""Content codings for request and response bodies.
+
+Clients may send request bodies with ``Content-Encoding: gzip``, ``deflate``
+or ``zstd``. They are decoded before the body is parsed, with a cap on the
+decoded size so a small compressed body cannot expand without bound. Large
+responses are compressed in the best coding the client's ``Accept-Encoding``
+allows. gzip and deflate use :mod:`zlib`. zstd needs the optional
+``zstandard`` package and is neither accepted nor offered without it.
+"""
+
+from __future__ import annotations
+
+import gzip
+import io
+import zlib
+from typing import Sequence
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - optional dependency
+    zstandard = None  # type: ignore[assignment,unused-ignore]
+
+_ZLIB_CODINGS = ("gzip", "x-gzip", "deflate")
+_READ_CHUNK = 1 << 20
+
+
+class UnsupportedEncoding(ValueError):
+    """A body uses a content coding this proxy cannot decode or produce."""
+
+
+def available(coding: str) -> bool:
+    """Return whether *coding* can be decoded and encoded here."""
+    return coding in _ZLIB_CODINGS or coding == "identity" or (coding == "zstd" and zstandard is not None)
+
+
+def decode(data: bytes, content_encoding: str, limit: int) -> bytes:
+    """Undo the codings listed in a ``Content-Encoding`` value.
+
+    Raises :class:`UnsupportedEncoding` for an unknown coding and
+    ``ValueError`` when the body is corrupt or decodes to more than *limit*
+    bytes.
+    """
+    codings = [c.strip().lower() for c in content_encoding.split(",") if c.strip()]
+    # Codings are listed in the order they were applied.
+    for coding in reversed(codings):
+        if coding == "identity":
+            continue
+        if not available(coding):
+            raise UnsupportedEncoding(f"Unsupported content encoding '{coding}'")
+        data = _decode_zstd(data, limit) if coding == "zstd" else _decode_zlib(data, coding, limit)
+    return data
+
+
+def _too_large(limit: int) -> ValueError:
+    return ValueError(f"Body decodes to more than {limit} bytes")
+
+
+def _decode_zlib(data: bytes, coding: str, limit: int) -> bytes:
+    wbits = zlib.MAX_WBITS | 16 if coding != "deflate" else zlib.MAX_WBITS
+    out: list[bytes] = []
+    size = 0
+    try:
+        while True:
+            decompressor = zlib.decompressobj(wbits)
+            chunk = decompressor.decompress(data, limit + 1 - size)
+            size += len(chunk)
+            if size > limit or decompressor.unconsumed_tail:
+                raise _too_large(limit)
+            out.append(chunk)
+            if not decompressor.eof:
+                raise ValueError(f"Truncated {coding} body")
+            # A gzip body may hold several members back to back.
+            data = decompressor.unused_data
+            if not data or coding == "deflate":
+                return b"".join(out)
+    except zlib.error as exc:
+        raise ValueError(f"Invalid {coding} body: {exc}") from None
+
+
+def _decode_zstd(data: bytes, limit: int) -> bytes:
+    assert zstandard is not None
+    out: list[bytes] = []
+    size = 0
+    try:
+        with zstandard.ZstdDecompressor().stream_reader(io.BytesIO(data), read_across_frames=True) as reader:
+            while size <= limit:
+                chunk = reader.read(min(_READ_CHUNK, limit + 1 - size))
+                if not chunk:
+                    break
+                out.append(chunk)
+                size += len(chunk)
+    except zstandard.ZstdError as exc:
+        raise ValueError(f"Invalid zstd body: {exc}") from None
+    if size > limit:
+        raise _too_large(limit)
+    return b"".join(out)
+
+
+def encode(data: bytes, coding: str, level: int) -> bytes:
+    """Compress *data* with *coding* (``gzip`` or ``zstd``) at *level*."""
+    if coding == "gzip":
+        return gzip.compress(data, compresslevel=level, mtime=0)
+    if coding == "zstd" and zstandard is not None:
+        compressed: bytes = zstandard.ZstdCompressor(level=level).compress(data)
+        return compressed
+    raise UnsupportedEncoding(f"Cannot encode with '{coding}'")
+
+
+def negotiate(accept_encoding: str, offered: Sequence[str]) -> str | None:
+    """Return the coding of *offered* the client prefers, or ``None`` for no coding.
+
+    Codings the client weighs equally are chosen in the order of *offered*.
+    Codings with ``q=0`` and codings the header does not list (unless it has
+    ``*``) are never chosen.
+    """
+    weights: dict[str, float] = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        weight = 1.0
+        for param in params.split(";"):
+            key, _, value = param.partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    weight = float(value)
+                except ValueError:
+                    weight = 0.0
+        weights[name] = weight
+    if "x-gzip" in weights:
+        weights.setdefault("gzip", weights["x-gzip"])
+    best, best_weight = None, 0.0
+    for coding in offered:
+        weight = weights.get(coding, weights.get("*", 0.0))
+        if weight > best_weight:
+            best, best_weight = coding, weight
+    return best
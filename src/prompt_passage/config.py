@@ -8,21 +8,32 @@ The result is an immutable `RootConfig` object containing the parsed configurati
 
 from __future__ import annotations
 
+import logging
 import os
+from functools import lru_cache
 from pathlib import Path
-from typing import Dict, Literal, Any, cast
+from typing import TYPE_CHECKING, Callable, Dict, Literal, Any, cast
 
 import yaml
 from pydantic import (
     BaseModel,
+    ConfigDict,
+    Field,
     ValidationError,
     field_validator,
     model_validator,
     PrivateAttr,
 )
 
+from .compression import available as encoding_available
 from .auth_providers import ApiKeyProvider, AzureCliProvider, TokenProvider
-import jq
+from .transform import compile_steps
+
+if TYPE_CHECKING:
+    import jq
+
+# libyaml's loader is several times faster on large provider lists.
+_YamlLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
 
 
 def default_config_path() -> Path:
@@ -95,6 +106,70 @@ class AuthConfig(BaseModel):
         return self._token_provider
 
 
+@lru_cache(maxsize=None)
+def _compile_transform(expression: str) -> jq.Program:
+    """Compile a jq *expression* once; providers sharing a transform share the program."""
+    import jq  # deferred: only configs with transforms need libjq
+
+    return jq.compile(expression)
+
+
+class TransformCondition(BaseModel):
+    """Test on the request body; every condition given must hold."""
+
+    has: str | None = None  # dotted path that must be present
+    missing: str | None = None  # dotted path that must be absent
+    equals: dict[str, Any] | None = None  # dotted path -> required value
+
+    @model_validator(mode="after")
+    def _has_a_test(self) -> "TransformCondition":
+        if self.has is None and self.missing is None and not self.equals:
+            raise ValueError("A transform 'if' needs at least one of has, missing or equals.")
+        return self
+
+
+class TransformOp(BaseModel):
+    """One step of a declarative transform; exactly one operation per step.
+
+    Paths are dotted keys into nested objects, e.g. ``response_format.type``.
+    """
+
+    model_config = ConfigDict(populate_by_name=True, extra="forbid")
+
+    rename: dict[str, str] | None = None  # path -> new key name in the same object
+    delete: list[str] | None = None
+    set: dict[str, Any] | None = None  # path -> value, always written
+    default: dict[str, Any] | None = None  # path -> value, written when absent
+    move: dict[str, str] | None = None  # source path -> destination path
+    if_: TransformCondition | None = Field(default=None, alias="if")
+    then: list[TransformOp] = []
+    else_: list[TransformOp] = Field(default=[], alias="else")
+
+    @model_validator(mode="after")
+    def _one_operation(self) -> "TransformOp":
+        ops = [
+            name for name in ("rename", "delete", "set", "default", "move", "if_") if getattr(self, name) is not None
+        ]
+        if len(ops) != 1:
+            raise ValueError("Each transform step needs exactly one of rename, delete, set, default, move or if.")
+        if (self.then or self.else_) and self.if_ is None:
+            raise ValueError("'then' and 'else' are only allowed with 'if'.")
+        return self
+
+
+def compile_transform(
+    transform: str | list[TransformOp] | None,
+) -> Callable[[dict[str, Any]], dict[str, Any]] | None:
+    """Return the function applying a provider's ``transform``, or ``None`` without one."""
+    if isinstance(transform, str):
+        program = _compile_transform(transform)
+        return lambda body: cast(dict[str, Any], program.input(body).first())
+    if transform is not None:
+        steps: Callable[[dict[str, Any]], dict[str, Any]] = compile_steps(transform)
+        return steps
+    return None
+
+
 class ProviderEndpoints(BaseModel):
     """Endpoint configuration for a provider."""
 
@@ -124,23 +199,137 @@ class ProviderEndpoints(BaseModel):
         return f"{self.base_url}/{suffix}"
 
 
-class ProviderCfg(BaseModel):
-    """Run-time configuration for a single provider entry."""
+_BODY_LOG_LEVELS = {
+    "debug": logging.DEBUG,
+    "info": logging.INFO,
+    "warning": logging.WARNING,
+    "off": logging.CRITICAL + 1,
+}
+
+
+class BodyLogCfg(BaseModel):
+    """How request and response bodies are logged for a provider."""
+
+    level: Literal["debug", "info", "warning", "off"] = "info"
+    max_bytes: int = Field(default=4096, ge=0)
+    sample_rate: float = Field(default=1.0, ge=0.0, le=1.0)
+
+    @property
+    def log_level(self) -> int:
+        return _BODY_LOG_LEVELS[self.level]
 
-    endpoints: ProviderEndpoints
-    model: str  # Name of the LLM model, e.g., "o4-mini"
-    auth: AuthConfig
-    transform: str | None = None
-    _provider: TokenProvider | None = PrivateAttr(None)
-    _transform_prog: jq.Program | None = PrivateAttr(None)
+
+class CacheCfg(BaseModel):
+    """Response caching for a provider; caching is off unless this is set."""
+
+    ttl: float = Field(default=300.0, gt=0)
+    deterministic_only: bool = True
+
+
+class CoalesceCfg(BaseModel):
+    """Merging of identical concurrent non-streaming requests for a provider."""
+
+    max_waiters: int = Field(default=100, ge=1)
+
+
+class PoolCfg(BaseModel):
+    """Connection pool settings for the upstream host of a provider."""
+
+    max_connections: int = Field(default=100, ge=1)
+    max_keepalive_connections: int = Field(default=20, ge=0)
+    keepalive_expiry: float = Field(default=5.0, ge=0)
+    http2: bool = False
+    timeout: float = Field(default=600.0, gt=0)
+    connect_timeout: float = Field(default=10.0, gt=0)
+
+
+class RequestCompressionCfg(BaseModel):
+    """Compression of request bodies sent to a provider's upstream, which must accept it."""
+
+    encoding: Literal["gzip", "zstd"] = "gzip"
+    min_bytes: int = Field(default=1024, ge=0)
+
+    @field_validator("encoding")
+    @classmethod
+    def _validate_encoding(cls, v: str) -> str:
+        if not encoding_available(v):
+            raise ValueError(f"Request compression with '{v}' needs the 'zstandard' package.")
+        return v
+
+
+class RetryCfg(BaseModel):
+    """Which failed upstream calls are retried for a provider, and how often."""
+
+    max_retries: int = Field(default=1, ge=0)
+    on_status: list[int] = [429, 500, 502, 503, 504]
+    on_errors: list[Literal["connect", "timeout", "protocol"]] = ["connect"]
+    backoff_base: float = Field(default=0.5, ge=0)
+    backoff_max: float = Field(default=8.0, ge=0)
+    max_retry_after: float = Field(default=30.0, ge=0)
+
+
+class RateLimitCfg(BaseModel):
+    """Proxy-side request and token quotas for a provider, per minute."""
+
+    rpm: int | None = Field(default=None, gt=0)
+    tpm: int | None = Field(default=None, gt=0)
+    max_wait: float = Field(default=0.0, ge=0)  # seconds a request may queue; 0 rejects at once
+    completion_tokens: int = Field(default=1024, ge=0)  # assumed when a request sets no max_tokens
+
+
+class ProbeCfg(BaseModel):
+    """Active health check for an upstream whose circuit is open."""
+
+    interval: float = Field(default=10.0, gt=0)
+    path: str = ""  # relative to the deployment's base_url
+    timeout: float = Field(default=5.0, gt=0)
+
+
+class CircuitBreakerCfg(BaseModel):
+    """Circuit breaker for the upstream hosts of a provider."""
+
+    window: int = Field(default=20, ge=1)
+    min_calls: int = Field(default=10, ge=1)
+    failure_rate: float = Field(default=0.5, gt=0, le=1)
+    slow_call_seconds: float | None = Field(default=None, gt=0)
+    slow_call_rate: float = Field(default=0.5, gt=0, le=1)
+    open_seconds: float = Field(default=30.0, gt=0)
+    half_open_calls: int = Field(default=1, ge=1)
+    probe: ProbeCfg | None = None
+
+
+class HedgeCfg(BaseModel):
+    """Send a duplicate of slow requests to a second deployment; the first response wins."""
+
+    delay: float | None = Field(default=None, gt=0)  # seconds without a response (or first stream byte)
+    percentile: float | None = Field(default=None, gt=0, lt=100)  # of observed latency; overrides delay
+    min_samples: int = Field(default=20, ge=1)  # observations needed before the percentile is used
+    max_ratio: float = Field(default=0.1, ge=0, le=1)  # share of requests that may be hedged
 
     @model_validator(mode="after")
-    def _init_provider(self) -> "ProviderCfg":
-        self._provider = self.auth.provider
-        if self.transform is not None:
-            self._transform_prog = jq.compile(self.transform)
+    def _validate_trigger(self) -> "HedgeCfg":
+        if self.delay is None and self.percentile is None:
+            raise ValueError("Hedging needs a 'delay', a 'percentile' or both.")
         return self
 
+
+class DeploymentCfg(BaseModel):
+    """One upstream deployment serving a provider's model.
+
+    ``auth`` defaults to the provider's ``auth``. Traffic is spread across
+    deployments in proportion to ``weight`` when they are equally loaded.
+    """
+
+    name: str | None = None
+    endpoints: ProviderEndpoints
+    auth: AuthConfig | None = None
+    weight: float = Field(default=1.0, gt=0)
+    _provider: TokenProvider | None = PrivateAttr(None)
+
+    @property
+    def label(self) -> str:
+        return self.name or self.endpoints.base_url
+
     @property
     def token_provider(self) -> TokenProvider:
         assert self._provider is not None
@@ -162,10 +351,72 @@ class ProviderCfg(BaseModel):
     def base_url(self) -> str:
         return self.endpoints.base_url
 
+    def url(self, route: str) -> str:
+        """Return the upstream URL for a proxy *route* (see ``proxy_app._route``)."""
+        if route == "chat/completions":
+            return self.chat_endpoint
+        if route == "responses":
+            return self.responses_endpoint
+        return self.endpoints.join(route)
+
+
+class ProviderCfg(BaseModel):
+    """Run-time configuration for a single provider entry.
+
+    A provider has either one upstream (``endpoints``) or a list of
+    ``deployments`` of the same model that requests are balanced across.
+    """
+
+    endpoints: ProviderEndpoints | None = None
+    model: str  # Name of the LLM model, e.g., "o4-mini"
+    auth: AuthConfig | None = None
+    deployments: list[DeploymentCfg] = []
+    balance: Literal["least_outstanding", "ewma"] = "least_outstanding"
+    fallback: list[str] = []
+    transform: str | list[TransformOp] | None = None  # jq expression or declarative steps
+    body_log: BodyLogCfg = Field(default_factory=BodyLogCfg)
+    cache: CacheCfg | None = None
+    coalesce: CoalesceCfg | None = None
+    pool: PoolCfg = Field(default_factory=PoolCfg)
+    request_compression: RequestCompressionCfg | None = None
+    retry: RetryCfg = Field(default_factory=RetryCfg)
+    circuit_breaker: CircuitBreakerCfg | None = None
+    rate_limit: RateLimitCfg | None = None
+    max_concurrency: int | None = Field(default=None, ge=1)
+    hedge: HedgeCfg | None = None
+    _deployments: list[DeploymentCfg] = PrivateAttr(default_factory=list)
+    _transform_fn: Callable[[dict[str, Any]], dict[str, Any]] | None = PrivateAttr(None)
+
+    @model_validator(mode="after")
+    def _init_provider(self) -> "ProviderCfg":
+        if self.deployments:
+            if self.endpoints is not None:
+                raise ValueError("Set either 'endpoints' or 'deployments', not both.")
+            deployments = self.deployments
+        elif self.endpoints is not None:
+            deployments = [DeploymentCfg(endpoints=self.endpoints, auth=self.auth)]
+        else:
+            raise ValueError("Either 'endpoints' or 'deployments' must be provided.")
+        for deployment in deployments:
+            auth = deployment.auth or self.auth
+            if auth is None:
+                raise ValueError(f"Deployment '{deployment.label}' has no 'auth' and the provider sets none.")
+            deployment._provider = auth.provider
+        if self.hedge is not None and len(deployments) < 2:
+            raise ValueError("'hedge' needs at least two 'deployments' to send duplicates to.")
+        self._deployments = deployments
+        self._transform_fn = compile_transform(self.transform)
+        return self
+
+    @property
+    def all_deployments(self) -> list[DeploymentCfg]:
+        """The upstream deployments, including the one implied by ``endpoints``."""
+        return self._deployments
+
     def apply_transform(self, body: dict[str, Any]) -> dict[str, Any]:
-        if self._transform_prog is None:
+        if self._transform_fn is None:
             return body
-        return cast(dict[str, Any], self._transform_prog.input(body).first())
+        return self._transform_fn(body)
 
 
 class DefaultsCfg(BaseModel):
@@ -188,11 +439,118 @@ class ServiceAuthCfg(BaseModel):
         return v
 
 
+class DiskCacheCfg(BaseModel):
+    """Persistent response cache tier shared by all workers using the same path."""
+
+    path: str
+    max_bytes: int = Field(default=1024 * 1024 * 1024, gt=0)
+
+    @property
+    def resolved_path(self) -> Path:
+        return Path(self.path).expanduser()
+
+
+class ServiceCacheCfg(BaseModel):
+    """Size limits for the proxy-wide response cache."""
+
+    memory: bool = True
+    max_bytes: int = Field(default=256 * 1024 * 1024, gt=0)
+    max_entry_bytes: int = Field(default=8 * 1024 * 1024, gt=0)
+    disk: DiskCacheCfg | None = None
+
+
+class RetryBudgetCfg(BaseModel):
+    """Proxy-wide cap on retries, as a fraction of recent requests."""
+
+    ratio: float = Field(default=0.2, ge=0)
+    min_per_second: float = Field(default=1.0, ge=0)
+
+
+class PriorityClassCfg(BaseModel):
+    """One admission priority class: its share of freed slots and its queue-wait SLO."""
+
+    weight: float = Field(default=1.0, gt=0)
+    max_wait: float = Field(default=30.0, gt=0)  # seconds queued before the request is shed
+
+
+def _default_priority_classes() -> dict[str, PriorityClassCfg]:
+    return {
+        "interactive": PriorityClassCfg(weight=4.0, max_wait=5.0),
+        "batch": PriorityClassCfg(weight=1.0, max_wait=120.0),
+    }
+
+
+class AdmissionCfg(BaseModel):
+    """Proxy-wide concurrency limit, wait queue and priority classes."""
+
+    max_concurrency: int | None = Field(default=None, ge=1)
+    max_queue: int = Field(default=1000, ge=0)
+    classes: dict[str, PriorityClassCfg] = Field(default_factory=_default_priority_classes)
+    default_class: str = "interactive"
+    header: str = "x-prompt-passage-priority"
+    keys: dict[str, str] = {}  # client API key -> priority class
+    retry_after: float = Field(default=1.0, ge=0)
+
+    @model_validator(mode="after")
+    def _validate_classes(self) -> "AdmissionCfg":
+        if self.default_class not in self.classes:
+            raise ValueError(f"Admission default_class '{self.default_class}' is not a configured class.")
+        for cls_name in self.keys.values():
+            if cls_name not in self.classes:
+                raise ValueError(f"Admission key maps to unknown class '{cls_name}'.")
+        return self
+
+
+class OffloadCfg(BaseModel):
+    """Request bodies large enough to be parsed, transformed and hashed off the event loop."""
+
+    min_bytes: int = Field(default=1_048_576, ge=0)
+    max_workers: int = Field(default=4, ge=1)
+    processes: int = Field(default=2, ge=0)  # for JSON parsing and encoding; 0 keeps it in threads
+
+
+class LoopMonitorCfg(BaseModel):
+    """Event loop lag monitoring; stalls longer than ``stall_threshold`` are logged."""
+
+    enabled: bool = True
+    interval: float = Field(default=0.05, gt=0)
+    stall_threshold: float = Field(default=0.1, gt=0)
+
+
+class CompressionCfg(BaseModel):
+    """Compression of large non-streaming responses, and the limit on compressed request bodies."""
+
+    responses: bool = True
+    min_bytes: int = Field(default=16_384, ge=0)  # smaller responses are sent as they are
+    encodings: list[Literal["zstd", "gzip"]] = ["zstd", "gzip"]  # in order of preference
+    gzip_level: int = Field(default=5, ge=1, le=9)
+    zstd_level: int = Field(default=3, ge=1, le=22)
+    max_request_bytes: int = Field(default=64 * 1_048_576, gt=0)  # decoded size of a compressed request
+
+    def level(self, encoding: str) -> int:
+        return self.zstd_level if encoding == "zstd" else self.gzip_level
+
+
+class ReloadCfg(BaseModel):
+    """Reloading the configuration file without a restart."""
+
+    watch: bool = False  # poll the file and reload when it changes
+    interval: float = Field(default=2.0, gt=0)
+    drain_timeout: float = Field(default=300.0, ge=0)  # seconds before retired pools are closed
+
+
 class ServiceCfg(BaseModel):
     """Configuration for the running proxy service."""
 
     port: int = 8095
     auth: ServiceAuthCfg | None = None
+    cache: ServiceCacheCfg = Field(default_factory=ServiceCacheCfg)
+    retry_budget: RetryBudgetCfg = Field(default_factory=RetryBudgetCfg)
+    admission: AdmissionCfg | None = None
+    offload: OffloadCfg = Field(default_factory=OffloadCfg)
+    loop_monitor: LoopMonitorCfg = Field(default_factory=LoopMonitorCfg)
+    reload: ReloadCfg = Field(default_factory=ReloadCfg)
+    compression: CompressionCfg = Field(default_factory=CompressionCfg)
 
 
 class RootConfig(BaseModel):
@@ -216,6 +574,16 @@ class RootConfig(BaseModel):
                 raise ValueError(f"Default provider '{self.defaults.provider}' not found in the 'providers' list.")
         return self
 
+    @model_validator(mode="after")
+    def _validate_fallbacks(self) -> "RootConfig":
+        for name, provider in self.providers.items():
+            for fallback in provider.fallback:
+                if fallback == name:
+                    raise ValueError(f"Provider '{name}' lists itself as a fallback.")
+                if fallback not in self.providers:
+                    raise ValueError(f"Fallback provider '{fallback}' of '{name}' not found in the 'providers' list.")
+        return self
+
 
 def load_config(path: str | Path = "models.yaml") -> RootConfig:
     """
@@ -226,7 +594,7 @@ def load_config(path: str | Path = "models.yaml") -> RootConfig:
         raise FileNotFoundError(f"Configuration file not found: {path}")
 
     with path.open("rt", encoding="utf-8") as fp:
-        raw_data = yaml.safe_load(fp)
+        raw_data = yaml.load(fp, Loader=_YamlLoader)
 
     if not raw_data:
         raise ValueError(f"Configuration file is empty or invalid: {path}")
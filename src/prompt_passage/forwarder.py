@@ -2,25 +2,302 @@
 
 from __future__ import annotations
 
-from typing import Mapping
+import asyncio
+import logging
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable, Mapping
+from urllib.parse import urlsplit
 
 import httpx
 
-from .config import ProviderCfg
+from .breaker import OPEN, CircuitBreaker, Prober
+from .config import CircuitBreakerCfg, DeploymentCfg, PoolCfg, ProviderCfg, RetryCfg
+from .retry import RetryBudget, backoff, is_retryable_error, retry_after
+
+logger = logging.getLogger(__name__)
+
+_DRAIN_POLL = 1.0  # seconds between checks of a draining pool
+_RAW_CONTENT = "prompt_passage.raw_content"
+
+
+def _origin(url: str) -> str:
+    """Return ``scheme://host[:port]`` of *url*, the unit a connection pool is shared by."""
+    parts = urlsplit(url)
+    return f"{parts.scheme.lower()}://{parts.netloc.lower()}"
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def upstream_ttfb(response: httpx.Response) -> float | None:
+    """Return the seconds from sending the request of *response* to its headers, if traced."""
+    timings = response.request.extensions.get("timings")
+    return timings.get("ttfb") if timings else None
+
+
+def raw_content(response: httpx.Response) -> bytes | None:
+    """Return the body of *response* as the upstream encoded it, when it had a ``content-encoding``."""
+    raw: bytes | None = response.extensions.get(_RAW_CONTENT)
+    return raw
+
+
+class _ReleasingStream(httpx.AsyncByteStream):
+    """A response stream that calls *release* once it is closed."""
+
+    def __init__(self, stream: httpx.AsyncByteStream, release: Callable[[], None]):
+        self._stream = stream
+        self._release = release
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self) -> None:
+        try:
+            await self._stream.aclose()
+        finally:
+            self._release()
+
+
+class UpstreamPool:
+    """An :class:`httpx.AsyncClient` dedicated to one upstream host.
+
+    Besides the client it keeps counters for how long requests waited for a
+    connection: the time from sending a request to the first connection event
+    (opening a new connection or writing headers on a reused one). Requests
+    sent with :meth:`send` count as in flight until their response is closed.
+    """
+
+    def __init__(self, origin: str, cfg: PoolCfg):
+        self.origin = origin
+        self.cfg = cfg
+        http2 = cfg.http2
+        if http2 and not _http2_available():
+            logger.warning("HTTP/2 requested for %s but the 'h2' package is not installed; using HTTP/1.1", origin)
+            http2 = False
+        self.http2 = http2
+        self.client = httpx.AsyncClient(
+            timeout=httpx.Timeout(cfg.timeout, connect=cfg.connect_timeout),
+            limits=httpx.Limits(
+                max_connections=cfg.max_connections,
+                max_keepalive_connections=cfg.max_keepalive_connections,
+                keepalive_expiry=cfg.keepalive_expiry,
+            ),
+            http2=http2,
+        )
+        self.requests = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self._in_flight: set[httpx.Request] = set()
+
+    def extensions(self) -> dict[str, Any]:
+        """Return request extensions that record the pool wait of one request.
+
+        The time until the response headers arrive is kept in the request's
+        ``timings`` extension; see :func:`upstream_ttfb`.
+        """
+        started = time.perf_counter()
+        waiting = True
+        timings: dict[str, float] = {}
+
+        async def trace(event: str, info: dict[str, Any]) -> None:
+            nonlocal waiting
+            if waiting:
+                waiting = False
+                timings["wait"] = time.perf_counter() - started
+                self._record_wait(timings["wait"])
+            if event.endswith("receive_response_headers.complete"):
+                timings["ttfb"] = time.perf_counter() - started
+
+        return {"trace": trace, "timings": timings}
+
+    def _record_wait(self, seconds: float) -> None:
+        self.requests += 1
+        self.wait_total += seconds
+        if seconds > self.wait_max:
+            self.wait_max = seconds
+
+    async def send(self, request: httpx.Request) -> httpx.Response:
+        """Send *request* and return its response with the body still to be read.
+
+        The request counts as in flight until the response is closed.
+        """
+        self._in_flight.add(request)
+        try:
+            response = await self.client.send(request, stream=True)
+        except BaseException:
+            self._in_flight.discard(request)
+            raise
+        assert isinstance(response.stream, httpx.AsyncByteStream)
+        response.stream = _ReleasingStream(response.stream, lambda: self._in_flight.discard(request))
+        return response
+
+    def active(self) -> int:
+        """Return the requests using or waiting for a connection, open streams included."""
+        return len(self._in_flight)
+
+    async def drain(self, timeout: float) -> None:
+        """Close the client once no request is using it, or after *timeout* seconds."""
+        deadline = time.monotonic() + timeout
+        try:
+            while self.active() and time.monotonic() < deadline:
+                await asyncio.sleep(_DRAIN_POLL)
+            if self.active():
+                logger.warning("Closing pool for %s with %d requests still open", self.origin, self.active())
+        finally:
+            await self.client.aclose()
+
+    def stats(self) -> dict[str, Any]:
+        pool = getattr(self.client._transport, "_pool", None)
+        connections = list(getattr(pool, "connections", ()))
+        # Requests that have not reached a connection event yet are waiting for one.
+        queued = [r for r in self._in_flight if "wait" not in r.extensions.get("timings", {})]
+        return {
+            "http2": self.http2,
+            "max_connections": self.cfg.max_connections,
+            "connections": len(connections),
+            "idle_connections": sum(1 for c in connections if c.is_idle()),
+            "queued_requests": len(queued),
+            "requests": self.requests,
+            "wait_ms_avg": self.wait_total / self.requests * 1000 if self.requests else 0.0,
+            "wait_ms_max": self.wait_max * 1000,
+        }
 
 
 class Forwarder:
-    """Forwarder with shared :class:`httpx.AsyncClient`."""
+    """Forwarder with one :class:`UpstreamPool` per upstream host.
+
+    Pool settings come from the ``pool`` block of the providers pointing at a
+    host. Providers sharing a host share its pool; if they configure it
+    differently the first one wins; the same goes for ``circuit_breaker``.
+    Failed calls are retried according to the ``retry`` policy passed in,
+    within the proxy-wide *retry_budget*.
+
+    :meth:`reconfigure` applies a reloaded provider map: hosts whose settings
+    are unchanged keep their pool and breaker, and pools that are no longer
+    needed are closed once their in-flight requests finish (*drain_timeout*).
+    """
+
+    def __init__(
+        self,
+        model_map: Mapping[str, ProviderCfg],
+        retry_budget: RetryBudget | None = None,
+        drain_timeout: float = 300.0,
+    ):
+        self.retry_budget = retry_budget if retry_budget is not None else RetryBudget(0.2, 1.0)
+        self.drain_timeout = drain_timeout
+        self._settings: dict[str, PoolCfg] = {}
+        self.breakers: dict[str, CircuitBreaker] = {}
+        self._probers: dict[str, Prober] = {}
+        self._pools: dict[str, UpstreamPool] = {}
+        self._retiring: set[asyncio.Task[None]] = set()
+        self._started = False
+        # Hosts that answered a compressed request body with 415.
+        self._identity_only: set[str] = set()
+        self.reconfigure(model_map)
+
+    def reconfigure(self, model_map: Mapping[str, ProviderCfg]) -> None:
+        """Point the forwarder at the hosts of *model_map*, keeping what did not change."""
+        settings: dict[str, PoolCfg] = {}
+        breakers: dict[str, tuple[CircuitBreakerCfg, DeploymentCfg]] = {}
+        for name, cfg in model_map.items():
+            for deployment in cfg.all_deployments:
+                urls = (deployment.base_url, deployment.chat_endpoint, deployment.responses_endpoint)
+                for origin in {_origin(u) for u in urls}:
+                    existing = settings.setdefault(origin, cfg.pool)
+                    if existing != cfg.pool:
+                        logger.warning(
+                            "Provider %s: pool settings for %s differ from another provider; ignored", name, origin
+                        )
+                    if cfg.circuit_breaker is not None and origin not in breakers:
+                        breakers[origin] = (cfg.circuit_breaker, deployment)
+        self._settings = settings
+
+        for origin, pool in list(self._pools.items()):
+            if settings.get(origin) != pool.cfg:
+                del self._pools[origin]
+                self._retire(pool.drain(self.drain_timeout))
+        for origin, breaker in list(self.breakers.items()):
+            wanted = breakers.get(origin)
+            if wanted is None or wanted[0] != breaker.cfg:
+                del self.breakers[origin]
+                prober = self._probers.pop(origin, None)
+                if prober is not None:
+                    self._retire(prober.stop())
+        for origin, (breaker_cfg, deployment) in breakers.items():
+            if origin not in self.breakers:
+                self._add_breaker(origin, breaker_cfg, deployment)
+
+    def _retire(self, closing: Awaitable[None]) -> None:
+        async def run() -> None:
+            await closing
+
+        task = asyncio.ensure_future(run())
+        self._retiring.add(task)
+        task.add_done_callback(self._retiring.discard)
+
+    def _add_breaker(self, origin: str, cfg: CircuitBreakerCfg, deployment: DeploymentCfg) -> None:
+        breaker = CircuitBreaker(origin, cfg)
+        self.breakers[origin] = breaker
+        if cfg.probe is not None:
+            url = deployment.endpoints.join(cfg.probe.path)
+            prober = Prober(breaker, url, lambda: self.pool(url).client)
+            self._probers[origin] = prober
+            if self._started:
+                prober.start()
+
+    def start(self) -> None:
+        """Start the background health probes; requires a running event loop."""
+        self._started = True
+        for prober in self._probers.values():
+            prober.start()
+
+    def available(self, url: str) -> bool:
+        """Return ``False`` when the circuit for the host of *url* is open."""
+        breaker = self.breakers.get(_origin(url))
+        return breaker is None or breaker.state != OPEN
+
+    def accepts_encoding(self, url: str) -> bool:
+        """Return ``False`` once the host of *url* has rejected a compressed request body."""
+        return _origin(url) not in self._identity_only
 
-    _TIMEOUT = httpx.Timeout(600.0)  # 10 minutes
+    def refuse_encoding(self, url: str) -> None:
+        self._identity_only.add(_origin(url))
 
-    def __init__(self, model_map: Mapping[str, ProviderCfg]):
-        self._model_map = model_map
-        self._client = httpx.AsyncClient(timeout=self._TIMEOUT)
+    def health(self) -> dict[str, Any]:
+        return {origin: breaker.stats() for origin, breaker in self.breakers.items()}
+
+    def pool(self, url: str) -> UpstreamPool:
+        """Return the pool for the host of *url*, creating it on first use."""
+        origin = _origin(url)
+        pool = self._pools.get(origin)
+        if pool is None:
+            pool = UpstreamPool(origin, self._settings.get(origin) or PoolCfg())
+            self._pools[origin] = pool
+        return pool
 
     async def aclose(self) -> None:
-        """Closes the underlying httpx.AsyncClient."""
-        await self._client.aclose()
+        """Stops the probes and closes every upstream client, draining ones included."""
+        for prober in self._probers.values():
+            await prober.stop()
+        for task in self._retiring:
+            task.cancel()
+        await asyncio.gather(*self._retiring, return_exceptions=True)
+        for pool in self._pools.values():
+            await pool.client.aclose()
+
+    def stats(self) -> dict[str, Any]:
+        return {origin: pool.stats() for origin, pool in self._pools.items()}
+
+    @property
+    def draining(self) -> int:
+        """Number of retired pools (and probes) still being closed."""
+        return len(self._retiring)
 
     # ---------------------------------------------------------------------
     # Public helpers
@@ -30,34 +307,102 @@ class Forwarder:
         endpoint: str,
         body: bytes,
         headers: Mapping[str, str],
+        retry: RetryCfg | None = None,
     ) -> httpx.Response:
+
         async def _send() -> httpx.Response:
-            return await self._client.post(
-                endpoint,
-                content=body,
-                headers=headers,
+            # Looked up per attempt: a reload may retire the pool between retries.
+            pool = self.pool(endpoint)
+            request = pool.client.build_request(
+                "POST", endpoint, content=body, headers=headers, extensions=pool.extensions()
+            )
+            response = await pool.send(request)
+            try:
+                if "content-encoding" not in response.headers:
+                    await response.aread()
+                    return response
+                raw = b"".join([chunk async for chunk in response.aiter_raw()])
+            finally:
+                await response.aclose()
+            # Keep the encoded bytes as well, so they can be relayed without re-encoding.
+            return httpx.Response(
+                response.status_code,
+                headers=response.headers,
+                content=raw,
+                request=request,
+                extensions={**response.extensions, _RAW_CONTENT: raw},
             )
 
-        resp = await _send()
-        if resp.status_code >= 500:
-            await resp.aclose()
-            resp = await _send()
-
-        return resp
+        return await self._with_retries(endpoint, _send, retry, self.breakers.get(_origin(endpoint)))
 
     async def stream(
         self,
         endpoint: str,
         body: bytes,
         headers: Mapping[str, str],
+        retry: RetryCfg | None = None,
     ) -> httpx.Response:
-        """Send a POST request and return a streaming ``httpx.Response``."""
+        """Send a POST request and return a streaming ``httpx.Response``.
 
-        request = self._client.build_request("POST", endpoint, content=body, headers=headers)
+        The response is returned once its headers arrive, so retries always
+        happen before any byte has been relayed to the client.
+        """
 
-        resp = await self._client.send(request, stream=True)
-        if resp.status_code >= 500:
-            await resp.aclose()
-            resp = await self._client.send(request, stream=True)
+        async def _send() -> httpx.Response:
+            pool = self.pool(endpoint)
+            request = pool.client.build_request(
+                "POST", endpoint, content=body, headers=headers, extensions=pool.extensions()
+            )
+            return await pool.send(request)
+
+        return await self._with_retries(endpoint, _send, retry, self.breakers.get(_origin(endpoint)))
+
+    async def _with_retries(
+        self,
+        endpoint: str,
+        send: Callable[[], Awaitable[httpx.Response]],
+        policy: RetryCfg | None,
+        breaker: CircuitBreaker | None,
+    ) -> httpx.Response:
+        self.retry_budget.record_request()
+        attempt = 0
+        while True:
+            if breaker is not None:
+                breaker.before_call()
+            started = time.perf_counter()
+            try:
+                resp = await send()
+            except httpx.RequestError as exc:
+                if breaker is not None:
+                    breaker.record(False, time.perf_counter() - started)
+                if (
+                    policy is None
+                    or attempt >= policy.max_retries
+                    or not is_retryable_error(policy, exc)
+                    or not self.retry_budget.try_spend()
+                ):
+                    raise
+                delay = backoff(policy, attempt)
+                reason = type(exc).__name__
+            except BaseException:
+                # Cancelled (or failed outside httpx) before there was an outcome to record.
+                if breaker is not None:
+                    breaker.abandon()
+                raise
+            else:
+                if breaker is not None:
+                    breaker.record(resp.status_code < 500, time.perf_counter() - started)
+                if policy is None or attempt >= policy.max_retries or resp.status_code not in policy.on_status:
+                    return resp
+                requested = retry_after(resp.headers)
+                if requested is not None and requested > policy.max_retry_after:
+                    return resp
+                if not self.retry_budget.try_spend():
+                    return resp
+                await resp.aclose()
+                delay = requested if requested is not None else backoff(policy, attempt)
+                reason = str(resp.status_code)
 
-        return resp
+            attempt += 1
+            logger.info("Retrying %s after %s in %.2fs (retry %d)", endpoint, reason, delay, attempt)
+            await asyncio.sleep(delay)
@@ -0,0 +1,157 @@
+"""Hedged requests for providers with several deployments.
+
+When a request has had no response (or, for streams, no first byte) after the
+hedge delay, :func:`hedged` sends a duplicate to another deployment and keeps
+whichever answers first; the other attempt is cancelled. The delay is either
+fixed or a percentile of recently observed latency, and a
+:class:`~prompt_passage.retry.RetryBudget` caps the share of requests that are
+hedged, so the extra upstream cost stays bounded.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import math
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Awaitable, Callable, TypeVar
+
+import httpx
+
+from .config import HedgeCfg
+from .retry import RetryBudget
+
+T = TypeVar("T")
+
+_WINDOW = 256  # latency samples kept per request kind
+_RECOMPUTE_EVERY = 16  # samples between percentile updates
+
+
+class HedgePolicy:
+    """Hedge delay, latency history and budget of one provider."""
+
+    def __init__(self, cfg: HedgeCfg):
+        self.cfg = cfg
+        self.budget = RetryBudget(cfg.max_ratio, 0.0)
+        # Keyed by ``stream``: full latency for regular requests, first byte for streams.
+        self._samples: dict[bool, deque[float]] = {False: deque(maxlen=_WINDOW), True: deque(maxlen=_WINDOW)}
+        self._percentile: dict[bool, float | None] = {False: None, True: None}
+        self._fresh: dict[bool, int] = {False: 0, True: 0}
+        self.requests = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+
+    def delay(self, stream: bool) -> float | None:
+        """Return how long to wait before hedging, or ``None`` to not hedge yet."""
+        if self.cfg.percentile is not None and len(self._samples[stream]) >= self.cfg.min_samples:
+            if self._percentile[stream] is None or self._fresh[stream] >= _RECOMPUTE_EVERY:
+                ordered = sorted(self._samples[stream])
+                rank = math.ceil(self.cfg.percentile / 100 * len(ordered)) - 1
+                self._percentile[stream] = ordered[max(0, rank)]
+                self._fresh[stream] = 0
+            return self._percentile[stream]
+        delay: float | None = self.cfg.delay
+        return delay
+
+    def record(self, stream: bool, seconds: float) -> None:
+        self._samples[stream].append(seconds)
+        self._fresh[stream] += 1
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "hedged": self.hedged,
+            "hedge_wins": self.hedge_wins,
+            "budget_exhausted": self.budget.exhausted,
+            "delay_ms": {
+                kind: (delay * 1000 if delay is not None else None)
+                for kind, delay in (("request", self.delay(False)), ("stream", self.delay(True)))
+            },
+        }
+
+
+async def hedged(
+    policy: HedgePolicy,
+    stream: bool,
+    attempt: Callable[[], Awaitable[T]],
+    can_hedge: Callable[[], bool],
+    discard: Callable[[T], Awaitable[None]],
+) -> T:
+    """Run *attempt*, and a second one if the first is slower than the hedge delay.
+
+    *can_hedge* tells whether another deployment is eligible; *discard* releases
+    the result of an attempt that completed but lost the race.
+    """
+    policy.requests += 1
+    policy.budget.record_request()
+    started = time.perf_counter()
+    delay = policy.delay(stream)
+    primary = asyncio.ensure_future(attempt())
+    tasks: list[asyncio.Future[T]] = [primary]
+    try:
+        if delay is not None:
+            await asyncio.wait(tasks, timeout=delay)
+            if not primary.done() and can_hedge() and policy.budget.try_spend():
+                policy.hedged += 1
+                tasks.append(asyncio.ensure_future(attempt()))
+        winner = await _first_result(tasks)
+    finally:
+        await _cancel_losers(tasks, discard)
+    if winner is not primary:
+        policy.hedge_wins += 1
+    policy.record(stream, time.perf_counter() - started)
+    return winner.result()
+
+
+async def _first_result(tasks: list[asyncio.Future[T]]) -> asyncio.Future[T]:
+    """Return the first task to succeed; if all fail, raise the first task's error."""
+    pending = set(tasks)
+    while pending:
+        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        for task in tasks:
+            if task in done and task.exception() is None:
+                return task
+    error = tasks[0].exception()
+    assert error is not None
+    raise error
+
+
+async def _cancel_losers(tasks: list[asyncio.Future[T]], discard: Callable[[T], Awaitable[None]]) -> None:
+    winner = next((t for t in tasks if t.done() and not t.cancelled() and t.exception() is None), None)
+    losers = [t for t in tasks if t is not winner]
+    for task in losers:
+        task.cancel()
+    results = await asyncio.gather(*losers, return_exceptions=True)
+    for result in results:
+        if not isinstance(result, BaseException):
+            await discard(result)
+
+
+class _PrimedStream(httpx.AsyncByteStream):
+    """A response stream whose first chunk has already been read."""
+
+    def __init__(self, first: bytes, rest: AsyncIterator[bytes], stream: httpx.AsyncByteStream):
+        self._first = first
+        self._rest = rest
+        self._stream = stream
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        if self._first:
+            yield self._first
+        async for chunk in self._rest:
+            yield chunk
+
+    async def aclose(self) -> None:
+        await self._stream.aclose()
+
+
+async def read_first_byte(response: httpx.Response) -> None:
+    """Wait for the first body chunk of streaming *response* without consuming it."""
+    stream = response.stream
+    assert isinstance(stream, httpx.AsyncByteStream)
+    rest = stream.__aiter__()
+    try:
+        first = await rest.__anext__()
+    except StopAsyncIteration:
+        first = b""
+    response.stream = _PrimedStream(first, rest, stream)
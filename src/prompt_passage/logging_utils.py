@@ -0,0 +1,88 @@
+"""Logging pipeline for the proxy.
+
+Records are handed to a :class:`logging.handlers.QueueHandler` on the event
+loop and written by a :class:`logging.handlers.QueueListener` thread, so slow
+terminals or files never block request handling. Request and response bodies
+are logged through :func:`log_body`, which is sampled, skipped entirely when
+the level is disabled, and only decodes (and truncates) the bytes when the
+listener thread actually formats the record.
+"""
+
+from __future__ import annotations
+
+import atexit
+import logging
+import queue
+import random
+from logging.handlers import QueueHandler, QueueListener
+from typing import TYPE_CHECKING
+
+from uvicorn.logging import DefaultFormatter
+
+if TYPE_CHECKING:
+    from .config import BodyLogCfg
+
+body_logger = logging.getLogger("prompt_passage.bodies")
+
+_listener: QueueListener | None = None
+
+
+class _DeferredQueueHandler(QueueHandler):
+    """Queue handler that leaves message formatting to the listener thread.
+
+    The stock ``prepare`` renders ``record.msg % record.args`` in the caller so
+    records can be pickled; records here never leave the process, so the args
+    (immutable bytes for bodies) are passed through untouched.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+def configure_logging(level: int = logging.INFO) -> None:
+    """Route root logging through a background listener thread."""
+    global _listener
+    if _listener is not None:
+        return
+
+    handler = logging.StreamHandler()
+    handler.setFormatter(DefaultFormatter(fmt="%(levelprefix)s %(message)s", use_colors=True))
+
+    log_queue: queue.SimpleQueue[logging.LogRecord] = queue.SimpleQueue()
+    root = logging.getLogger()
+    root.handlers.clear()
+    root.addHandler(_DeferredQueueHandler(log_queue))
+    root.setLevel(level)
+
+    _listener = QueueListener(log_queue, handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+
+
+class BodyText:
+    """Lazily rendered, size-capped view of a body for log records."""
+
+    __slots__ = ("_data", "_limit")
+
+    def __init__(self, data: bytes, limit: int):
+        self._data = data
+        self._limit = limit
+
+    def __str__(self) -> str:
+        data = self._data
+        if len(data) <= self._limit:
+            return data.decode("utf-8", errors="replace")
+        head = data[: self._limit].decode("utf-8", errors="replace")
+        return f"{head}... [{len(data) - self._limit} more bytes]"
+
+
+def body_sampled(cfg: BodyLogCfg) -> bool:
+    """Decide once per request whether its bodies are logged."""
+    if cfg.level == "off" or not body_logger.isEnabledFor(cfg.log_level):
+        return False
+    return bool(cfg.sample_rate >= 1.0 or random.random() < cfg.sample_rate)
+
+
+def log_body(cfg: BodyLogCfg, label: str, data: bytes) -> None:
+    """Log *data* under *label* at the provider's configured body level."""
+    body_logger.log(cfg.log_level, "%s (%d bytes):\n%s", label, len(data), BodyText(data, cfg.max_bytes))
@@ -0,0 +1,130 @@
+"""Event loop lag monitoring.
+
+A tick coroutine sleeps for ``interval`` and measures how late it wakes up:
+that lateness is the time the loop spent running something else without
+yielding. Every lag is recorded in the metrics, and lags above
+``stall_threshold`` are counted and logged as stalls.
+
+By the time the tick runs again the stall is over, so it cannot tell what
+caused it. A watchdog thread therefore checks on the tick while it is
+overdue and reads which task the loop is running at that moment. Request
+handlers label their task with :meth:`LoopMonitor.track`, so a stall is logged
+with the request responsible for it.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import threading
+import time
+from collections import deque
+from typing import TYPE_CHECKING, Any
+
+from .config import LoopMonitorCfg
+
+if TYPE_CHECKING:
+    from .metrics import Metrics
+
+logger = logging.getLogger(__name__)
+
+_RECENT_STALLS = 20
+
+
+class LoopMonitor:
+    """Measures event loop lag and attributes stalls to the request being served."""
+
+    def __init__(self, cfg: LoopMonitorCfg, metrics: Metrics | None = None):
+        self.cfg = cfg
+        self._metrics = metrics
+        self._labels: dict[asyncio.Task[Any], str] = {}
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._task: asyncio.Task[None] | None = None
+        self._thread: threading.Thread | None = None
+        self._stopped = threading.Event()
+        self._last_tick = time.perf_counter()
+        # Set by the watchdog thread while a tick is overdue; read and cleared by the tick.
+        self._culprit: str | None = None
+        self._sampled = False
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+        self.stalls = 0
+        self.stalled_seconds = 0.0
+        self.recent: deque[dict[str, Any]] = deque(maxlen=_RECENT_STALLS)
+
+    def start(self) -> None:
+        """Start monitoring the running event loop."""
+        self._loop = asyncio.get_running_loop()
+        self._last_tick = time.perf_counter()
+        self._task = self._loop.create_task(self._tick())
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._watch, name="prompt-passage-loop-monitor", daemon=True)
+        self._thread.start()
+
+    async def stop(self) -> None:
+        self._stopped.set()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._thread is not None:
+            await asyncio.to_thread(self._thread.join)
+            self._thread = None
+
+    def track(self, label: str) -> None:
+        """Name the current task's work as *label* until the task finishes."""
+        task = asyncio.current_task()
+        if task is None:
+            return
+        if task not in self._labels:
+            task.add_done_callback(self._untrack)
+        self._labels[task] = label
+
+    def _untrack(self, task: asyncio.Task[Any]) -> None:
+        self._labels.pop(task, None)
+
+    async def _tick(self) -> None:
+        interval = self.cfg.interval
+        while True:
+            expected = time.perf_counter() + interval
+            await asyncio.sleep(interval)
+            now = time.perf_counter()
+            self._last_tick = now
+            culprit, self._culprit, self._sampled = self._culprit, None, False
+            self._record(max(0.0, now - expected), culprit)
+
+    def _record(self, lag: float, culprit: str | None) -> None:
+        self.last_lag = lag
+        self.max_lag = max(self.max_lag, lag)
+        if self._metrics is not None:
+            self._metrics.loop_lag.observe((), lag)
+        if lag < self.cfg.stall_threshold:
+            return
+        self.stalls += 1
+        self.stalled_seconds += lag
+        self.recent.append({"at": time.time(), "ms": round(lag * 1000, 1), "request": culprit})
+        logger.warning("Event loop stalled for %.0f ms while serving %s", lag * 1000, culprit or "no tracked request")
+
+    def _watch(self) -> None:
+        """Watchdog thread: note which task is running while the tick is overdue."""
+        overdue = self.cfg.interval + self.cfg.stall_threshold
+        poll = min(self.cfg.interval, self.cfg.stall_threshold) / 2
+        while not self._stopped.wait(poll):
+            if self._sampled or time.perf_counter() - self._last_tick < overdue:
+                continue
+            assert self._loop is not None
+            task = asyncio.current_task(self._loop)
+            self._culprit = self._labels.get(task) if task is not None else None
+            self._sampled = True
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "lag_ms": round(self.last_lag * 1000, 1),
+            "max_lag_ms": round(self.max_lag * 1000, 1),
+            "stalls": self.stalls,
+            "stalled_ms": round(self.stalled_seconds * 1000, 1),
+            "recent_stalls": list(self.recent),
+        }
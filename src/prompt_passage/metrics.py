@@ -0,0 +1,314 @@
+"""Prometheus metrics for proxied requests.
+
+Collection is kept cheap because it runs on every request: a metric is a dict
+from label values to plain numbers, a histogram observation is one
+:func:`bisect.bisect_left` over its bucket bounds, and nothing is formatted
+until ``/metrics`` is scraped. Everything runs on the event loop, so no locks
+are needed. With several workers, :meth:`Metrics.render` also adds the
+snapshots other workers published (see :mod:`prompt_passage.shared`).
+"""
+
+from __future__ import annotations
+
+import math
+import time
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from typing import Any, Mapping, Sequence
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+_LATENCY_BUCKETS = (0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+_SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+_TOKEN_BUCKETS = (16, 64, 256, 1024, 4096, 16384, 65536, 262144)
+_RATE_BUCKETS = (1, 5, 10, 20, 40, 80, 160, 320, 640)
+_LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+_QUEUE_BUCKETS = (0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_ENDPOINTS = ("chat/completions", "responses")
+
+
+def endpoint_label(route: str) -> str:
+    """Return the ``endpoint`` label for an upstream route, keeping label cardinality bounded."""
+    return route if route in _ENDPOINTS else "other"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric(ABC):
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str]):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+
+    values: dict[tuple[str, ...], Any]
+
+    def render(self, out: list[str], others: Sequence[Mapping[tuple[str, ...], Any]] = ()) -> None:
+        out.append(f"# HELP {self.name} {self.help}")
+        out.append(f"# TYPE {self.name} {self.kind}")
+        self._samples(out, self._merged(others) if others else self.values)
+
+    @abstractmethod
+    def _merged(self, others: Sequence[Mapping[tuple[str, ...], Any]]) -> dict[tuple[str, ...], Any]:
+        """Return these values with the values of other workers added."""
+
+    @abstractmethod
+    def _samples(self, out: list[str], values: Mapping[tuple[str, ...], Any]) -> None:
+        """Append the sample lines of *values* to *out*."""
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str]):
+        super().__init__(name, help, labelnames)
+        self.values: dict[tuple[str, ...], float] = {}
+
+    def inc(self, labels: tuple[str, ...], amount: float = 1.0) -> None:
+        self.values[labels] = self.values.get(labels, 0.0) + amount
+
+    def _merged(self, others: Sequence[Mapping[tuple[str, ...], Any]]) -> dict[tuple[str, ...], Any]:
+        merged = dict(self.values)
+        for values in others:
+            for labels, value in values.items():
+                merged[labels] = merged.get(labels, 0.0) + value
+        return merged
+
+    def _samples(self, out: list[str], values: Mapping[tuple[str, ...], Any]) -> None:
+        for labels, value in values.items():
+            out.append(f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}")
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, labels: tuple[str, ...], amount: float = 1.0) -> None:
+        self.values[labels] = self.values.get(labels, 0.0) - amount
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str], buckets: Sequence[float]):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(buckets)
+        # Per label set: one count per bucket plus the +Inf bucket, then sum.
+        self.values: dict[tuple[str, ...], list[float]] = {}
+
+    def observe(self, labels: tuple[str, ...], value: float) -> None:
+        series = self.values.get(labels)
+        if series is None:
+            series = self.values[labels] = [0.0] * (len(self.buckets) + 2)
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def _merged(self, others: Sequence[Mapping[tuple[str, ...], Any]]) -> dict[tuple[str, ...], Any]:
+        merged = {labels: list(series) for labels, series in self.values.items()}
+        for values in others:
+            for labels, series in values.items():
+                total = merged.get(labels)
+                if total is None:
+                    merged[labels] = list(series)
+                elif len(total) == len(series):
+                    merged[labels] = [a + b for a, b in zip(total, series)]
+        return merged
+
+    def _samples(self, out: list[str], values: Mapping[tuple[str, ...], Any]) -> None:
+        bounds = (*self.buckets, math.inf)
+        for labels, series in values.items():
+            cumulative = 0.0
+            for bound, count in zip(bounds, series):
+                cumulative += count
+                le = f'le="{_number(bound)}"'
+                out.append(f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {_number(cumulative)}")
+            out.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {_number(series[-1])}")
+            out.append(f"{self.name}_count{_labels(self.labelnames, labels)} {_number(cumulative)}")
+
+
+def _token_counts(usage: dict[str, Any]) -> tuple[int | None, int | None]:
+    """Return ``(prompt, completion)`` tokens from a chat or responses ``usage`` object."""
+    prompt = usage.get("prompt_tokens", usage.get("input_tokens"))
+    completion = usage.get("completion_tokens", usage.get("output_tokens"))
+    return (
+        prompt if isinstance(prompt, int) else None,
+        completion if isinstance(completion, int) else None,
+    )
+
+
+class Observation:
+    """Measurements of one proxied request; :meth:`finish` records them once."""
+
+    __slots__ = ("_metrics", "provider", "endpoint", "started", "first_token_at", "_finished")
+
+    def __init__(self, metrics: Metrics, provider: str, endpoint: str, request_bytes: int):
+        self._metrics = metrics
+        self.provider = provider
+        self.endpoint = endpoint
+        self.started = time.perf_counter()
+        self.first_token_at: float | None = None
+        self._finished = False
+        metrics.in_flight.inc((provider, endpoint))
+        metrics.request_bytes.observe((provider, endpoint), request_bytes)
+
+    def upstream_headers(self, seconds: float | None) -> None:
+        """Record the upstream time to first byte (response headers)."""
+        if seconds is not None:
+            self._metrics.ttfb.observe((self.provider, self.endpoint), seconds)
+
+    def first_token(self, at: float | None = None) -> None:
+        """Record the time to the first streamed token, seen at ``perf_counter()`` *at*."""
+        if self.first_token_at is None:
+            self.first_token_at = at if at is not None else time.perf_counter()
+            self._metrics.ttft.observe((self.provider, self.endpoint), self.first_token_at - self.started)
+
+    def finish(
+        self,
+        status: int,
+        response_bytes: int | None = None,
+        usage: dict[str, Any] | None = None,
+        finish_reason: str | None = None,
+    ) -> None:
+        if self._finished:
+            return
+        self._finished = True
+        m = self._metrics
+        elapsed = time.perf_counter() - self.started
+        base = (self.provider, self.endpoint)
+        labels = (self.provider, self.endpoint, str(status))
+        m.in_flight.dec(base)
+        m.requests.inc(labels)
+        m.latency.observe(labels, elapsed)
+        if response_bytes is not None:
+            m.response_bytes.observe(labels, response_bytes)
+        if finish_reason is not None:
+            m.finish_reasons.inc((*base, finish_reason))
+        if usage is None:
+            return
+        prompt, completion = _token_counts(usage)
+        if prompt is not None:
+            m.tokens.observe((*base, "prompt"), prompt)
+        if completion is not None:
+            m.tokens.observe((*base, "completion"), completion)
+            # Streams generate after the first token; other requests over their whole duration.
+            generating = elapsed if self.first_token_at is None else time.perf_counter() - self.first_token_at
+            if generating > 0:
+                m.tokens_per_second.observe(base, completion / generating)
+
+
+class Metrics:
+    """The proxy's request metrics."""
+
+    def __init__(self) -> None:
+        pe = ("provider", "endpoint")
+        pes = ("provider", "endpoint", "status")
+        self.requests = Counter("prompt_passage_requests_total", "Proxied requests.", pes)
+        self.in_flight = Gauge("prompt_passage_requests_in_flight", "Requests being served.", pe)
+        self.latency = Histogram(
+            "prompt_passage_request_duration_seconds", "Total time to serve a request.", pes, _LATENCY_BUCKETS
+        )
+        self.ttfb = Histogram(
+            "prompt_passage_upstream_ttfb_seconds",
+            "Time from sending a request upstream to its response headers.",
+            pe,
+            _LATENCY_BUCKETS,
+        )
+        self.ttft = Histogram(
+            "prompt_passage_stream_ttft_seconds", "Time to the first streamed token.", pe, _LATENCY_BUCKETS
+        )
+        self.request_bytes = Histogram(
+            "prompt_passage_request_size_bytes", "Size of request bodies from clients.", pe, _SIZE_BUCKETS
+        )
+        self.response_bytes = Histogram(
+            "prompt_passage_response_size_bytes", "Size of response bodies to clients.", pes, _SIZE_BUCKETS
+        )
+        self.tokens = Histogram(
+            "prompt_passage_tokens",
+            "Tokens reported in upstream usage.",
+            ("provider", "endpoint", "type"),
+            _TOKEN_BUCKETS,
+        )
+        self.tokens_per_second = Histogram(
+            "prompt_passage_completion_tokens_per_second", "Completion token throughput.", pe, _RATE_BUCKETS
+        )
+        self.finish_reasons = Counter(
+            "prompt_passage_finish_reasons_total",
+            "Streams by the finish reason they reported.",
+            ("provider", "endpoint", "reason"),
+        )
+        self.loop_lag = Histogram(
+            "prompt_passage_event_loop_lag_seconds",
+            "How late the event loop ran its periodic lag check.",
+            (),
+            _LAG_BUCKETS,
+        )
+        self.queue_depth = Gauge(
+            "prompt_passage_admission_queue_depth",
+            "Requests waiting for admission.",
+            ("provider", "priority"),
+        )
+        self.queue_wait = Histogram(
+            "prompt_passage_admission_wait_seconds",
+            "Time admitted requests waited for a slot.",
+            ("provider", "priority"),
+            _QUEUE_BUCKETS,
+        )
+        self._all: list[_Metric] = [
+            self.requests,
+            self.in_flight,
+            self.latency,
+            self.ttfb,
+            self.ttft,
+            self.request_bytes,
+            self.response_bytes,
+            self.tokens,
+            self.tokens_per_second,
+            self.finish_reasons,
+            self.loop_lag,
+            self.queue_depth,
+            self.queue_wait,
+        ]
+
+    def start(self, provider: str, route: str, request_bytes: int) -> Observation:
+        return Observation(self, provider, endpoint_label(route), request_bytes)
+
+    def snapshot(self) -> dict[str, dict[tuple[str, ...], Any]]:
+        """Return the current values of every metric, for other workers to add to theirs."""
+        return {metric.name: metric.values for metric in self._all}
+
+    def render(self, others: Sequence[Mapping[str, Mapping[tuple[str, ...], Any]]] = ()) -> str:
+        """Render the metrics in the text format, adding the snapshots of other workers."""
+        out: list[str] = []
+        for metric in self._all:
+            metric.render(out, [snapshot.get(metric.name, {}) for snapshot in others])
+        return "\n".join(out) + "\n"
+
+
+def retire(snapshots: Sequence[Mapping[str, Mapping[tuple[str, ...], Any]]]) -> dict[str, dict[tuple[str, ...], Any]]:
+    """Add up the final snapshots of workers that have exited.
+
+    Counters and histograms keep their totals, so the sums ``/metrics`` serves
+    never go down when a worker is replaced. Gauges are dropped: nothing an
+    exited worker held is in flight any more.
+    """
+    return {
+        metric.name: metric._merged([snapshot.get(metric.name, {}) for snapshot in snapshots])
+        for metric in Metrics()._all
+        if not isinstance(metric, Gauge)
+    }
@@ -0,0 +1,125 @@
+"""Running CPU-heavy body work off the event loop.
+
+Parsing, transforming and hashing a request body takes time proportional to
+its size, and on the event loop a multi-megabyte body stalls every other
+request and stream of the worker while it is processed. :class:`Offloader`
+moves that work off the loop once a body reaches ``min_bytes``; smaller bodies
+are handled inline, where the hop would cost more than the work itself.
+
+Where the work goes depends on whether it holds the GIL. ``hashlib``, ``zlib``
+and ``zstandard`` release it, so hashing and (de)compression run in a small
+thread pool. JSON parsing and encoding and jq programs hold it from start to
+finish, so in a thread they would stall the loop as long as they would inline.
+They run in a pool of worker processes instead (:meth:`Offloader.run_in_process`),
+which are sent the body as bytes and the transform as its configuration, and
+send back the prepared bytes and the few fields the proxy reads from the
+parsed body (see :func:`prepare_detached`).
+"""
+
+from __future__ import annotations
+
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, TypeVar
+
+from .body import PreparedBody, detach, prepare_request_body
+from .config import OffloadCfg, TransformOp, compile_transform
+
+T = TypeVar("T")
+
+# Forking a process that runs an event loop and threads is unsafe; the fork
+# server forks workers from a clean single-threaded process instead.
+_START_METHOD = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+
+
+def prepare_detached(
+    body: bytes,
+    model: str,
+    transform: str | list[TransformOp] | None,
+    canonical: bool,
+) -> PreparedBody:
+    """:func:`~.body.prepare_request_body` for a worker process.
+
+    *transform* is the provider's ``transform`` setting, compiled here since
+    compiled programs cannot be pickled. The result is :func:`~.body.detach`\\ ed.
+    """
+    return detach(prepare_request_body(body, model, compile_transform(transform)), canonical)
+
+
+class Offloader:
+    """Runs functions over large bodies in worker threads or processes, and small ones inline."""
+
+    def __init__(self, cfg: OffloadCfg):
+        self.cfg = cfg
+        self._threads: ThreadPoolExecutor | None = None
+        self._processes: ProcessPoolExecutor | None = None
+        self.offloaded = 0
+        self.in_processes = 0
+        self.inline = 0
+        self.running = 0
+
+    async def run(self, size: int, fn: Callable[..., T], *args: Any) -> T:
+        """Return ``fn(*args)``, computed in a thread when *size* reaches ``min_bytes``.
+
+        Only work that releases the GIL, like hashing and compression, belongs here.
+        """
+        if size < self.cfg.min_bytes:
+            self.inline += 1
+            return fn(*args)
+        return await self._in_thread(lambda: fn(*args))
+
+    async def run_in_process(self, size: int, fn: Callable[..., T], *args: Any) -> T:
+        """Like :meth:`run`, but in a worker process unless ``processes`` is 0.
+
+        For work that holds the GIL, like JSON parsing and encoding. *fn* must
+        be a module-level function, and *args* and the result picklable.
+        """
+        if size < self.cfg.min_bytes:
+            self.inline += 1
+            return fn(*args)
+        if not self.cfg.processes:
+            return await self._in_thread(lambda: fn(*args))
+        if self._processes is None:
+            # Created on first use: most deployments never see a body this large.
+            context = multiprocessing.get_context(_START_METHOD)
+            self._processes = ProcessPoolExecutor(self.cfg.processes, mp_context=context)
+        processes = self._processes
+        self.in_processes += 1
+        try:
+            # Submitted from a thread, since starting the pool's processes blocks.
+            return await self._in_thread(lambda: processes.submit(fn, *args).result())
+        except BrokenProcessPool:
+            # A worker died, e.g. killed for its memory use; start afresh next time.
+            if self._processes is processes:
+                self._processes = None
+            processes.shutdown(wait=False, cancel_futures=True)
+            raise
+
+    async def _in_thread(self, call: Callable[[], T]) -> T:
+        if self._threads is None:
+            self._threads = ThreadPoolExecutor(self.cfg.max_workers, thread_name_prefix="prompt-passage-body")
+        self.offloaded += 1
+        self.running += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._threads, call)
+        finally:
+            self.running -= 1
+
+    def shutdown(self) -> None:
+        if self._threads is not None:
+            self._threads.shutdown(wait=False, cancel_futures=True)
+            self._threads = None
+        if self._processes is not None:
+            self._processes.shutdown(wait=False, cancel_futures=True)
+            self._processes = None
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "min_bytes": self.cfg.min_bytes,
+            "offloaded": self.offloaded,
+            "in_processes": self.in_processes,
+            "inline": self.inline,
+            "running": self.running,
+        }
@@ -1,186 +1,918 @@
 from __future__ import annotations
 
-from typing import Dict, AsyncIterator
-from contextlib import asynccontextmanager
+import asyncio
+import math
+import os
+import signal
+import time
+from collections import Counter, defaultdict
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, AsyncIterator
+from contextlib import AbstractAsyncContextManager, asynccontextmanager
 
 import httpx
 import logging
-from uvicorn.logging import DefaultFormatter
-from fastapi import FastAPI, Request, Response, status
-from fastapi.responses import StreamingResponse
+from fastapi import APIRouter, FastAPI, Request, Response, status
+from fastapi.responses import JSONResponse, StreamingResponse
 from starlette.background import BackgroundTask
-import json
 
-from .config import load_config, ProviderCfg, default_config_path
-from .forwarder import Forwarder
-
-_handler = logging.StreamHandler()
-_handler.setFormatter(DefaultFormatter(fmt="%(levelprefix)s %(message)s", use_colors=True))
-_root = logging.getLogger()
-_root.handlers.clear()
-_root.addHandler(_handler)
-_root.setLevel(logging.INFO)
+from .admission import Overloaded, Permit
+from .balancer import Ticket
+from .breaker import CircuitOpenError
+from .body import PreparedBody, extract_usage, prepare_request_body
+from .cache import CachedResponse, DiskResponseCache, MemoryResponseCache, ResponseCache, is_deterministic
+from .cache import cache_key as response_cache_key
+from .coalesce import SingleFlight, coalesce_key
+from .compression import UnsupportedEncoding, decode, encode, negotiate
+from .compression import available as encoding_available
+from .config import load_config, DeploymentCfg, OffloadCfg, ProviderCfg, RootConfig, ServiceCfg, default_config_path
+from .forwarder import Forwarder, raw_content, upstream_ttfb
+from .hedge import hedged, read_first_byte
+from .logging_utils import body_sampled, configure_logging, log_body
+from .loop_monitor import LoopMonitor
+from .metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE
+from .metrics import Metrics, Observation
+from .offload import Offloader, prepare_detached
+from .ratelimit import RateLimitExceeded, Reservation, estimate_tokens
+from .reload import ConfigReloader
+from .retry import RetryBudget
+from .shared import SHARED_DIR_ENV, SharedState
+from .sse import StreamAccountant
+from .supervisor import SUPERVISOR_ENV
+from .state import ConfigChanges, ProxyState, build_state
+
+configure_logging()
 
 logger = logging.getLogger(__name__)
 
 
-def _pretty(data: bytes) -> str:
-    """Return a prettified string representation of *data* if it's JSON."""
-    try:
-        obj = json.loads(data.decode("utf-8"))
-    except Exception:
-        return data.decode("utf-8", errors="replace")
-    return json.dumps(obj, indent=2, ensure_ascii=False)
-
+def _make_lifespan(
+    config: RootConfig | None, config_path: Path | None
+) -> Callable[[FastAPI], AbstractAsyncContextManager[None]]:
+    @asynccontextmanager
+    async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+        # Startup
+        global _state, _fallbacks, _compression, _forwarder, _reloader  # noqa: PLW0603
+        global _response_cache, _single_flight, _metrics, _offloader, _loop_monitor, _shared  # noqa: PLW0603
+
+        started = time.perf_counter()
+        path = config_path if config_path is not None else default_config_path()
+        cfg = config if config is not None else load_config(path)
+        shared_dir = os.getenv(SHARED_DIR_ENV)
+        _shared = SharedState(shared_dir) if shared_dir else None
+        _metrics = Metrics()
+        _state, _ = build_state(cfg, bucket=_shared.bucket if _shared is not None else None, metrics=_metrics)
+        _fallbacks = defaultdict(Counter)
+        _compression = Counter()
+        service = _state.service
+        _forwarder = Forwarder(
+            _state.providers,
+            RetryBudget(service.retry_budget.ratio, service.retry_budget.min_per_second),
+            service.reload.drain_timeout,
+        )
+        _forwarder.start()
+        _response_cache = _build_response_cache(cfg)
+        _single_flight = SingleFlight()
+        _offloader = Offloader(service.offload)
+        _loop_monitor = LoopMonitor(service.loop_monitor, _metrics) if service.loop_monitor.enabled else None
+        if _loop_monitor is not None:
+            _loop_monitor.start()
+        _reloader = ConfigReloader(path, service.reload, _apply_config)
+        _reloader.start()
+        publisher = asyncio.create_task(_publish_metrics(_shared)) if _shared is not None else None
+
+        logger.info("Available providers:")
+        for name in _state.providers:
+            logger.info(f"  - {name}")
+        app.state.startup_seconds = time.perf_counter() - started
+
+        yield
+
+        # Shutdown
+        if publisher is not None:
+            publisher.cancel()
+            await asyncio.gather(publisher, return_exceptions=True)
+        await _reloader.stop()
+        if _loop_monitor is not None:
+            await _loop_monitor.stop()
+        _offloader.shutdown()
+        if _forwarder:
+            await _forwarder.aclose()
+        if _response_cache is not None:
+            _response_cache.close()
+        if _shared is not None:
+            # The supervisor folds this last snapshot into the retired totals.
+            _shared.publish(_metrics.snapshot())
+            _shared.close()
+            _shared = None
+
+    return lifespan
+
+
+async def _publish_metrics(shared: SharedState) -> None:
+    """Publish this worker's metrics for the others to serve from ``/metrics``."""
+    while True:
+        shared.publish(_metrics.snapshot())
+        await asyncio.sleep(_PUBLISH_INTERVAL)
+
+
+def _build_response_cache(cfg: RootConfig) -> ResponseCache | None:
+    if not any(p.cache is not None for p in cfg.providers.values()):
+        return None
+    settings = (cfg.service or ServiceCfg()).cache
+    memory = MemoryResponseCache(settings.max_bytes, settings.max_entry_bytes) if settings.memory else None
+    disk = None
+    if settings.disk is not None:
+        disk = DiskResponseCache(settings.disk.resolved_path, settings.disk.max_bytes, settings.max_entry_bytes)
+    if memory is None and disk is None:
+        return None
+    return ResponseCache(memory, disk)
+
+
+# Seconds between metrics snapshots published to the other workers.
+_PUBLISH_INTERVAL = 1.0
+
+# Service settings that are read once at startup; changing them needs a restart.
+_RESTART_ONLY = ("port", "cache", "offload", "loop_monitor", "reload")
+
+
+def _apply_config(cfg: RootConfig) -> ConfigChanges:
+    """Swap in a reloaded configuration.
+
+    Runs without awaiting, so requests see either the old state or the new one.
+    Requests already in flight finish on the state they started with.
+    """
+    global _state, _response_cache  # noqa: PLW0603
+    state, changes = build_state(cfg, _state, _shared.bucket if _shared is not None else None, _metrics)
+    old_service, service = _state.service, state.service
+    for name in _RESTART_ONLY:
+        if getattr(old_service, name) != getattr(service, name):
+            logger.warning("Reloaded service.%s takes effect after a restart", name)
+    assert _forwarder is not None
+    _forwarder.reconfigure(state.providers)
+    if service.retry_budget != old_service.retry_budget:
+        _forwarder.retry_budget = RetryBudget(service.retry_budget.ratio, service.retry_budget.min_per_second)
+    if _response_cache is None:
+        _response_cache = _build_response_cache(cfg)
+    _state = state
+    logger.info(
+        "Configuration reloaded: %d added, %d removed, %d changed, %d unchanged providers",
+        len(changes.added),
+        len(changes.removed),
+        len(changes.changed),
+        len(changes.unchanged),
+    )
+    return changes
+
+
+def create_app(config: RootConfig | None = None, config_path: str | Path | None = None) -> FastAPI:
+    """Build the proxy application.
+
+    When *config* is given it is used as-is, so a configuration parsed by the
+    CLI is not read and validated a second time; otherwise the config file is
+    loaded at startup. *config_path* (the default config file when omitted) is
+    also the file re-read on reload.
+    """
+    path = Path(config_path) if config_path is not None else None
+    application = FastAPI(title="Prompt Passage", version="1.0.0", lifespan=_make_lifespan(config, path))
+    application.include_router(router)
+    application.add_exception_handler(httpx.RequestError, _httpx_error)
+    application.add_exception_handler(CircuitOpenError, _circuit_open)
+    application.add_exception_handler(RateLimitExceeded, _rate_limited)
+    application.add_exception_handler(Overloaded, _overloaded)
+    return application
+
+
+_state = ProxyState()
+_fallbacks: Dict[str, Counter[str]] = defaultdict(Counter)
+_compression: Counter[str] = Counter()
+_forwarder: Forwarder | None = None
+_reloader: ConfigReloader | None = None
+_shared: SharedState | None = None
+_response_cache: ResponseCache | None = None
+_single_flight: SingleFlight[httpx.Response] = SingleFlight()
+_metrics = Metrics()
+_offloader = Offloader(OffloadCfg())
+_loop_monitor: LoopMonitor | None = None
+
+router = APIRouter()
+
+
+def _bearer_token(request: Request) -> str | None:
+    authorization = request.headers.get("Authorization", "")
+    return authorization[7:] if authorization.startswith("Bearer ") else None
+
+
+def _check_service_auth(request: Request, client_keys: bool = False) -> Response | None:
+    """Return a 401 response when service auth is enabled and *request* lacks a valid key.
+
+    With *client_keys* set, as on the provider routes, the client keys mapped
+    to priority classes in ``service.admission.keys`` are accepted besides the
+    service key. Admin and observability endpoints need the service key itself.
+    """
+    state = _state
+    if state.service_auth_key is not None:
+        token = _bearer_token(request)
+        admission = state.admission
+        if token != state.service_auth_key and (
+            not client_keys or admission is None or token not in admission.cfg.keys
+        ):
+            return Response(
+                content='{"error": "Unauthorized"}',
+                media_type="application/json",
+                status_code=status.HTTP_401_UNAUTHORIZED,
+            )
+    return None
+
+
+@router.get("/stats")
+async def stats(request: Request) -> Response:
+    denied = _check_service_auth(request)
+    if denied is not None:
+        return denied
+    state = _state
+    cache_stats = await asyncio.to_thread(_response_cache.stats) if _response_cache is not None else None
+    pool_stats = _forwarder.stats() if _forwarder is not None else {}
+    retry_stats = _forwarder.retry_budget.stats() if _forwarder is not None else None
+    return JSONResponse(
+        {
+            "cache": cache_stats,
+            "coalescing": _single_flight.stats(),
+            "pools": pool_stats,
+            "draining_pools": _forwarder.draining if _forwarder is not None else 0,
+            "retries": retry_stats,
+            "deployments": {name: balancer.stats() for name, balancer in state.balancers.items()},
+            "fallbacks": _fallbacks,
+            "compression": _compression,
+            "rate_limits": {name: limiter.stats() for name, limiter in state.limiters.items()},
+            "admission": state.admission.stats() if state.admission is not None else None,
+            "hedging": {name: policy.stats() for name, policy in state.hedges.items()},
+            "offload": _offloader.stats(),
+            "event_loop": _loop_monitor.stats() if _loop_monitor is not None else None,
+            "reload": _reloader.stats() if _reloader is not None else None,
+            "worker_pid": os.getpid(),
+        }
+    )
 
-@asynccontextmanager
-async def lifespan(app: FastAPI) -> AsyncIterator[None]:
-    # Startup
-    global _provider_map, _forwarder, _service_auth_key  # noqa: PLW0603
 
-    config_path = default_config_path()
-    cfg = load_config(config_path)
-    _provider_map = cfg.providers
-    _service_auth_key = cfg.service.auth.key if cfg.service and cfg.service.auth else None
-    _forwarder = Forwarder(_provider_map)
+@router.post("/admin/reload")
+async def reload_config(request: Request) -> Response:
+    """Re-read the configuration file and swap it in; an invalid file changes nothing.
 
-    logger.info("Available providers:")
-    for name, cfg in _provider_map.items():
-        logger.info(f"  - {name}")
+    Only available with service auth: without a service key there is no way
+    to tell the operator from any other client, so ``SIGHUP`` is the way to
+    reload then.
+    """
+    if _state.service_auth_key is None:
+        return JSONResponse(
+            {"error": "Reloading over HTTP needs service.auth; send SIGHUP instead"},
+            status_code=status.HTTP_403_FORBIDDEN,
+        )
+    denied = _check_service_auth(request)
+    if denied is not None:
+        return denied
+    if _reloader is None:
+        return JSONResponse({"error": "Reload unavailable"}, status_code=status.HTTP_503_SERVICE_UNAVAILABLE)
+    try:
+        changes: ConfigChanges = await _reloader.reload()
+        supervisor = os.environ.get(SUPERVISOR_ENV)
+        if supervisor and hasattr(signal, "SIGHUP"):
+            # This worker has reloaded; the supervisor's SIGHUP reloads the others.
+            os.kill(int(supervisor), signal.SIGHUP)
+    except Exception as exc:
+        # The details can quote the file, API keys included; they stay in the server log.
+        logger.error("Configuration reload failed; keeping the running configuration: %s", exc)
+        return JSONResponse(
+            {"error": "Invalid configuration; the running configuration was kept. See the server log."},
+            status_code=status.HTTP_400_BAD_REQUEST,
+        )
+    return JSONResponse({"providers": changes.as_dict()})
 
-    yield
 
-    # Shutdown
-    if _forwarder:
-        await _forwarder.aclose()
+@router.get("/metrics")
+async def metrics(request: Request) -> Response:
+    """Expose request metrics in the Prometheus text format."""
+    denied = _check_service_auth(request)
+    if denied is not None:
+        return denied
+    others = _shared.snapshots() if _shared is not None else []
+    return Response(content=_metrics.render(others), media_type=METRICS_CONTENT_TYPE)
 
 
-app = FastAPI(title="Prompt Passage", version="1.0.0", lifespan=lifespan)
+@router.get("/health")
+async def health(request: Request) -> Response:
+    """Report the circuit breaker state of every upstream host that has one.
 
-_provider_map: Dict[str, ProviderCfg] = {}
-_forwarder: Forwarder | None = None
-_service_auth_key: str | None = None
+    Anyone may read the overall status; the upstream hosts and their breakers
+    are only listed for the service key, as on ``/stats``.
+    """
+    upstreams = _forwarder.health() if _forwarder is not None else {}
+    degraded = any(u["state"] != "closed" for u in upstreams.values())
+    body: dict[str, Any] = {"status": "degraded" if degraded else "ok"}
+    if _check_service_auth(request) is None:
+        body["upstreams"] = upstreams
+    return JSONResponse(body)
 
 
-@app.post("/provider/{provider}")
+@router.post("/provider/{provider}")
 async def provider_root(provider: str, request: Request) -> Response:
     return await proxy_request(provider, request)
 
 
-@app.post("/provider/{provider}/{subpath:path}")
+@router.post("/provider/{provider}/{subpath:path}")
 async def provider_proxy(provider: str, subpath: str, request: Request) -> Response:
     return await proxy_request(provider, request)
 
 
 async def proxy_request(provider: str, request: Request) -> Response:
-    if _service_auth_key is not None:
-        if request.headers.get("Authorization") != f"Bearer {_service_auth_key}":
-            return Response(
-                content='{"error": "Unauthorized"}',
-                media_type="application/json",
-                status_code=status.HTTP_401_UNAUTHORIZED,
-            )
-    if provider not in _provider_map:
+    denied = _check_service_auth(request, client_keys=True)
+    if denied is not None:
+        return denied
+    state = _state
+    if provider not in state.providers:
         return Response(
             content='{"error": "Unknown provider"}',
             media_type="application/json",
             status_code=status.HTTP_404_NOT_FOUND,
         )
 
-    cfg = _provider_map[provider]
-
-    out_headers = {}
-    out_headers["Content-Type"] = "application/json"
-
-    token = cfg.token_provider.get_token()
-    if token:
-        out_headers["Authorization"] = f"Bearer {token}"
-
-    body_bytes = await request.body()
-    stream = False
-    if body_bytes:
+    cfg = state.providers[provider]
+    raw_body = await request.body()
+    content_encoding = request.headers.get("content-encoding")
+    if content_encoding:
         try:
-            # Override the model to match the config
-            body_json = json.loads(body_bytes.decode("utf-8"))
-            if "model" in body_json:
-                body_json["model"] = cfg.model
-            stream = bool(body_json.get("stream", False))
-            if cfg.transform is not None:
-                body_json = cfg.apply_transform(body_json)
-            body = json.dumps(body_json).encode("utf-8")
-        except json.JSONDecodeError:
-            body = body_bytes
-    else:
-        body = body_bytes
-
-    request_path = request.url.path
-    prefix = f"/provider/{provider}"
-    relative_path = request_path[len(prefix) :]
-    relative_path = relative_path.lstrip("/")
-    trimmed = relative_path.rstrip("/")
-
-    if not trimmed:
-        endpoint = cfg.chat_endpoint
-    elif trimmed.endswith("chat/completions"):
-        endpoint = cfg.chat_endpoint
-    elif trimmed.endswith("responses"):
-        endpoint = cfg.responses_endpoint
-    else:
-        endpoint = cfg.endpoints.join(relative_path)
-        if request.url.query:
-            endpoint = f"{endpoint}?{request.url.query}"
-
-    logger.info("Forwarding request to %s", endpoint)
-    logger.info("Outgoing body:\n%s", _pretty(body))
-
-    assert _forwarder is not None
+            raw_body = await _offloader.run(
+                len(raw_body), decode, raw_body, content_encoding, state.service.compression.max_request_bytes
+            )
+        except UnsupportedEncoding as exc:
+            return JSONResponse({"error": str(exc)}, status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE)
+        except ValueError as exc:
+            return JSONResponse({"error": str(exc)}, status_code=status.HTTP_400_BAD_REQUEST)
+        _compression["requests_decoded"] += 1
+    route = _route(provider, request)
+    if _loop_monitor is not None:
+        _loop_monitor.track(f"{provider}/{route} ({len(raw_body)} bytes)")
+
+    prepared = await _prepare(cfg, raw_body)
+    observation = _metrics.start(provider, route, len(raw_body))
+    cache_key = await _response_cache_key(provider, cfg, route, prepared, request, len(raw_body))
+    if cache_key is not None and "no-cache" not in request.headers.get("cache-control", ""):
+        assert _response_cache is not None
+        cached = await _response_cache.get(cache_key)
+        if cached is not None:
+            logger.info("Serving cached response for %s/%s", provider, route)
+            observation.finish(cached.status_code, len(cached.body))
+            return await _replay(cached, request)
+
+    # Cache hits are served above without taking a slot.
+    permit: Permit | None = None
     try:
-        if stream:
-            upstream = await _forwarder.stream(endpoint, body, out_headers)
-        else:
-            upstream = await _forwarder.forward(endpoint, body, out_headers)
-    except httpx.RequestError as exc:
-        logger.exception("Failed to reach upstream: %s", exc)
+        if state.admission is not None:
+            permit = await state.admission.admit(provider, _priority(state, request))
+
+        # Retryable failures move on to the next provider in the fallback chain,
+        # which applies its own model, transform and auth to the original body.
+        chain = [provider, *cfg.fallback]
+        for position, served in enumerate(chain):
+            served_cfg = state.providers[served]
+            if position:
+                prepared = await _prepare(served_cfg, raw_body)
+            last = position == len(chain) - 1
+
+            log_bodies = body_sampled(served_cfg.body_log)
+            if log_bodies:
+                log_body(served_cfg.body_log, "Outgoing body", prepared.content)
+
+            try:
+                upstream, ticket, reservation = await _dispatch(state, served, served_cfg, route, prepared)
+            except (httpx.RequestError, RateLimitExceeded) as exc:
+                if last:
+                    if isinstance(exc, httpx.RequestError) and not isinstance(exc, CircuitOpenError):
+                        logger.exception("Failed to reach upstream: %s", exc)
+                    raise
+                reason = type(exc).__name__
+            else:
+                if last or _upstream_ok(upstream.status_code):
+                    break
+                reason = str(upstream.status_code)
+                if ticket is not None:
+                    await _close_stream(upstream, ticket, ok=False, reservation=reservation)
+            logger.warning("Provider %s failed with %s; falling back to %s", served, reason, chain[position + 1])
+            _fallbacks[provider][chain[position + 1]] += 1
+    except BaseException as exc:
+        if permit is not None:
+            permit.release()
+        observation.finish(_error_status(exc))
         raise
 
+    observation.upstream_headers(upstream_ttfb(upstream))
+
+    stream = prepared.stream
+    served_header = (_PROVIDER_HEADER, served.encode("utf-8"))
+    # The key is the primary's; a fallback's answer must not be replayed as the primary's.
+    store_key = cache_key if served == provider else None
+
     if stream:
         logger.info("Streaming response with status %s", upstream.status_code)
 
-        async def _aiter() -> AsyncIterator[bytes]:
-            async for chunk in upstream.aiter_raw():
-                yield chunk
+        assert ticket is not None
+        headers = _relay_headers(upstream.headers, decoded=False)
+        headers.append(served_header)
+        capture = store_key is not None and upstream.status_code == 200
+
+        ok = _upstream_ok(upstream.status_code)
+
+        # Raw chunks are relayed, so compressed streams cannot be inspected.
+        accountant = StreamAccountant() if "content-encoding" not in upstream.headers else None
 
-        return StreamingResponse(
+        async def _aiter() -> AsyncIterator[bytes]:
+            captured: list[bytes] | None = [] if capture and _response_cache is not None else None
+            size = 0
+            first = True
+            try:
+                async for chunk in upstream.aiter_raw():
+                    if first:
+                        ticket.first_byte()
+                        first = False
+                    if accountant is not None:
+                        accountant.feed(chunk)
+                        if accountant.first_token_at is not None and observation.first_token_at is None:
+                            observation.first_token(accountant.first_token_at)
+                    size += len(chunk)
+                    if captured is not None:
+                        assert _response_cache is not None
+                        if size <= _response_cache.max_entry_bytes:
+                            captured.append(chunk)
+                        else:
+                            # Too large to cache: stop holding the stream in memory.
+                            captured = None
+                    yield chunk
+            except httpx.HTTPError:
+                ticket.done(ok=False)
+                raise
+            finally:
+                ticket.done(ok)
+                if permit is not None:
+                    permit.release()
+            usage = accountant.usage if accountant is not None else None
+            if usage is not None:
+                logger.info("Usage results: %s", usage)
+            elif accountant is not None and accountant.deltas:
+                logger.info("Stream reported no usage; %d token deltas", accountant.deltas)
+            if reservation is not None:
+                reservation.settle(_usage_tokens(usage) if ok else 0)
+            if accountant is not None:
+                observation.finish(upstream.status_code, size, accountant.reported_usage(), accountant.finish_reason)
+            else:
+                observation.finish(upstream.status_code, size)
+            if captured is not None and _response_cache is not None:
+                assert store_key is not None and cfg.cache is not None
+                entry = CachedResponse(200, tuple(headers), b"".join(captured), stream=True)
+                await _response_cache.put(store_key, entry, cfg.cache.ttl)
+
+        response = StreamingResponse(
             _aiter(),
             status_code=upstream.status_code,
-            headers=dict(upstream.headers),
-            media_type=upstream.headers.get("content-type"),
-            background=BackgroundTask(upstream.aclose),
+            background=BackgroundTask(_close_stream, upstream, ticket, ok, reservation, permit, observation),
         )
+        response.raw_headers = _with_cache_status(headers, cache_key, hit=False)
+        return response
     else:
-        resp_pretty = _pretty(upstream.content)
-        logger.info(
-            "Upstream response (%s):\n%s",
-            upstream.status_code,
-            resp_pretty,
-        )
-        try:
-            usage = json.loads(upstream.content.decode("utf-8")).get("usage")
-        except Exception:
-            usage = None
+        if permit is not None:
+            permit.release()
+        logger.info("Upstream response status %s", upstream.status_code)
+        content = upstream.content
+        if log_bodies:
+            log_body(served_cfg.body_log, "Upstream response", content)
+        usage = extract_usage(content)
         if usage is not None:
             logger.info("Usage results: %s", usage)
-
-        return Response(
-            content=upstream.content,
-            status_code=upstream.status_code,
-            headers=dict(upstream.headers),
-            media_type=upstream.headers.get("content-type"),
+        observation.finish(upstream.status_code, len(content), usage)
+
+        headers = _relay_headers(upstream.headers, decoded=True)
+        headers.append(served_header)
+        store = None
+        if store_key is not None and upstream.status_code == 200:
+            assert _response_cache is not None and cfg.cache is not None
+            entry = CachedResponse(200, tuple(headers), content, stream=False)
+            # Stored after the response is sent so disk writes never delay the client.
+            store = BackgroundTask(_response_cache.put, store_key, entry, cfg.cache.ttl)
+        relayed = await _encoded_response(
+            request, content, upstream.status_code, _with_cache_status(headers, cache_key, hit=False), upstream
+        )
+        relayed.background = store
+        return relayed
+
+
+async def _prepare(cfg: ProviderCfg, raw_body: bytes) -> PreparedBody:
+    """Override the model to match *cfg*; unchanged bodies are forwarded as-is.
+
+    Large bodies are parsed and transformed in an offload worker process.
+    """
+    prepared: PreparedBody
+    if len(raw_body) < _offloader.cfg.min_bytes:
+        # Handled inline, with the transform the provider compiled at load.
+        transform = cfg.apply_transform if cfg.transform is not None else None
+        prepared = await _offloader.run(len(raw_body), prepare_request_body, raw_body, cfg.model, transform)
+        return prepared
+    # The cache key is built from the canonical encoding, made while the parsed body is at hand.
+    canonical = _response_cache is not None and cfg.cache is not None
+    prepared = await _offloader.run_in_process(
+        len(raw_body), prepare_detached, raw_body, cfg.model, cfg.transform, canonical
+    )
+    return prepared
+
+
+async def _dispatch(
+    state: ProxyState,
+    provider: str,
+    cfg: ProviderCfg,
+    route: str,
+    prepared: PreparedBody,
+) -> tuple[httpx.Response, Ticket | None, Reservation | None]:
+    """Send *prepared* to one of the deployments of *provider*.
+
+    Streaming responses come back open, with the :class:`Ticket` and rate-limit
+    :class:`Reservation` to settle once they have been relayed. Other
+    responses are complete and already accounted.
+    """
+    forwarder = _forwarder
+    assert forwarder is not None
+    balancer = state.balancers[provider]
+    limiter = state.limiters.get(provider)
+    hedge = state.hedges.get(provider)
+    body = prepared.content
+    compress = cfg.request_compression
+    encoded: bytes | None = None
+    picked: list[DeploymentCfg] = []
+
+    def _eligible(deployment: DeploymentCfg) -> bool:
+        # A hedge goes to a deployment other than the one already tried.
+        return bool(forwarder.available(deployment.url(route))) and all(d is not deployment for d in picked)
+
+    def _can_hedge() -> bool:
+        return any(_eligible(d) for d in cfg.all_deployments)
+
+    async def _admit() -> Reservation | None:
+        if limiter is None:
+            return None
+        assert cfg.rate_limit is not None
+        reservation: Reservation = await limiter.acquire(
+            estimate_tokens(body, prepared.parsed, cfg.rate_limit.completion_tokens)
         )
+        return reservation
+
+    async def _post(
+        send: Callable[..., Awaitable[httpx.Response]], endpoint: str, out_headers: dict[str, str]
+    ) -> httpx.Response:
+        """Send the body compressed where configured; a 415 turns compression off for that upstream."""
+        nonlocal encoded
+        if compress is None or len(body) < compress.min_bytes or not forwarder.accepts_encoding(endpoint):
+            return await send(endpoint, body, out_headers, cfg.retry)
+        coding = compress.encoding
+        if encoded is None:
+            # Compressed once per request, however many attempts and hedges it takes.
+            level = state.service.compression.level(coding)
+            encoded = await _offloader.run(len(body), encode, body, coding, level)
+            _compression["upstream_requests_compressed"] += 1
+        resp = await send(endpoint, encoded, {**out_headers, "Content-Encoding": coding}, cfg.retry)
+        if resp.status_code != status.HTTP_415_UNSUPPORTED_MEDIA_TYPE:
+            return resp
+        logger.warning("Upstream %s rejected a %s request body; sending it uncompressed", endpoint, coding)
+        forwarder.refuse_encoding(endpoint)
+        await resp.aclose()
+        return await send(endpoint, body, out_headers, cfg.retry)
+
+    async def _target(deployment: DeploymentCfg) -> tuple[str, dict[str, str]]:
+        endpoint = deployment.url(route)
+        out_headers = {}
+        out_headers["Content-Type"] = "application/json"
+
+        token = await deployment.token_provider.get_token()
+        if token:
+            out_headers["Authorization"] = f"Bearer {token}"
+
+        logger.info("Forwarding request to %s", endpoint)
+        return endpoint, out_headers
+
+    async def _forward() -> httpx.Response:
+        reservation = await _admit()
+        ticket = balancer.pick(stream=False, available=_eligible)
+        picked.append(ticket.deployment)
+        try:
+            endpoint, out_headers = await _target(ticket.deployment)
+            resp: httpx.Response = await _post(forwarder.forward, endpoint, out_headers)
+        except BaseException as exc:
+            _release(ticket, reservation, exc)
+            raise
+        ticket.done(ok=_upstream_ok(resp.status_code))
+        if reservation is not None:
+            reservation.settle(_usage_tokens(extract_usage(resp.content)) if resp.status_code < 400 else 0)
+        return resp
+
+    async def _open() -> tuple[httpx.Response, Ticket, Reservation | None]:
+        reservation = await _admit()
+        ticket = balancer.pick(stream=True, available=_eligible)
+        picked.append(ticket.deployment)
+        upstream: httpx.Response | None = None
+        try:
+            endpoint, out_headers = await _target(ticket.deployment)
+            upstream = await _post(forwarder.stream, endpoint, out_headers)
+            if hedge is not None:
+                await read_first_byte(upstream)
+        except BaseException as exc:
+            _release(ticket, reservation, exc)
+            if upstream is not None:
+                await upstream.aclose()
+            raise
+        return upstream, ticket, reservation
+
+    async def _discard_stream(opened: tuple[httpx.Response, Ticket, Reservation | None]) -> None:
+        upstream, ticket, reservation = opened
+        _release(ticket, reservation, asyncio.CancelledError())
+        await upstream.aclose()
+
+    async def _discard_response(_: httpx.Response) -> None:
+        return None
+
+    async def _send() -> httpx.Response:
+        if hedge is None:
+            return await _forward()
+        resp: httpx.Response = await hedged(hedge, False, _forward, _can_hedge, _discard_response)
+        return resp
+
+    if prepared.stream:
+        if hedge is None:
+            return await _open()
+        opened: tuple[httpx.Response, Ticket, Reservation | None] = await hedged(
+            hedge, True, _open, _can_hedge, _discard_stream
+        )
+        return opened
+    if cfg.coalesce is not None:
+        key = await _offloader.run(len(body), coalesce_key, provider, route, body)
+        coalesced = await _single_flight.do(key, _send, cfg.coalesce.max_waiters)
+        return coalesced, None, None
+    return await _send(), None, None
+
+
+def _release(ticket: Ticket, reservation: Reservation | None, exc: BaseException) -> None:
+    """Account for an attempt that ended with *exc*; cancelled attempts are not failures."""
+    if isinstance(exc, asyncio.CancelledError):
+        ticket.abandon()
+    else:
+        ticket.done(ok=False)
+    if reservation is not None:
+        reservation.settle(0)
+
+
+def _usage_tokens(usage: dict[str, Any] | None) -> int | None:
+    """Return the total tokens in a ``usage`` object from either API flavour."""
+    if usage is None:
+        return None
+    total = usage.get("total_tokens")
+    if isinstance(total, int):
+        return total
+    parts = [usage.get(k) for k in ("prompt_tokens", "completion_tokens", "input_tokens", "output_tokens")]
+    counted = [p for p in parts if isinstance(p, int)]
+    return sum(counted) if counted else None
+
+
+def _route(provider: str, request: Request) -> str:
+    """Return the upstream route of *request*, independent of the deployment serving it.
+
+    Chat completions and responses calls map to the configured endpoints and
+    drop their query string; other paths are kept, with their query, relative
+    to ``base_url``.
+    """
+    relative_path = request.url.path[len(f"/provider/{provider}") :].lstrip("/")
+    trimmed = relative_path.rstrip("/")
+    if not trimmed or trimmed.endswith("chat/completions"):
+        return "chat/completions"
+    if trimmed.endswith("responses"):
+        return "responses"
+    if request.url.query:
+        return f"{relative_path}?{request.url.query}"
+    return relative_path
+
+
+def _priority(state: ProxyState, request: Request) -> str | None:
+    """Return the priority class requested by the client key or the priority header.
+
+    A client key mapped to a class wins over the header, so batch keys cannot
+    promote themselves.
+    """
+    assert state.admission is not None
+    cfg = state.admission.cfg
+    token = _bearer_token(request)
+    keyed: str | None = cfg.keys.get(token) if token is not None else None
+    return keyed or request.headers.get(cfg.header)
+
+
+def _error_status(exc: BaseException) -> int:
+    """Return the status the client sees for a request that failed with *exc*."""
+    if isinstance(exc, (CircuitOpenError, Overloaded)):
+        return status.HTTP_503_SERVICE_UNAVAILABLE
+    if isinstance(exc, RateLimitExceeded):
+        return status.HTTP_429_TOO_MANY_REQUESTS
+    if isinstance(exc, httpx.RequestError):
+        return status.HTTP_502_BAD_GATEWAY
+    if isinstance(exc, Exception):
+        return status.HTTP_500_INTERNAL_SERVER_ERROR
+    return 499  # cancelled: the client went away
+
+
+def _upstream_ok(status_code: int) -> bool:
+    """Return ``False`` for responses that count against a deployment's health."""
+    return status_code < 500 and status_code != 429
+
+
+async def _close_stream(
+    upstream: httpx.Response,
+    ticket: Ticket,
+    ok: bool,
+    reservation: Reservation | None = None,
+    permit: Permit | None = None,
+    observation: Observation | None = None,
+) -> None:
+    ticket.done(ok)
+    if reservation is not None and not ok:
+        reservation.settle(0)
+    if permit is not None:
+        permit.release()
+    if observation is not None:
+        # Streams the client abandoned are recorded here, without size or usage.
+        observation.finish(upstream.status_code)
+    await upstream.aclose()
+
+
+async def _response_cache_key(
+    provider: str,
+    cfg: ProviderCfg,
+    route: str,
+    prepared: PreparedBody,
+    request: Request,
+    size: int,
+) -> str | None:
+    """Return the cache key for this request, or ``None`` if it must not be cached."""
+    body = prepared.parsed
+    if _response_cache is None or cfg.cache is None or body is None:
+        return None
+    if cfg.cache.deterministic_only and not is_deterministic(body):
+        return None
+    if "no-store" in request.headers.get("cache-control", ""):
+        return None
+    canonical = prepared.canonical if prepared.canonical is not None else body
+    key: str = await _offloader.run(size, response_cache_key, provider, route, canonical)
+    return key
+
+
+_CACHE_HEADER = b"x-prompt-passage-cache"
+_PROVIDER_HEADER = b"x-prompt-passage-provider"
+
+
+def _with_cache_status(headers: list[tuple[bytes, bytes]], key: str | None, hit: bool) -> list[tuple[bytes, bytes]]:
+    if key is None:
+        return headers
+    return [*headers, (_CACHE_HEADER, b"hit" if hit else b"miss")]
+
+
+async def _replay(cached: CachedResponse, request: Request) -> Response:
+    """Rebuild a client response from a cache entry; streams are replayed as SSE events."""
+    headers = _with_cache_status(list(cached.headers), "", hit=True)
+    if not cached.stream:
+        return await _encoded_response(request, cached.body, cached.status_code, headers)
+
+    async def _events() -> AsyncIterator[bytes]:
+        body = cached.body
+        start = 0
+        while start < len(body):
+            end = body.find(b"\n\n", start)
+            end = len(body) if end == -1 else end + 2
+            yield body[start:end]
+            start = end
+
+    response = StreamingResponse(_events(), status_code=cached.status_code)
+    response.raw_headers = headers
+    return response
+
+
+# Hop-by-hop headers (RFC 9110 section 7.6.1) are never relayed.
+_HOP_BY_HOP = frozenset(
+    {
+        b"connection",
+        b"keep-alive",
+        b"proxy-connection",
+        b"te",
+        b"trailer",
+        b"transfer-encoding",
+        b"upgrade",
+    }
+)
+
+
+def _relay_headers(headers: httpx.Headers, decoded: bool) -> list[tuple[bytes, bytes]]:
+    """Return upstream *headers* as ASGI header pairs for the client response.
+
+    ``content-length`` is dropped and recomputed by the response. When the body
+    has been *decoded* by httpx, ``content-encoding`` no longer applies either.
+    """
+    skip_length = b"content-length"
+    skip_encoding = b"content-encoding" if decoded else b""
+    relayed = []
+    for key, value in headers.raw:
+        name = key.lower()
+        if name in _HOP_BY_HOP or name == skip_length or name == skip_encoding:
+            continue
+        relayed.append((name, value))
+    return relayed
+
+
+_VARY_ACCEPT_ENCODING = (b"vary", b"accept-encoding")
+
+
+async def _encoded_response(
+    request: Request,
+    content: bytes,
+    status_code: int,
+    headers: list[tuple[bytes, bytes]],
+    upstream: httpx.Response | None = None,
+) -> Response:
+    """Relay *content*, compressed when it is large and the client's ``Accept-Encoding`` allows it.
+
+    A body the upstream sent in a coding the client accepts is relayed as the
+    upstream encoded it, without decoding and re-encoding it.
+    """
+    accept = request.headers.get("accept-encoding", "")
+    raw = raw_content(upstream) if upstream is not None else None
+    if raw is not None and upstream is not None:
+        coding = upstream.headers["content-encoding"]
+        if negotiate(accept, [coding.strip().lower()]) is not None:
+            encoded = [*headers, (b"content-encoding", coding.encode("latin-1")), _VARY_ACCEPT_ENCODING]
+            _compression["responses_relayed_encoded"] += 1
+            return _RelayedResponse(raw, status_code, encoded)
+    cfg = _state.service.compression
+    if not cfg.responses or len(content) < cfg.min_bytes:
+        return _RelayedResponse(content, status_code, headers)
+    headers.append(_VARY_ACCEPT_ENCODING)
+    coding = negotiate(accept, [e for e in cfg.encodings if encoding_available(e)])
+    if coding is None:
+        return _RelayedResponse(content, status_code, headers)
+    # Compressed in the offload pool like large request bodies, off the event loop.
+    compressed: bytes = await _offloader.run(len(content), encode, content, coding, cfg.level(coding))
+    headers.append((b"content-encoding", coding.encode("latin-1")))
+    _compression["responses_compressed"] += 1
+    _compression["response_bytes_saved"] += len(content) - len(compressed)
+    return _RelayedResponse(compressed, status_code, headers)
+
+
+class _RelayedResponse(Response):
+    """A response that reuses the upstream body bytes and header pairs as-is."""
+
+    def __init__(self, content: bytes, status_code: int, raw_headers: list[tuple[bytes, bytes]]):
+        self.status_code = status_code
+        self.body = content
+        self.background = None
+        raw_headers.append((b"content-length", str(len(content)).encode("latin-1")))
+        self.raw_headers = raw_headers
+
+
+async def _rate_limited(_: Request, exc: Exception) -> Response:
+    """Return a local 429 with ``Retry-After`` when a provider's quota is used up."""
+    assert isinstance(exc, RateLimitExceeded)
+    logger.warning("Rejected request: %s", exc)
+    return Response(
+        content='{"error": "Rate limit exceeded"}',
+        media_type="application/json",
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        headers={"Retry-After": str(max(1, math.ceil(exc.retry_after)))},
+    )
+
+
+async def _circuit_open(_: Request, exc: Exception) -> Response:
+    """Return 503 with ``Retry-After`` when the upstream's circuit is open."""
+    assert isinstance(exc, CircuitOpenError)
+    logger.warning("Rejected request: %s", exc)
+    return Response(
+        content='{"error": "Upstream unavailable"}',
+        media_type="application/json",
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        headers={"Retry-After": str(math.ceil(exc.retry_after))},
+    )
+
+
+async def _overloaded(_: Request, exc: Exception) -> Response:
+    """Return 503 with ``Retry-After`` when admission control sheds a request."""
+    assert isinstance(exc, Overloaded)
+    logger.warning("Shed request: %s", exc)
+    return Response(
+        content='{"error": "Service overloaded"}',
+        media_type="application/json",
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        headers={"Retry-After": str(max(1, math.ceil(exc.retry_after)))},
+    )
 
 
-@app.exception_handler(httpx.RequestError)
-async def _httpx_error(_: Request, exc: httpx.RequestError) -> Response:
+async def _httpx_error(_: Request, exc: Exception) -> Response:
     """Return a generic 502 response on httpx failures."""
     logger.error("Upstream request error: %s", exc)
     return Response(
@@ -188,3 +920,6 @@ async def _httpx_error(_: Request, exc: httpx.RequestError) -> Response:
         media_type="application/json",
         status_code=status.HTTP_502_BAD_GATEWAY,
     )
+
+
+app = create_app()
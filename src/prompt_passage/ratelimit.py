@@ -0,0 +1,250 @@
+"""Proxy-side requests-per-minute and tokens-per-minute limits.
+
+Each rate-limited provider gets a :class:`RateLimiter` with a token bucket per
+configured quota. A bucket holds up to one minute of quota and refills
+continuously. The token cost of a request is not known until the upstream
+reports ``usage``, so the limiter takes an estimate up front (prompt size plus
+the requested completion limit) and the returned :class:`Reservation` settles
+the difference once the actual usage is known.
+
+Requests that do not fit wait in FIFO order for up to ``max_wait`` seconds;
+beyond that they fail with :class:`RateLimitExceeded`, which the proxy turns
+into a local 429.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import time
+from contextlib import AbstractContextManager, contextmanager
+from typing import Any, Callable, Iterator, Protocol
+
+from .config import RateLimitCfg
+
+# Rough bytes-per-token ratio of JSON chat payloads, used for the estimate.
+_BYTES_PER_TOKEN = 4
+_COMPLETION_LIMIT_KEYS = ("max_tokens", "max_completion_tokens", "max_output_tokens")
+
+
+def estimate_tokens(body: bytes, parsed: dict[str, Any] | None, completion_tokens: int) -> int:
+    """Estimate the tokens a request will be charged, the way Azure OpenAI does.
+
+    The prompt is approximated from the body size; the completion is the limit
+    the request asks for, or *completion_tokens* when it sets none.
+    """
+    estimate = len(body) // _BYTES_PER_TOKEN
+    if parsed is not None:
+        for key in _COMPLETION_LIMIT_KEYS:
+            limit = parsed.get(key)
+            if isinstance(limit, int) and limit > 0:
+                return estimate + limit
+    return estimate + completion_tokens
+
+
+class RateLimitExceeded(Exception):
+    """Raised when a request cannot be admitted within the allowed wait."""
+
+    def __init__(self, provider: str, retry_after: float):
+        super().__init__(f"Rate limit exceeded for {provider}")
+        self.provider = provider
+        self.retry_after = retry_after
+
+
+class BucketState(Protocol):
+    """Where a :class:`TokenBucket` keeps its level and last refill time.
+
+    :class:`LocalBucketState` keeps them in the process;
+    :mod:`prompt_passage.shared` keeps them in memory shared by the workers,
+    with :meth:`locked` holding a lock across processes.
+    """
+
+    def locked(self) -> AbstractContextManager[None]:
+        """Hold the state for a read-modify-write."""
+        ...
+
+    def load(self) -> tuple[float, float]:
+        """Return the level and the ``time.monotonic()`` of the last refill."""
+        ...
+
+    def store(self, level: float, updated: float) -> None: ...
+
+
+class LocalBucketState:
+    """:class:`BucketState` of a bucket used by this process only."""
+
+    def __init__(self, level: float):
+        self._level = level
+        self._updated = time.monotonic()
+
+    @contextmanager
+    def locked(self) -> Iterator[None]:
+        yield
+
+    def load(self) -> tuple[float, float]:
+        return self._level, self._updated
+
+    def store(self, level: float, updated: float) -> None:
+        self._level, self._updated = level, updated
+
+
+class TokenBucket:
+    """Bucket holding up to *per_minute* units, refilled at *per_minute* / 60 per second."""
+
+    def __init__(self, per_minute: int, state: BucketState | None = None):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self._state = state if state is not None else LocalBucketState(self.capacity)
+
+    @property
+    def level(self) -> float:
+        return self._state.load()[0]
+
+    @level.setter
+    def level(self, value: float) -> None:
+        with self._state.locked():
+            self._state.store(value, self._state.load()[1])
+
+    def _refilled(self) -> tuple[float, float]:
+        level, updated = self._state.load()
+        now = time.monotonic()
+        return min(self.capacity, level + (now - updated) * self.rate), now
+
+    def _wait(self, level: float, amount: float) -> float:
+        missing = min(amount, self.capacity) - level
+        return max(0.0, missing / self.rate)
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until *amount* (capped at the capacity) is available."""
+        with self._state.locked():
+            level, _ = self._refilled()
+        return self._wait(level, amount)
+
+    def try_take(self, amount: float) -> float:
+        """Take *amount* if it is available and return 0, else take nothing and return the wait.
+
+        The check and the take are one step under the state's lock, so two
+        workers sharing the bucket cannot both be granted the same units.
+        """
+        with self._state.locked():
+            level, now = self._refilled()
+            wait = self._wait(level, amount)
+            self._state.store(level - amount if wait == 0 else level, now)
+        return wait
+
+    def take(self, amount: float) -> None:
+        with self._state.locked():
+            level, now = self._refilled()
+            self._state.store(level - amount, now)
+
+    def give(self, amount: float) -> None:
+        """Return (or, when negative, charge) *amount* after the fact."""
+        with self._state.locked():
+            level, now = self._refilled()
+            self._state.store(min(self.capacity, level + amount), now)
+
+
+class Reservation:
+    """Tokens taken for one request; :meth:`settle` reconciles them with actual usage."""
+
+    __slots__ = ("_bucket", "estimate", "_settled")
+
+    def __init__(self, bucket: TokenBucket | None, estimate: int):
+        self._bucket = bucket
+        self.estimate = estimate
+        self._settled = False
+
+    def settle(self, actual: int | None) -> None:
+        """Correct the bucket by ``estimate - actual``; ``None`` keeps the estimate."""
+        if self._settled or actual is None:
+            return
+        self._settled = True
+        if self._bucket is not None:
+            self._bucket.give(self.estimate - actual)
+
+
+BucketFactory = Callable[[str, int], TokenBucket]
+
+
+def _local_bucket(_: str, per_minute: int) -> TokenBucket:
+    return TokenBucket(per_minute)
+
+
+class RateLimiter:
+    """RPM and TPM buckets for one provider, with a FIFO wait queue.
+
+    *bucket* creates a named bucket; with several workers it returns buckets
+    shared between them (see :mod:`prompt_passage.shared`).
+    """
+
+    def __init__(self, provider: str, cfg: RateLimitCfg, bucket: BucketFactory = _local_bucket):
+        self.provider = provider
+        self.cfg = cfg
+        self.requests = bucket(f"{provider}/rpm", cfg.rpm) if cfg.rpm is not None else None
+        self.tokens = bucket(f"{provider}/tpm", cfg.tpm) if cfg.tpm is not None else None
+        self._lock = asyncio.Lock()
+        self.admitted = 0
+        self.delayed = 0
+        self.rejected = 0
+        self.wait_seconds = 0.0
+
+    def _wait_time(self, estimate: int) -> float:
+        wait = 0.0
+        if self.requests is not None:
+            wait = self.requests.wait_time(1)
+        if self.tokens is not None:
+            wait = max(wait, self.tokens.wait_time(estimate))
+        return wait
+
+    def _try_take(self, estimate: int) -> float:
+        """Take one request and *estimate* tokens, or nothing; returns the wait when nothing was taken."""
+        if self.requests is not None:
+            wait = self.requests.try_take(1)
+            if wait > 0:
+                return wait
+        if self.tokens is not None:
+            wait = self.tokens.try_take(estimate)
+            if wait > 0:
+                if self.requests is not None:
+                    self.requests.give(1)
+                return wait
+        return 0.0
+
+    def _reject(self, estimate: int) -> RateLimitExceeded:
+        self.rejected += 1
+        return RateLimitExceeded(self.provider, self._wait_time(estimate))
+
+    async def acquire(self, estimate: int) -> Reservation:
+        """Take one request and *estimate* tokens, waiting up to ``max_wait`` for them."""
+        started = time.monotonic()
+        deadline = started + self.cfg.max_wait
+        if self._lock.locked() and self.cfg.max_wait == 0:
+            raise self._reject(estimate)
+        try:
+            await asyncio.wait_for(self._lock.acquire(), self.cfg.max_wait or None)
+        except TimeoutError:
+            raise self._reject(estimate) from None
+        try:
+            delayed = False
+            # Other workers may take from shared buckets while this one sleeps, so try again after.
+            while (wait := self._try_take(estimate)) > 0:
+                if time.monotonic() + wait > deadline:
+                    raise self._reject(estimate)
+                if not delayed:
+                    delayed = True
+                    self.delayed += 1
+                await asyncio.sleep(wait)
+        finally:
+            self._lock.release()
+        self.admitted += 1
+        self.wait_seconds += time.monotonic() - started
+        return Reservation(self.tokens, estimate)
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "admitted": self.admitted,
+            "delayed": self.delayed,
+            "rejected": self.rejected,
+            "wait_seconds": self.wait_seconds,
+            "requests_available": self.requests.level if self.requests is not None else None,
+            "tokens_available": self.tokens.level if self.tokens is not None else None,
+        }
@@ -0,0 +1,134 @@
+"""Reloading the configuration file while the proxy is serving.
+
+:class:`ConfigReloader` re-reads the file when the process gets ``SIGHUP``,
+when ``POST /admin/reload`` is called, or (with ``service.reload.watch``) when
+the file's modification time or size changes. The file is read and
+validated in a worker thread. An invalid file is rejected without touching
+the running configuration; a valid one is handed to the *apply* callback,
+which swaps it in.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import signal
+from pathlib import Path
+from typing import Any, Callable
+
+import yaml
+from pydantic import ValidationError
+
+from .config import RootConfig, ReloadCfg, load_config
+
+logger = logging.getLogger(__name__)
+
+
+def describe_error(exc: Exception) -> str:
+    """Describe why a configuration failed to load without quoting its values.
+
+    The file holds API keys, and validation and YAML errors echo the input
+    they choke on, so only locations and reasons are kept.
+    """
+    cause = exc.__cause__ if isinstance(exc.__cause__, ValidationError) else exc
+    if isinstance(cause, ValidationError):
+        errors = cause.errors(include_input=False, include_url=False)
+        return "; ".join(f"{'.'.join(str(part) for part in err['loc'])}: {err['msg']}" for err in errors)
+    if isinstance(exc, yaml.MarkedYAMLError) and exc.problem_mark is not None:
+        mark = exc.problem_mark
+        return f"Invalid YAML at line {mark.line + 1}, column {mark.column + 1}"
+    if isinstance(exc, (FileNotFoundError, PermissionError)):
+        return str(exc)
+    return type(exc).__name__
+
+
+def _signature(path: Path) -> tuple[int, int] | None:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+class ConfigReloader:
+    """Re-reads the configuration at *path* and passes it to *apply*."""
+
+    def __init__(self, path: Path, cfg: ReloadCfg, apply: Callable[[RootConfig], Any]):
+        self.path = path
+        self.cfg = cfg
+        self._apply = apply
+        self._lock = asyncio.Lock()
+        self._signature = _signature(path)
+        self._tasks: set[asyncio.Task[None]] = set()
+        self._signal = False
+        self.reloads = 0
+        self.failures = 0
+        self.last_error: str | None = None
+
+    async def reload(self) -> Any:
+        """Load and apply the file; raises (and keeps the running config) when it is invalid."""
+        async with self._lock:
+            signature = await asyncio.to_thread(_signature, self.path)
+            try:
+                cfg = await asyncio.to_thread(load_config, self.path)
+            except Exception as exc:
+                self.failures += 1
+                self.last_error = describe_error(exc)
+                raise
+            self._signature = signature
+            result = self._apply(cfg)
+            self.reloads += 1
+            self.last_error = None
+            return result
+
+    async def _reload_logged(self, trigger: str) -> None:
+        logger.info("Reloading configuration from %s (%s)", self.path, trigger)
+        try:
+            await self.reload()
+        except Exception as exc:
+            logger.error("Configuration reload failed; keeping the running configuration: %s", exc)
+
+    def _spawn(self, trigger: str) -> None:
+        task = asyncio.ensure_future(self._reload_logged(trigger))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _watch(self) -> None:
+        while True:
+            await asyncio.sleep(self.cfg.interval)
+            signature = await asyncio.to_thread(_signature, self.path)
+            if signature is not None and signature != self._signature and not self._lock.locked():
+                await self._reload_logged("file changed")
+                # A file that failed to load is not retried until it changes again.
+                self._signature = signature
+
+    def start(self) -> None:
+        """Install the ``SIGHUP`` handler and start the file watch; needs a running loop."""
+        loop = asyncio.get_running_loop()
+        try:
+            loop.add_signal_handler(signal.SIGHUP, self._spawn, "SIGHUP")
+            self._signal = True
+        except (AttributeError, NotImplementedError, RuntimeError, ValueError):
+            # No SIGHUP on Windows, and signal handlers need the main thread.
+            logger.debug("SIGHUP reload unavailable in this process")
+        if self.cfg.watch:
+            task = loop.create_task(self._watch())
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def stop(self) -> None:
+        if self._signal:
+            asyncio.get_running_loop().remove_signal_handler(signal.SIGHUP)
+            self._signal = False
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "path": str(self.path),
+            "reloads": self.reloads,
+            "failures": self.failures,
+            "last_error": self.last_error,
+        }
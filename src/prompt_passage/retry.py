@@ -0,0 +1,102 @@
+"""Retry policy for upstream calls.
+
+A provider's :class:`~prompt_passage.config.RetryCfg` says which responses and
+transport errors are retried and how long to back off between attempts. The
+proxy-wide :class:`RetryBudget` caps retries to a fraction of recent traffic so
+an overloaded upstream is not hit with a multiple of its normal load.
+"""
+
+from __future__ import annotations
+
+import random
+import time
+from collections import deque
+from email.utils import parsedate_to_datetime
+
+import httpx
+
+from .config import RetryCfg
+
+_ERRORS: dict[str, tuple[type[httpx.RequestError], ...]] = {
+    "connect": (httpx.ConnectError, httpx.ConnectTimeout),
+    "timeout": (httpx.TimeoutException,),
+    "protocol": (httpx.RemoteProtocolError,),
+}
+
+
+def is_retryable_error(policy: RetryCfg, exc: httpx.RequestError) -> bool:
+    """Return ``True`` when *exc* belongs to one of the policy's ``on_errors`` classes."""
+    return any(isinstance(exc, _ERRORS[name]) for name in policy.on_errors)
+
+
+def backoff(policy: RetryCfg, attempt: int) -> float:
+    """Return the delay before retry number *attempt* (0-based), with full jitter."""
+    ceiling = min(policy.backoff_max, policy.backoff_base * 2**attempt)
+    return random.uniform(0, ceiling)
+
+
+def retry_after(headers: httpx.Headers) -> float | None:
+    """Return the delay in seconds requested by the upstream, if any.
+
+    ``retry-after-ms`` (sent by Azure OpenAI) takes precedence over the
+    standard ``Retry-After``, which may be a number of seconds or an HTTP date.
+    """
+    value = headers.get("retry-after-ms")
+    if value is not None:
+        try:
+            return max(0.0, float(value) / 1000)
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class RetryBudget:
+    """Limit retries to ``ratio`` of the requests seen in the last ``window`` seconds.
+
+    A floor of ``min_per_second`` retries keeps retries possible at low traffic.
+    Counts are kept in one-second buckets.
+    """
+
+    def __init__(self, ratio: float, min_per_second: float, window: float = 10.0):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.window = window
+        self._buckets: deque[list[int]] = deque()  # [second, requests, retries]
+        self.retries = 0
+        self.exhausted = 0
+
+    def _bucket(self) -> list[int]:
+        now = int(time.monotonic())
+        while self._buckets and self._buckets[0][0] <= now - self.window:
+            self._buckets.popleft()
+        if not self._buckets or self._buckets[-1][0] != now:
+            self._buckets.append([now, 0, 0])
+        return self._buckets[-1]
+
+    def record_request(self) -> None:
+        self._bucket()[1] += 1
+
+    def try_spend(self) -> bool:
+        """Take one retry from the budget; return ``False`` when none is left."""
+        bucket = self._bucket()
+        requests = sum(b[1] for b in self._buckets)
+        retries = sum(b[2] for b in self._buckets)
+        if retries >= self.min_per_second * self.window + self.ratio * requests:
+            self.exhausted += 1
+            return False
+        bucket[2] += 1
+        self.retries += 1
+        return True
+
+    def stats(self) -> dict[str, int]:
+        return {"retries": self.retries, "budget_exhausted": self.exhausted}
@@ -0,0 +1,166 @@
+"""State shared by the worker processes of a multi-process proxy.
+
+With ``--workers N`` the supervisor (see :mod:`prompt_passage.supervisor`)
+creates a private directory on tmpfs (``/dev/shm`` where it exists) and names
+it in ``PROMPT_PASSAGE_SHARED_DIR``. Each worker opens it as a
+:class:`SharedState`:
+
+* ``buckets`` is a memory-mapped segment of rate-limit buckets. A bucket is a
+  slot holding its key's hash, level and last refill time. Every
+  read-modify-write holds an ``flock`` on the segment, so a provider's quota is
+  enforced across all workers rather than once per worker.
+* ``metrics-<pid>`` files hold each worker's latest metrics, rewritten every
+  second. ``/metrics`` adds the other workers' snapshots to its own live values.
+  When a worker exits, the supervisor folds its final snapshot into
+  ``metrics-retired`` so the totals of counters and histograms never drop.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import marshal
+import mmap
+import os
+import struct
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Iterator
+
+from .metrics import retire
+from .ratelimit import TokenBucket
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None  # type: ignore[assignment]
+
+SHARED_DIR_ENV = "PROMPT_PASSAGE_SHARED_DIR"
+
+_SLOT = struct.Struct("<Qdd")  # key hash, level, last refill (0.0 until initialised)
+_SLOTS = 4096
+_LEVEL = struct.Struct("<d")
+_SNAPSHOT_PREFIX = "metrics-"
+_RETIRED = f"{_SNAPSHOT_PREFIX}retired"
+
+
+def supported() -> bool:
+    """Return whether this platform can share state between workers (it needs ``flock``)."""
+    return fcntl is not None
+
+
+class SharedState:
+    """One worker's view of the shared directory."""
+
+    def __init__(self, directory: str | Path):
+        self.directory = Path(directory)
+        size = _SLOT.size * _SLOTS
+        self._fd = os.open(self.directory / "buckets", os.O_RDWR | os.O_CREAT, 0o600)
+        # Every worker extends the file to the same size, so a racing extend never loses data.
+        if os.fstat(self._fd).st_size < size:
+            os.ftruncate(self._fd, size)
+        self._map = mmap.mmap(self._fd, size)
+        self._snapshot = self.directory / f"{_SNAPSHOT_PREFIX}{os.getpid()}"
+
+    @contextmanager
+    def locked(self) -> Iterator[mmap.mmap]:
+        """Hold the cross-process lock on the bucket segment."""
+        assert fcntl is not None
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            yield self._map
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def _slot(self, key: str) -> int:
+        """Return the byte offset of the slot for *key*, claiming a free one if needed."""
+        ident = int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "little") or 1
+        with self.locked() as segment:
+            for index in range(_SLOTS):
+                offset = index * _SLOT.size
+                stored, _, _ = _SLOT.unpack_from(segment, offset)
+                if stored == ident:
+                    return offset
+                if stored == 0:
+                    _SLOT.pack_into(segment, offset, ident, 0.0, 0.0)
+                    return offset
+        raise RuntimeError("The shared rate-limit segment is full.")
+
+    def bucket(self, key: str, per_minute: int) -> TokenBucket:
+        """Return the bucket named *key*; a changed quota gets a fresh bucket."""
+        state = SharedBucketState(self, self._slot(f"{key}/{per_minute}"), per_minute)
+        return TokenBucket(per_minute, state)
+
+    def publish(self, snapshot: Any) -> None:
+        """Replace this worker's metrics snapshot."""
+        _write(self._snapshot, snapshot)
+
+    def snapshots(self) -> list[Any]:
+        """Return the latest metrics snapshots of the other workers, and the retired totals."""
+        out = []
+        for path in self.directory.glob(f"{_SNAPSHOT_PREFIX}*"):
+            if path == self._snapshot or path.suffix:
+                continue
+            try:
+                out.append(marshal.loads(path.read_bytes()))
+            except (OSError, EOFError, ValueError, TypeError):
+                continue  # the worker exited, or its file is being replaced
+        return out
+
+    def close(self) -> None:
+        self._map.close()
+        os.close(self._fd)
+
+
+def _write(path: Path, snapshot: Any) -> None:
+    tmp = path.with_suffix(".tmp")
+    tmp.write_bytes(marshal.dumps(snapshot))
+    os.replace(tmp, path)
+
+
+def _read(path: Path) -> Any:
+    try:
+        return marshal.loads(path.read_bytes())
+    except (OSError, EOFError, ValueError, TypeError):
+        return None
+
+
+def forget_worker(directory: str | Path, pid: int) -> None:
+    """Fold the final metrics of worker *pid*, once it has exited, into the retired totals.
+
+    Only the supervisor calls this, so the retired snapshot has one writer.
+    """
+    path = Path(directory) / f"{_SNAPSHOT_PREFIX}{pid}"
+    final = _read(path)
+    if final is not None:
+        retired_path = Path(directory) / _RETIRED
+        _write(retired_path, retire([_read(retired_path) or {}, final]))
+    try:
+        path.unlink()
+    except FileNotFoundError:
+        pass
+
+
+class SharedBucketState:
+    """A :class:`~.ratelimit.BucketState` kept in a slot of the shared segment, locked with its ``flock``."""
+
+    def __init__(self, shared: SharedState, offset: int, capacity: float):
+        self._shared = shared
+        self._level_at = offset + 8
+        self._updated_at = offset + 16
+        with self.locked():
+            if self.load()[1] == 0.0:
+                self.store(capacity, time.monotonic())
+
+    @contextmanager
+    def locked(self) -> Iterator[None]:
+        with self._shared.locked():
+            yield
+
+    def load(self) -> tuple[float, float]:
+        segment = self._shared._map
+        return _LEVEL.unpack_from(segment, self._level_at)[0], _LEVEL.unpack_from(segment, self._updated_at)[0]
+
+    def store(self, level: float, updated: float) -> None:
+        _LEVEL.pack_into(self._shared._map, self._level_at, level)
+        _LEVEL.pack_into(self._shared._map, self._updated_at, updated)
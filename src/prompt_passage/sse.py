@@ -0,0 +1,118 @@
+"""Incremental server-sent event accounting for relayed streams.
+
+:class:`StreamAccountant` is fed the raw chunks of a stream as they are relayed
+and frames them into events, however the upstream splits its writes. Events
+are never fully parsed: cheap byte scans find the ones that carry a token, a
+``finish_reason`` or a ``usage`` object, and only the (single) usage event is
+decoded. This works for chat completions chunks and for responses API events.
+
+When the upstream does not report usage (chat completions without
+``stream_options.include_usage``), :attr:`StreamAccountant.deltas` counts the
+token-bearing events instead, which is roughly one per token.
+"""
+
+from __future__ import annotations
+
+import re
+import time
+from typing import Any
+
+from .body import extract_usage
+
+# Keys whose non-empty string value is a generated fragment: chat content,
+# tool-call arguments or reasoning, or a responses API ``delta``.
+_TOKEN_KEYS = (b'"content"', b'"delta"', b'"arguments"', b'"reasoning_content"')
+_USAGE_KEY = b'"usage"'
+_FINISH_KEY = b'"finish_reason"'
+# Anchored at a key found with bytes.find, which is much faster than a regex scan.
+_STRING_VALUE = re.compile(rb'\s*:\s*"[^"]')
+_OBJECT_VALUE = re.compile(rb"\s*:\s*\{")
+_REASON_VALUE = re.compile(rb'\s*:\s*"([^"]+)"')
+# Terminal responses API events; the reason is the event name's suffix.
+_RESPONSE_DONE = (b"response.completed", b"response.incomplete", b"response.failed")
+
+
+def _has_token(data: bytes) -> bool:
+    for key in _TOKEN_KEYS:
+        pos = data.find(key)
+        while pos != -1:
+            if _STRING_VALUE.match(data, pos + len(key)) is not None:
+                return True
+            pos = data.find(key, pos + len(key))
+    return False
+
+
+class StreamAccountant:
+    """Frames SSE events across chunk boundaries and records what the stream reports."""
+
+    __slots__ = ("_partial", "_event", "_data", "events", "deltas", "first_token_at", "usage", "finish_reason", "done")
+
+    def __init__(self) -> None:
+        self._partial: list[bytes] = []
+        self._event = b""
+        self._data: list[bytes] = []
+        self.events = 0
+        self.deltas = 0
+        self.first_token_at: float | None = None
+        self.usage: dict[str, Any] | None = None
+        self.finish_reason: str | None = None
+        self.done = False
+
+    def feed(self, chunk: bytes) -> None:
+        """Account for *chunk*; an incomplete trailing line is kept for the next one."""
+        lines = chunk.split(b"\n")
+        if len(lines) == 1:
+            if chunk:
+                self._partial.append(chunk)
+            return
+        if self._partial:
+            self._partial.append(lines[0])
+            lines[0] = b"".join(self._partial)
+            self._partial.clear()
+        tail = lines.pop()
+        if tail:
+            self._partial.append(tail)
+        data = self._data
+        for line in lines:
+            if line.startswith(b"data:"):
+                data.append(line[6:] if line[5:6] == b" " else line[5:])
+            elif not line or line == b"\r":
+                if data:
+                    self._dispatch(b"\n".join(data) if len(data) > 1 else data[0])
+                    data.clear()
+                self._event = b""
+            elif line.startswith(b"event:"):
+                self._event = line[6:].strip()
+
+    def _dispatch(self, data: bytes) -> None:
+        self.events += 1
+        if data.endswith(b"\r"):
+            data = data.replace(b"\r\n", b"\n")[:-1]
+        if data == b"[DONE]":
+            self.done = True
+            return
+        if _has_token(data):
+            self.deltas += 1
+            if self.first_token_at is None:
+                self.first_token_at = time.perf_counter()
+        pos = data.rfind(_USAGE_KEY)
+        if pos != -1 and _OBJECT_VALUE.match(data, pos + len(_USAGE_KEY)) is not None:
+            usage = extract_usage(data)
+            if usage is not None:
+                self.usage = usage
+        if self._event in _RESPONSE_DONE:
+            self.finish_reason = self._event[9:].decode("ascii")
+            return
+        pos = data.find(_FINISH_KEY)
+        if pos != -1:
+            match = _REASON_VALUE.match(data, pos + len(_FINISH_KEY))
+            if match is not None:
+                self.finish_reason = match.group(1).decode("utf-8", "replace")
+
+    def reported_usage(self) -> dict[str, Any] | None:
+        """Return the upstream's ``usage``, or one built from the delta count when it sent none."""
+        if self.usage is not None:
+            return self.usage
+        if self.deltas:
+            return {"completion_tokens": self.deltas, "estimated": True}
+        return None
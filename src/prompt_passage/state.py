@@ -0,0 +1,126 @@
+"""Configuration-derived state of the proxy, swapped as a whole on reload.
+
+A :class:`ProxyState` holds the providers and the runtime objects built from
+them: balancers, rate limiters, hedge policies and admission control. A
+request reads the current state once and keeps using it, so a reload never
+shows a request a mix of old and new settings.
+
+:func:`build_state` carries the objects of every provider whose configuration
+did not change over from the previous state. Those providers keep their
+compiled transforms, token providers, load-balancing history and rate-limit
+buckets across a reload.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from typing import Any, Mapping
+
+from .admission import AdmissionController
+from .balancer import Balancer
+from .config import AdmissionCfg, ProviderCfg, RootConfig, ServiceCfg
+from .hedge import HedgePolicy
+from .metrics import Metrics
+from .ratelimit import BucketFactory, RateLimiter
+
+
+@dataclass(frozen=True)
+class ProxyState:
+    """Providers and their runtime objects for one version of the configuration."""
+
+    providers: Mapping[str, ProviderCfg] = field(default_factory=dict)
+    balancers: Mapping[str, Balancer] = field(default_factory=dict)
+    limiters: Mapping[str, RateLimiter] = field(default_factory=dict)
+    hedges: Mapping[str, HedgePolicy] = field(default_factory=dict)
+    admission: AdmissionController | None = None
+    service: ServiceCfg = field(default_factory=ServiceCfg)
+
+    @property
+    def service_auth_key(self) -> str | None:
+        return self.service.auth.key if self.service.auth else None
+
+
+@dataclass(frozen=True)
+class ConfigChanges:
+    """Provider names by how they differ from the previous configuration."""
+
+    added: list[str]
+    removed: list[str]
+    changed: list[str]
+    unchanged: list[str]
+
+    def as_dict(self) -> dict[str, Any]:
+        return {"added": self.added, "removed": self.removed, "changed": self.changed, "unchanged": self.unchanged}
+
+
+def _same_provider(old: ProviderCfg, new: ProviderCfg) -> bool:
+    # Private attributes (token providers, compiled transforms) never compare
+    # equal across parses, so only the configured fields are compared.
+    return bool(old.model_dump() == new.model_dump())
+
+
+def _build_admission(
+    admission: AdmissionCfg | None, providers: Mapping[str, ProviderCfg], metrics: Metrics | None
+) -> AdmissionController | None:
+    provider_limits = {name: p.max_concurrency for name, p in providers.items() if p.max_concurrency is not None}
+    if admission is None and not provider_limits:
+        return None
+    return AdmissionController(admission or AdmissionCfg(), provider_limits, metrics)
+
+
+def build_state(
+    cfg: RootConfig,
+    previous: ProxyState | None = None,
+    bucket: BucketFactory | None = None,
+    metrics: Metrics | None = None,
+) -> tuple[ProxyState, ConfigChanges]:
+    """Build the state for *cfg*, reusing what *previous* built for unchanged providers.
+
+    *bucket* creates the rate-limit buckets; see :class:`~prompt_passage.ratelimit.RateLimiter`.
+    Admission control records its queue in *metrics*.
+    """
+    old = previous if previous is not None else ProxyState()
+    providers: dict[str, ProviderCfg] = {}
+    balancers: dict[str, Balancer] = {}
+    limiters: dict[str, RateLimiter] = {}
+    hedges: dict[str, HedgePolicy] = {}
+    added: list[str] = []
+    changed: list[str] = []
+    unchanged: list[str] = []
+
+    for name, provider in cfg.providers.items():
+        current = old.providers.get(name)
+        if current is not None and _same_provider(current, provider):
+            unchanged.append(name)
+            providers[name] = current
+            balancers[name] = old.balancers[name]
+            if name in old.limiters:
+                limiters[name] = old.limiters[name]
+            if name in old.hedges:
+                hedges[name] = old.hedges[name]
+            continue
+        (changed if current is not None else added).append(name)
+        providers[name] = provider
+        balancers[name] = Balancer(provider.all_deployments, provider.balance)
+        if provider.rate_limit is not None:
+            limiters[name] = (
+                RateLimiter(name, provider.rate_limit, bucket)
+                if bucket is not None
+                else RateLimiter(name, provider.rate_limit)
+            )
+        if provider.hedge is not None:
+            hedges[name] = HedgePolicy(provider.hedge)
+
+    service = cfg.service or ServiceCfg()
+    # In-flight permits are released to the controller that granted them, so a
+    # new controller only replaces the old one when its limits changed.
+    limits = {name: p.max_concurrency for name, p in providers.items() if p.max_concurrency is not None}
+    old_limits = {name: p.max_concurrency for name, p in old.providers.items() if p.max_concurrency is not None}
+    if previous is not None and service.admission == old.service.admission and limits == old_limits:
+        admission = old.admission
+    else:
+        admission = _build_admission(service.admission, providers, metrics)
+
+    removed = [name for name in old.providers if name not in providers]
+    state = ProxyState(providers, balancers, limiters, hedges, admission, service)
+    return state, ConfigChanges(added, removed, changed, unchanged)
@@ -0,0 +1,152 @@
+"""Multi-process serving.
+
+Uvicorn can only start several workers when given an import string, not an
+app object. ``prompt-passage --workers N`` therefore runs this supervisor. It
+starts N worker processes that each import ``prompt_passage.proxy_app:app``
+and load the configuration file the CLI has already validated.
+
+On platforms with ``SO_REUSEPORT`` (Linux), every worker binds its own
+listening socket and the kernel spreads new connections evenly across them.
+Without it, one shared socket has workers race on ``accept``, which tends to
+pile connections onto a few workers. Elsewhere the workers are run by
+uvicorn's own multiprocess manager on a shared socket.
+
+The supervisor restarts workers that die, and forwards ``SIGHUP`` so every
+worker reloads its configuration. Its pid is in ``PROMPT_PASSAGE_SUPERVISOR``,
+so a worker serving ``POST /admin/reload`` can have the others reload too. It
+also creates the directory through which workers share rate-limit buckets and
+metrics (see :mod:`prompt_passage.shared`).
+"""
+
+from __future__ import annotations
+
+import logging
+import multiprocessing
+import os
+import shutil
+import signal
+import socket
+import sys
+import tempfile
+import threading
+import time
+from multiprocessing.process import BaseProcess
+from typing import Any
+
+import uvicorn
+
+from .shared import SHARED_DIR_ENV, forget_worker, supported
+
+logger = logging.getLogger(__name__)
+
+APP = "prompt_passage.proxy_app:app"
+SUPERVISOR_ENV = "PROMPT_PASSAGE_SUPERVISOR"
+_SHM = "/dev/shm"
+# A worker that exits sooner than this after starting is treated as a startup failure.
+_MIN_UPTIME = 5.0
+_STOP_TIMEOUT = 30.0
+
+
+def reuse_port_available() -> bool:
+    return sys.platform.startswith("linux") and hasattr(socket, "SO_REUSEPORT")
+
+
+def _listen(host: str, port: int) -> socket.socket:
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    return sock
+
+
+def _worker(uvicorn_kwargs: dict[str, Any]) -> None:
+    """Entry point of a worker process: serve the app on its own ``SO_REUSEPORT`` socket."""
+    sock = _listen(uvicorn_kwargs["host"], uvicorn_kwargs["port"])
+    server = uvicorn.Server(uvicorn.Config(APP, **uvicorn_kwargs))
+    server.run(sockets=[sock])
+
+
+def run_workers(workers: int, uvicorn_kwargs: dict[str, Any]) -> int:
+    """Serve with *workers* processes until interrupted; returns the exit status."""
+    shared_dir = None
+    if supported():
+        shared_dir = tempfile.mkdtemp(prefix="prompt-passage-", dir=_SHM if os.path.isdir(_SHM) else None)
+        os.environ[SHARED_DIR_ENV] = shared_dir
+    else:
+        logger.warning("Workers cannot share state on this platform; rate limits and metrics are per worker")
+    kwargs = {k: v for k, v in uvicorn_kwargs.items() if k != "workers"}
+    # Uvicorn's own manager answers SIGHUP by restarting its workers, which reloads them too.
+    os.environ[SUPERVISOR_ENV] = str(os.getpid())
+    try:
+        if not reuse_port_available():
+            uvicorn.run(APP, workers=workers, **kwargs)
+            return 0
+        return _Supervisor(workers, kwargs, shared_dir).run()
+    finally:
+        os.environ.pop(SHARED_DIR_ENV, None)
+        os.environ.pop(SUPERVISOR_ENV, None)
+        if shared_dir is not None:
+            shutil.rmtree(shared_dir, ignore_errors=True)
+
+
+class _Supervisor:
+    def __init__(self, workers: int, uvicorn_kwargs: dict[str, Any], shared_dir: str | None):
+        self.count = workers
+        self.uvicorn_kwargs = uvicorn_kwargs
+        self.shared_dir = shared_dir
+        self.context = multiprocessing.get_context("spawn")
+        self.workers: dict[int, tuple[BaseProcess, float]] = {}
+        self.stopping = threading.Event()
+
+    def _start(self, index: int) -> None:
+        process = self.context.Process(
+            target=_worker, args=(self.uvicorn_kwargs,), name=f"prompt-passage-worker-{index}"
+        )
+        process.start()
+        self.workers[index] = (process, time.monotonic())
+
+    def _signal(self, signum: int, _: Any) -> None:
+        if signum == signal.SIGHUP:
+            for process, _started in self.workers.values():
+                if process.pid is not None:
+                    os.kill(process.pid, signal.SIGHUP)
+            return
+        self.stopping.set()
+
+    def run(self) -> int:
+        for signum in (signal.SIGINT, signal.SIGTERM, signal.SIGHUP):
+            signal.signal(signum, self._signal)
+        logger.info("Starting %d workers on port %s", self.count, self.uvicorn_kwargs["port"])
+        for index in range(self.count):
+            self._start(index)
+        status = 0
+        try:
+            while not self.stopping.wait(0.5):
+                for index, (process, started) in list(self.workers.items()):
+                    if process.is_alive():
+                        continue
+                    if self.shared_dir is not None and process.pid is not None:
+                        forget_worker(self.shared_dir, process.pid)
+                    if time.monotonic() - started < _MIN_UPTIME:
+                        logger.error("Worker %d exited during startup (code %s); stopping", index, process.exitcode)
+                        status = 1
+                        self.stopping.set()
+                        break
+                    logger.warning("Worker %d exited with code %s; restarting", index, process.exitcode)
+                    self._start(index)
+        finally:
+            self._stop()
+        return status
+
+    def _stop(self) -> None:
+        for process, _started in self.workers.values():
+            if process.is_alive():
+                process.terminate()  # SIGTERM: uvicorn finishes in-flight requests first
+        deadline = time.monotonic() + _STOP_TIMEOUT
+        for process, _started in self.workers.values():
+            process.join(max(0.0, deadline - time.monotonic()))
+            if process.is_alive():
+                process.kill()
+                process.join()
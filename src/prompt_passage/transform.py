@@ -0,0 +1,179 @@
+"""Declarative request transforms compiled to plain dict operations.
+
+A provider's ``transform`` may be a list of steps instead of a jq expression::
+
+    transform:
+      - rename: {messages: input}
+      - delete: [frequency_penalty, logit_bias]
+      - default: {max_output_tokens: 1024}
+      - if: {has: response_format}
+        then:
+          - move: {response_format: text.format}
+
+:func:`compile_steps` turns the steps into a list of closures once, at config
+load, with every dotted path already split. Applying them edits the parsed
+body in place, without the JSON round trip through libjq that a jq program
+costs on every request.
+
+Writes create missing objects along their path, but never replace a value
+that is not an object: a ``set``, ``default`` or ``move`` whose path runs
+through one is skipped for that path and logged.
+"""
+
+from __future__ import annotations
+
+import copy
+import logging
+from typing import TYPE_CHECKING, Any, Callable, Sequence
+
+if TYPE_CHECKING:
+    from .config import TransformCondition, TransformOp
+
+logger = logging.getLogger(__name__)
+
+Body = dict[str, Any]
+Step = Callable[[Body], None]
+_MISSING = object()
+
+
+def _path(dotted: str) -> tuple[str, ...]:
+    return tuple(dotted.split("."))
+
+
+def _parent(body: Body, path: tuple[str, ...], create: bool) -> Body | None:
+    """Return the object holding the last key of *path*, or ``None`` if there is none.
+
+    With *create*, missing objects along the path are added; a value on the
+    path that is not an object is never replaced.
+    """
+    node = body
+    for key in path[:-1]:
+        child = node.get(key, _MISSING)
+        if child is _MISSING and create:
+            child = node[key] = {}
+        if not isinstance(child, dict):
+            return None
+        node = child
+    return node
+
+
+def _blocked(path: tuple[str, ...]) -> None:
+    logger.warning("Transform step skipped: '%s' runs through a value that is not an object", ".".join(path))
+
+
+def _get(body: Body, path: tuple[str, ...]) -> Any:
+    parent = _parent(body, path, create=False)
+    return _MISSING if parent is None else parent.get(path[-1], _MISSING)
+
+
+def _fresh(value: Any) -> Callable[[], Any]:
+    """Return a factory for *value*; containers are copied so requests never share them."""
+    if isinstance(value, (dict, list)):
+        return lambda: copy.deepcopy(value)
+    return lambda: value
+
+
+def _set_step(targets: dict[str, Any], only_missing: bool) -> Step:
+    compiled = [(_path(p), _fresh(v)) for p, v in targets.items()]
+
+    def step(body: Body) -> None:
+        for path, value in compiled:
+            parent = _parent(body, path, create=True)
+            if parent is None:
+                _blocked(path)
+                continue
+            if not only_missing or path[-1] not in parent:
+                parent[path[-1]] = value()
+
+    return step
+
+
+def _delete_step(paths: Sequence[str]) -> Step:
+    compiled = [_path(p) for p in paths]
+
+    def step(body: Body) -> None:
+        for path in compiled:
+            parent = _parent(body, path, create=False)
+            if parent is not None:
+                parent.pop(path[-1], None)
+
+    return step
+
+
+def _move_step(moves: dict[str, str]) -> Step:
+    compiled = [(_path(src), _path(dst)) for src, dst in moves.items()]
+
+    def step(body: Body) -> None:
+        for src, dst in compiled:
+            parent = _parent(body, src, create=False)
+            if parent is None or src[-1] not in parent:
+                continue
+            value = parent.pop(src[-1])
+            target = _parent(body, dst, create=True)
+            if target is None:
+                parent[src[-1]] = value  # left where it was
+                _blocked(dst)
+                continue
+            target[dst[-1]] = value
+
+    return step
+
+
+def _rename_step(renames: dict[str, str]) -> Step:
+    return _move_step({src: ".".join((*_path(src)[:-1], new)) for src, new in renames.items()})
+
+
+def _equals(path: tuple[str, ...], expected: Any) -> Callable[[Body], bool]:
+    return lambda body: _get(body, path) == expected
+
+
+def _condition(cond: TransformCondition) -> Callable[[Body], bool]:
+    checks: list[Callable[[Body], bool]] = []
+    if cond.has is not None:
+        has = _path(cond.has)
+        checks.append(lambda body: _get(body, has) is not _MISSING)
+    if cond.missing is not None:
+        missing = _path(cond.missing)
+        checks.append(lambda body: _get(body, missing) is _MISSING)
+    for dotted, expected in (cond.equals or {}).items():
+        checks.append(_equals(_path(dotted), expected))
+    return lambda body: all(check(body) for check in checks)
+
+
+def _if_step(op: TransformOp) -> Step:
+    assert op.if_ is not None
+    test = _condition(op.if_)
+    then = [_compile(o) for o in op.then]
+    otherwise = [_compile(o) for o in op.else_]
+
+    def step(body: Body) -> None:
+        for branch_step in then if test(body) else otherwise:
+            branch_step(body)
+
+    return step
+
+
+def _compile(op: TransformOp) -> Step:
+    if op.rename is not None:
+        return _rename_step(op.rename)
+    if op.delete is not None:
+        return _delete_step(op.delete)
+    if op.set is not None:
+        return _set_step(op.set, only_missing=False)
+    if op.default is not None:
+        return _set_step(op.default, only_missing=True)
+    if op.move is not None:
+        return _move_step(op.move)
+    return _if_step(op)
+
+
+def compile_steps(ops: Sequence[TransformOp]) -> Callable[[Body], Body]:
+    """Compile declarative transform *ops* into a function that edits a body in place."""
+    steps = [_compile(op) for op in ops]
+
+    def apply(body: Body) -> Body:
+        for step in steps:
+            step(body)
+        return body
+
+    return apply
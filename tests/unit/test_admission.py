@@ -0,0 +1,132 @@
+import asyncio
+
+import pytest
+
+from prompt_passage.admission import AdmissionController, Overloaded, Permit
+from prompt_passage.config import AdmissionCfg, PriorityClassCfg
+from prompt_passage.metrics import Metrics
+
+
+def _controller(**kwargs: object) -> AdmissionController:
+    cfg = AdmissionCfg.model_validate(
+        {
+            "max_concurrency": 1,
+            "classes": {
+                "interactive": {"weight": 3, "max_wait": 5},
+                "batch": {"weight": 1, "max_wait": 5},
+            },
+            **kwargs,
+        }
+    )
+    return AdmissionController(cfg, {})
+
+
+def test_weighted_fair_dequeue() -> None:
+    async def run() -> list[str]:
+        controller = _controller()
+        held = await controller.admit("p", "interactive")
+        order: list[str] = []
+
+        async def wait(lane: str) -> None:
+            permit = await controller.admit("p", lane)
+            order.append(lane)
+            await asyncio.sleep(0)
+            permit.release()
+
+        tasks = [asyncio.create_task(wait(lane)) for lane in ["batch"] * 4 + ["interactive"] * 4]
+        await asyncio.sleep(0)
+        held.release()
+        await asyncio.gather(*tasks)
+        return order
+
+    order = asyncio.run(run())
+    assert order[:4].count("interactive") == 3
+    assert order.count("batch") == 4
+
+
+def test_provider_limit_does_not_block_other_providers() -> None:
+    async def run() -> None:
+        cfg = AdmissionCfg()
+        controller = AdmissionController(cfg, {"slow": 1})
+        held = await controller.admit("slow", None)
+        waiting = asyncio.create_task(controller.admit("slow", None))
+        await asyncio.sleep(0)
+        other: Permit = await asyncio.wait_for(controller.admit("fast", None), 1)
+        assert controller.stats()["queued"] == 1
+        other.release()
+        held.release()
+        (await waiting).release()
+        assert controller.stats()["in_flight"] == 0
+
+    asyncio.run(run())
+
+
+def test_sheds_after_max_wait() -> None:
+    async def run() -> None:
+        cfg = AdmissionCfg(
+            max_concurrency=1,
+            classes={"interactive": PriorityClassCfg(max_wait=0.05)},
+            retry_after=2,
+        )
+        controller = AdmissionController(cfg, {})
+        held = await controller.admit("p", None)
+        with pytest.raises(Overloaded) as excinfo:
+            await controller.admit("p", None)
+        assert excinfo.value.retry_after == 2
+        stats = controller.stats()
+        assert stats["queued"] == 0
+        assert stats["classes"]["interactive"]["shed"] == 1
+        held.release()
+        assert stats["in_flight"] == 1 and controller.in_flight == 0
+
+    asyncio.run(run())
+
+
+def test_full_queue_sheds_immediately() -> None:
+    async def run() -> None:
+        controller = _controller(max_queue=0)
+        held = await controller.admit("p", "batch")
+        with pytest.raises(Overloaded):
+            await controller.admit("p", "batch")
+        held.release()
+        assert controller.stats()["classes"]["batch"]["shed"] == 1
+
+    asyncio.run(run())
+
+
+def test_unknown_class_uses_default() -> None:
+    controller = _controller()
+    assert controller.lane("nope").name == "interactive"
+    assert controller.lane(None).name == "interactive"
+
+
+def test_config_rejects_unknown_classes() -> None:
+    with pytest.raises(ValueError):
+        AdmissionCfg(default_class="missing")
+    with pytest.raises(ValueError):
+        AdmissionCfg(keys={"k": "missing"})
+
+
+def test_queue_depth_and_wait_are_exported() -> None:
+    metrics = Metrics()
+
+    async def run() -> None:
+        cfg = AdmissionCfg.model_validate(
+            {"max_concurrency": 1, "default_class": "batch", "classes": {"batch": {"max_wait": 0.05}}}
+        )
+        controller = AdmissionController(cfg, {}, metrics)
+        held = await controller.admit("p", "batch")
+        waiting = asyncio.create_task(controller.admit("p", "batch"))
+        await asyncio.sleep(0)
+        assert 'prompt_passage_admission_queue_depth{provider="p",priority="batch"} 1' in metrics.render()
+        held.release()
+        (await waiting).release()
+        held = await controller.admit("p", "batch")
+        with pytest.raises(Overloaded):
+            await controller.admit("p", "batch")
+        held.release()
+
+    asyncio.run(run())
+    text = metrics.render()
+    assert 'prompt_passage_admission_queue_depth{provider="p",priority="batch"} 0' in text
+    assert 'prompt_passage_admission_wait_seconds_count{provider="p",priority="batch"} 3' in text
@@ -1,5 +1,11 @@
+import gzip
 from pathlib import Path
 import importlib
+import os
+import signal
+import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 import typing
 import httpx
 import json
@@ -98,6 +104,23 @@ def create_config_transform(tmp_path: Path) -> Path:
     return cfg_file
 
 
+@pytest.fixture()
+def create_config_cache(tmp_path: Path) -> Path:
+    cfg_file = tmp_path / ".prompt-passage.yaml"
+    cfg_data = {
+        "providers": {
+            "test-model": {
+                "endpoints": {"base_url": "https://mock.upstream"},
+                "model": "remote-model",
+                "auth": {"type": "apikey", "key": "k"},
+                "cache": {"ttl": 60},
+            }
+        }
+    }
+    cfg_file.write_text(yaml.dump(cfg_data))
+    return cfg_file
+
+
 def test_chat_proxy_success(monkeypatch: pytest.MonkeyPatch, create_config: Path, httpx_mock: HTTPXMock) -> None:
     monkeypatch.setenv("HOME", str(create_config.parent))
     monkeypatch.setenv("TEST_API_KEY_ENV", "secret-token")
@@ -120,6 +143,30 @@ def test_chat_proxy_success(monkeypatch: pytest.MonkeyPatch, create_config: Path
     assert sent["model"] == "remote-model"
 
 
+def test_chat_proxy_relays_headers(monkeypatch: pytest.MonkeyPatch, create_config: Path, httpx_mock: HTTPXMock) -> None:
+    monkeypatch.setenv("HOME", str(create_config.parent))
+    monkeypatch.setenv("TEST_API_KEY_ENV", "secret-token")
+
+    proxy_app = importlib.import_module("prompt_passage.proxy_app")
+
+    httpx_mock.add_response(
+        url="https://mock.upstream/chat/completions",
+        json={"ok": True, "usage": {"total_tokens": 3}},
+        headers={"x-request-id": "abc", "connection": "keep-alive"},
+    )
+
+    with TestClient(proxy_app.app) as client:
+        resp = client.post(
+            "/provider/test-model/chat/completions",
+            json={"messages": [{"role": "user", "content": "hi"}], "model": "local-model"},
+        )
+        assert resp.status_code == 200
+        assert resp.headers["x-request-id"] == "abc"
+        assert resp.headers["content-type"] == "application/json"
+        assert int(resp.headers["content-length"]) == len(resp.content)
+        assert "connection" not in resp.headers
+
+
 def test_chat_proxy_upstream_error(monkeypatch: pytest.MonkeyPatch, create_config: Path, httpx_mock: HTTPXMock) -> None:
     monkeypatch.setenv("HOME", str(create_config.parent))
     monkeypatch.setenv("TEST_API_KEY_ENV", "token")
@@ -128,6 +175,8 @@ def test_chat_proxy_upstream_error(monkeypatch: pytest.MonkeyPatch, create_confi
 
     import httpx
 
+    # Connect errors are retried once by default.
+    httpx_mock.add_exception(httpx.ConnectError("boom"))
     httpx_mock.add_exception(httpx.ConnectError("boom"))
 
     with TestClient(proxy_app.app) as client:
@@ -142,7 +191,7 @@ def test_chat_proxy_upstream_error(monkeypatch: pytest.MonkeyPatch, create_confi
 def test_chat_proxy_azure(monkeypatch: pytest.MonkeyPatch, create_config_azure: Path, httpx_mock: HTTPXMock) -> None:
     monkeypatch.setenv("HOME", str(create_config_azure.parent))
 
-    token_obj = type("Tok", (), {"token": "cli-token"})()
+    token_obj = type("Tok", (), {"token": "cli-token", "expires_on": time.time() + 3600})()
 
     class DummyCred:
         def get_token(self, scope: str) -> object:
@@ -150,7 +199,7 @@ def test_chat_proxy_azure(monkeypatch: pytest.MonkeyPatch, create_config_azure:
             return token_obj
 
     proxy_app = importlib.import_module("prompt_passage.proxy_app")
-    monkeypatch.setattr("prompt_passage.auth_providers.DefaultAzureCredential", lambda: DummyCred())
+    monkeypatch.setattr("azure.identity.DefaultAzureCredential", lambda: DummyCred())
 
     httpx_mock.add_response(url="https://mock.upstream/chat/completions", json={"ok": True})
 
@@ -264,6 +313,8 @@ def test_chat_proxy_stream_upstream_error(
 
     proxy_app = importlib.import_module("prompt_passage.proxy_app")
 
+    # Connect errors are retried once by default.
+    httpx_mock.add_exception(httpx.ConnectError("fail"))
     httpx_mock.add_exception(httpx.ConnectError("fail"))
 
     with TestClient(proxy_app.app) as client:
@@ -421,3 +472,718 @@ def test_service_auth_invalid(monkeypatch: pytest.MonkeyPatch, create_config_ser
         )
         assert resp.status_code == 401
         assert resp.json() == {"error": "Unauthorized"}
+
+
+def test_health_lists_upstreams_only_with_the_service_key(
+    monkeypatch: pytest.MonkeyPatch, create_config_service_auth: Path
+) -> None:
+    monkeypatch.setenv("HOME", str(create_config_service_auth.parent))
+    monkeypatch.setenv("TEST_API_KEY_ENV", "tok")
+
+    proxy_app = importlib.import_module("prompt_passage.proxy_app")
+
+    with TestClient(proxy_app.app) as client:
+        anonymous = client.get("/health")
+        authorized = client.get("/health", headers={"Authorization": "Bearer svc-key"})
+
+    assert anonymous.status_code == 200
+    assert anonymous.json() == {"status": "ok"}
+    assert "upstreams" in authorized.json()
+
+
+def test_response_cache_hit(monkeypatch: pytest.MonkeyPatch, create_config_cache: Path, httpx_mock: HTTPXMock) -> None:
+    monkeypatch.setenv("HOME", str(create_config_cache.parent))
+
+    proxy_app = importlib.import_module("prompt_passage.proxy_app")
+    httpx_mock.add_response(url="https://mock.upstream/chat/completions", json={"n": 1})
+    httpx_mock.add_response(url="https://mock.upstream/chat/completions", json={"n": 2})
+    httpx_mock.add_response(url="https://mock.upstream/chat/completions", json={"n": 3})
+
+    body = {"model": "local-model", "temperature": 0, "messages": [{"role": "user", "content": "hi"}]}
+    with TestClient(proxy_app.app) as client:
+        first = client.post("/provider/test-model/chat/completions", json=body)
+        second = client.post("/provider/test-model/chat/completions", json=dict(reversed(body.items())))
+        bypass = client.post("/provider/test-model/chat/completions", json=body, headers={"Cache-Control": "no-cache"})
+        warm = client.post("/provider/test-model/chat/completions", json={**body, "temperature": 1})
+        stats = client.get("/stats").json()["cache"]["memory"]
+
+    assert first.headers["x-prompt-passage-cache"] == "miss"
+    assert second.headers["x-prompt-passage-cache"] == "hit"
+    assert second.json() == {"n": 1}
+    assert bypass.json() == {"n": 2}
+    assert "x-prompt-passage-cache" not in warm.headers
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+    assert len(httpx_mock.get_requests()) == 3
+
+
+def test_response_cache_replays_stream(
+    monkeypatch: pytest.MonkeyPatch, create_config_cache: Path, httpx_mock: HTTPXMock
+) -> None:
+    monkeypatch.setenv("HOME", str(create_config_cache.parent))
+
+    proxy_app = importlib.import_module("prompt_passage.proxy_app")
+
+    async def gen() -> typing.AsyncIterator[bytes]:
+        yield b'data: {"id":1}\n\ndata: {"id":'
+        yield b"2}\n\ndata: [DONE]\n\n"
+
+    httpx_mock.add_response(
+        url="https://mock.upstream/chat/completions",
+        headers={"content-type": "text/event-stream"},
+        stream=GeneratorStream(gen()),
+    )
+
+    body = {"model": "m", "seed": 1, "stream": True, "messages": []}
+    with TestClient(proxy_app.app) as client:
+        with client.stream("POST", "/provider/test-model/chat/completions", json=body) as resp:
+            first = b"".join(resp.iter_bytes())
+        with client.stream("POST", "/provider/test-model/chat/completions", json=body) as resp:
+            assert resp.headers["x-prompt-passage-cache"] == "hit"
+            assert resp.headers["content-type"] == "text/event-stream"
+            chunks = list(resp.iter_bytes())
+
+    assert b"".join(chunks) == first
+    assert len(httpx_mock.get_requests()) == 1
+
+
+def test_response_cache_skips_streams_over_max_entry_bytes(
+    monkeypatch: pytest.MonkeyPatch, create_config_cache: Path, httpx_mock: HTTPXMock
+) -> None:
+    monkeypatch.setenv("HOME", str(create_config_cache.parent))
+
+    proxy_app = importlib.import_module("prompt_passage.proxy_app")
+
+    async def gen() -> typing.AsyncIterator[bytes]:
+        yield b'data: {"id":1}\n\n'
+        yield b'data: {"id":2}\n\ndata: [DONE]\n\n'
+
+    for _ in range(2):
+        httpx_mock.add_response(
+            url="https://mock.upstream/chat/completions",
+            headers={"content-type": "text/event-stream"},
+            stream=GeneratorStream(gen()),
+        )
+
+    body = {"model": "m", "seed": 1, "stream": True, "messages": []}
+    with TestClient(proxy_app.app) as client:
+        monkeypatch.setattr(proxy_app._response_cache, "max_entry_bytes", 20)  # only the first chunk fits
+        with client.stream("POST", "/provider/test-model/chat/completions", json=body) as resp:
+            first = b"".join(resp.iter_bytes())
+        with client.stream("POST", "/provider/test-model/chat/completions", json=body) as resp:
+            assert resp.headers["x-prompt-passage-cache"] == "miss"
+            assert b"".join(resp.iter_bytes()) == first
+
+    assert first.endswith(b"data: [DONE]\n\n")
+    assert len(httpx_mock.get_requests()) == 2
+
+
+def test_disk_cache_survives_restart(monkeypatch: pytest.MonkeyPatch, tmp_path: Path, httpx_mock: HTTPXMock) -> None:
+    cfg_file = tmp_path / ".prompt-passage.yaml"
+    cfg_data = {
+        "service": {"cache": {"memory": False, "disk": {"path": str(tmp_path / "cache.db")}}},
+        "providers": {
+            "test-model": {
+                "endpoints": {"base_url": "https://mock.upstream"},
+                "model": "remote-model",
+                "auth": {"type": "apikey", "key": "k"},
+                "cache": {"ttl": 60},
+            }
+        },
+    }
+    cfg_file.write_text(yaml.dump(cfg_data))
+    monkeypatch.setenv("HOME", str(tmp_path))
+
+    proxy_app = importlib.import_module("prompt_passage.proxy_app")
+    httpx_mock.add_response(url="https://mock.upstream/chat/completions", json={"n": 1})
+
+    body = {"model": "m", "temperature": 0, "messages": [{"role": "user", "content": "hi"}]}
+    with TestClient(proxy_app.app) as client:
+        assert client.post("/provider/test-model/chat/completions", json=body).json() == {"n": 1}
+
+    with TestClient(proxy_app.app) as client:
+        resp = client.post("/provider/test-model/chat/completions", json=body)
+        assert resp.headers["x-prompt-passage-cache"] == "hit"
+        assert resp.json() == {"n": 1}
+        assert client.get("/stats").json()["cache"]["disk"]["hits"] == 1
+
+    assert len(httpx_mock.get_requests()) == 1
+
+
+def test_deployments_are_balanced(monkeypatch: pytest.MonkeyPatch, tmp_path: Path, httpx_mock: HTTPXMock) -> None:
+    cfg_file = tmp_path / ".prompt-passage.yaml"
+    cfg_data = {
+        "providers": {
+            "multi": {
+                "model": "remote-model",
+                "auth": {"type": "apikey", "key": "east-key"},
+                "deployments": [
+                    {"name": "east", "endpoints": {"base_url": "https://east.upstream"}},
+                    {
+                        "name": "west",
+                        "endpoints": {"base_url": "https://west.upstream"},
+                        "auth": {"type": "apikey", "key": "west-key"},
+                    },
+                ],
+            }
+        }
+    }
+    cfg_file.write_text(yaml.dump(cfg_data))
+    monkeypatch.setenv("HOME", str(tmp_path))
+    httpx_mock.add_response(url="https://east.upstream/chat/completions", json={"ok": "east"}, is_reusable=True)
+    httpx_mock.add_response(url="https://west.upstream/chat/completions", json={"ok": "west"}, is_reusable=True)
+
+    proxy_app = importlib.import_module("prompt_passage.proxy_app")
+    with TestClient(proxy_app.app) as client:
+        served = {client.post("/provider/multi/chat/completions", json={"model": "x"}).json()["ok"] for _ in range(40)}
+        deployments = client.get("/stats").json()["deployments"]["multi"]
+
+    assert served == {"east", "west"}
+    assert [d["name"] for d in deployments] == ["east", "west"]
+    assert sum(d["requests"] for d in deployments) == 40
+    assert all(d["outstanding"] == 0 for d in deployments)
+    for req in httpx_mock.get_requests():
+        expected = "east-key" if req.url.host == "east.upstream" else "west-key"
+        assert req.headers["Authorization"] == f"Bearer {expected}"
+
+
+@pytest.fixture()
+def create_config_fallback(tmp_path: Path) -> Path:
+    cfg_file = tmp_path / ".prompt-passage.yaml"
+    cfg_data = {
+        "providers": {
+            "primary": {
+                "endpoints": {"base_url": "https://primary.upstream"},
+                "model": "primary-model",
+                "auth": {"type": "apikey", "key": "primary-key"},
+                "retry": {"max_retries": 0},
+                "fallback": ["secondary"],
+            },
+            "secondary": {
+                "endpoints": {"base_url": "https://secondary.upstream"},
+                "model": "secondary-model",
+                "auth": {"type": "apikey", "key": "secondary-key"},
+            },
+        }
+    }
+    cfg_file.write_text(yaml.dump(cfg_data))
+    return cfg_file
+
+
+def test_fallback_on_429(monkeypatch: pytest.MonkeyPatch, create_config_fallback: Path, httpx_mock: HTTPXMock) -> None:
+    monkeypatch.setenv("HOME", str(create_config_fallback.parent))
+    httpx_mock.add_response(url="https://primary.upstream/chat/completions", status_code=429)
+    httpx_mock.add_response(url="https://secondary.upstream/chat/completions", json={"ok": True})
+
+    proxy_app = importlib.import_module("prompt_passage.proxy_app")
+    with TestClient(proxy_app.app) as client:
+        resp = client.post("/provider/primary/chat/completions", json={"model": "x", "messages": []})
+        fallbacks = client.get("/stats").json()["fallbacks"]
+
+    assert resp.status_code == 200
+    assert resp.headers["x-prompt-passage-provider"] == "secondary"
+    assert fallbacks == {"primary": {"secondary": 1}}
+    sent = httpx_mock.get_requests()[1]
+    assert sent.headers["Authorization"] == "Bearer secondary-key"
+    assert json.loads(sent.content)["model"] == "secondary-model"
+
+
+def test_fallback_responses_are_not_cached_for_the_primary(
+    monkeypatch: pytest.MonkeyPatch, create_config_fallback: Path, httpx_mock: HTTPXMock
+) -> None:
+    cfg_data = yaml.safe_load(create_config_fallback.read_text())
+    cfg_data["providers"]["primary"]["cache"] = {"ttl": 60}
+    create_config_fallback.write_text(yaml.dump(cfg_data))
+    monkeypatch.setenv("HOME", str(create_config_fallback.parent))
+    httpx_mock.add_response(url="https://primary.upstream/chat/completions", status_code=503)
+    httpx_mock.add_response(url="https://secondary.upstream/chat/completions", json={"from": "secondary"})
+    httpx_mock.add_response(url="https://primary.upstream/chat/completions", json={"from": "primary"})
+
+    body = {"model": "x", "temperature": 0, "messages": []}
+    proxy_app = importlib.import_module("prompt_passage.proxy_app")
+    with TestClient(proxy_app.app) as client:
+        first = client.post("/provider/primary/chat/completions", json=body)
+        second = client.post("/provider/primary/chat/completions", json=body)
+        third = client.post("/provider/primary/chat/completions", json=body)
+
+    assert first.json() == {"from": "secondary"}
+    assert second.json() == {"from": "primary"}
+    assert second.headers["x-prompt-passage-cache"] == "miss"
+    assert third.headers["x-prompt-passage-cache"] == "hit"
+    assert third.json() == {"from": "primary"}
+
+
+def test_stream_fallback_on_connect_error(
+    monkeypatch: pytest.MonkeyPatch, create_config_fallback: Path, httpx_mock: HTTPXMock
+) -> None:
+    monkeypatch.setenv("HOME", str(create_config_fallback.parent))
+    httpx_mock.add_exception(httpx.ConnectError("down"), url="https://primary.upstream/chat/completions")
+    httpx_mock.add_response(
+        url="https://secondary.upstream/chat/completions",
+        headers={"content-type": "text/event-stream"},
+        content=b"data: 1\n\n",
+    )
+
+    proxy_app = importlib.import_module("prompt_passage.proxy_app")
+    with TestClient(proxy_app.app) as client:
+        with client.stream("POST", "/provider/primary/chat/completions", json={"model": "x", "stream": True}) as resp:
+            body = b"".join(resp.iter_bytes())
+
+    assert resp.headers["x-prompt-passage-provider"] == "secondary"
+    assert body == b"data: 1\n\n"
+
+
+def test_last_fallback_failure_is_relayed(
+    monkeypatch: pytest.MonkeyPatch, create_config_fallback: Path, httpx_mock: HTTPXMock
+) -> None:
+    monkeypatch.setenv("HOME", str(create_config_fallback.parent))
+    httpx_mock.add_response(url="https://primary.upstream/chat/completions", status_code=503)
+    httpx_mock.add_response(url="https://secondary.upstream/chat/completions", status_code=503, is_reusable=True)
+
+    proxy_app = importlib.import_module("prompt_passage.proxy_app")
+    with TestClient(proxy_app.app) as client:
+        resp = client.post("/provider/primary/chat/completions", json={"model": "x"})
+
+    assert resp.status_code == 503
+    assert resp.headers["x-prompt-passage-provider"] == "secondary"
+
+
+def test_open_circuit_returns_503(monkeypatch: pytest.MonkeyPatch, tmp_path: Path, httpx_mock: HTTPXMock) -> None:
+    cfg_file = tmp_path / ".prompt-passage.yaml"
+    cfg_data = {
+        "providers": {
+            "flaky": {
+                "endpoints": {"base_url": "https://flaky.upstream"},
+                "model": "m",
+                "auth": {"type": "apikey", "key": "k"},
+                "retry": {"max_retries": 0},
+                "circuit_breaker": {"window": 2, "min_calls": 2, "open_seconds": 30},
+            }
+        }
+    }
+    cfg_file.write_text(yaml.dump(cfg_data))
+    monkeypatch.setenv("HOME", str(tmp_path))
+    httpx_mock.add_response(url="https://flaky.upstream/chat/completions", status_code=500, is_reusable=True)
+
+    proxy_app = importlib.import_module("prompt_passage.proxy_app")
+    with TestClient(proxy_app.app) as client:
+        assert client.get("/health").json() == {
+            "status": "ok",
+            "upstreams": {
+                "https://flaky.upstream": {
+                    "state": "closed",
+                    "calls": 0,
+                    "failure_rate": 0.0,
+                    "opened": 0,
+                    "rejected": 0,
+                }
+            },
+        }
+        for _ in range(2):
+            assert client.post("/provider/flaky/chat/completions", json={}).status_code == 500
+        resp = client.post("/provider/flaky/chat/completions", json={})
+        health = client.get("/health").json()
+
+    assert resp.status_code == 503
+    assert 29 <= int(resp.headers["Retry-After"]) <= 30
+    assert health["status"] == "degraded"
+    assert health["upstreams"]["https://flaky.upstream"]["state"] == "open"
+    assert len(httpx_mock.get_requests()) == 2
+
+
+@pytest.fixture()
+def create_config_rate_limited(tmp_path: Path) -> Path:
+    cfg_file = tmp_path / ".prompt-passage.yaml"
+    cfg_data = {
+        "providers": {
+            "limited": {
+                "endpoints": {"base_url": "https://mock.upstream"},
+                "model": "m",
+                "auth": {"type": "apikey", "key": "k"},
+                "rate_limit": {"rpm": 2, "tpm": 600},
+            }
+        }
+    }
+    cfg_file.write_text(yaml.dump(cfg_data))
+    return cfg_file
+
+
+def test_rate_limit_returns_local_429(
+    monkeypatch: pytest.MonkeyPatch, create_config_rate_limited: Path, httpx_mock: HTTPXMock
+) -> None:
+    monkeypatch.setenv("HOME", str(create_config_rate_limited.parent))
+    httpx_mock.add_response(json={"usage": {"total_tokens": 30}}, is_reusable=True)
+
+    proxy_app = importlib.import_module("prompt_passage.proxy_app")
+    with TestClient(proxy_app.app) as client:
+        statuses = [client.post("/provider/limited/chat/completions", json={"max_tokens": 100}) for _ in range(3)]
+        limits = client.get("/stats").json()["rate_limits"]["limited"]
+
+    assert [r.status_code for r in statuses] == [200, 200, 429]
+    assert int(statuses[2].headers["Retry-After"]) >= 1
+    assert len(httpx_mock.get_requests()) == 2
+    assert limits["admitted"] == 2 and limits["rejected"] == 1
+    # Both estimates were replaced by the reported 30 tokens.
+    assert limits["tokens_available"] == pytest.approx(600 - 60, abs=3)
+
+
+def test_rate_limit_settles_stream_usage(
+    monkeypatch: pytest.MonkeyPatch, create_config_rate_limited: Path, httpx_mock: HTTPXMock
+) -> None:
+    monkeypatch.setenv("HOME", str(create_config_rate_limited.parent))
+    httpx_mock.add_response(
+        headers={"content-type": "text/event-stream"},
+        content=b'data: {"choices":[]}\n\ndata: {"choices":[],"usage":{"total_tokens":12}}\n\ndata: [DONE]\n\n',
+    )
+
+    proxy_app = importlib.import_module("prompt_passage.proxy_app")
+    with TestClient(proxy_app.app) as client:
+        with client.stream("POST", "/provider/limited/chat/completions", json={"stream": True}) as resp:
+            b"".join(resp.iter_bytes())
+        limits = client.get("/stats").json()["rate_limits"]["limited"]
+
+    assert limits["tokens_available"] == pytest.approx(600 - 12, abs=3)
+
+
+@pytest.fixture()
+def create_config_admission(tmp_path: Path) -> Path:
+    cfg_file = tmp_path / ".prompt-passage.yaml"
+    cfg_data = {
+        "service": {
+            "auth": {"type": "apikey", "key": "svc-key"},
+            "admission": {
+                "classes": {"interactive": {"weight": 4, "max_wait": 0.05}, "batch": {"max_wait": 5}},
+                "keys": {"batch-key": "batch"},
+                "retry_after": 3,
+            },
+        },
+        "providers": {
+            "busy": {
+                "endpoints": {"base_url": "https://mock.upstream"},
+                "model": "m",
+                "auth": {"type": "apikey", "key": "k"},
+                "max_concurrency": 1,
+            }
+        },
+    }
+    cfg_file.write_text(yaml.dump(cfg_data))
+    return cfg_file
+
+
+def test_admission_sheds_and_queues_by_class(
+    monkeypatch: pytest.MonkeyPatch, create_config_admission: Path, httpx_mock: HTTPXMock
+) -> None:
+    monkeypatch.setenv("HOME", str(create_config_admission.parent))
+
+    async def slow(request: httpx.Request) -> httpx.Response:
+        await asyncio.sleep(0.3)
+        return httpx.Response(200, json={"ok": True})
+
+    httpx_mock.add_callback(slow, is_reusable=True)
+
+    proxy_app = importlib.import_module("prompt_passage.proxy_app")
+    with TestClient(proxy_app.app) as client:
+
+        def post(key: str) -> httpx.Response:
+            return client.post("/provider/busy/chat/completions", json={}, headers={"Authorization": f"Bearer {key}"})
+
+        with ThreadPoolExecutor(3) as pool:
+            first = pool.submit(post, "svc-key")
+            time.sleep(0.1)
+            shed = pool.submit(post, "svc-key")
+            queued = pool.submit(post, "batch-key")
+            results = [first.result(), shed.result(), queued.result()]
+        denied = client.get("/stats", headers={"Authorization": "Bearer batch-key"})
+        admission = client.get("/stats", headers={"Authorization": "Bearer svc-key"}).json()["admission"]
+
+    assert [r.status_code for r in results] == [200, 503, 200]
+    assert results[1].headers["Retry-After"] == "3"
+    assert denied.status_code == 401  # client keys only open the provider routes
+    assert admission["in_flight"] == 0
+    assert admission["classes"]["interactive"]["shed"] == 1
+    assert admission["classes"]["batch"]["admitted"] == 1
+    assert admission["classes"]["batch"]["wait_ms_max"] > 0
+
+
+def test_metrics_endpoint(monkeypatch: pytest.MonkeyPatch, create_config: Path, httpx_mock: HTTPXMock) -> None:
+    monkeypatch.setenv("HOME", str(create_config.parent))
+    monkeypatch.setenv("TEST_API_KEY_ENV", "dummy")
+    httpx_mock.add_response(json={"usage": {"prompt_tokens": 5, "completion_tokens": 7, "total_tokens": 12}})
+    httpx_mock.add_response(
+        headers={"content-type": "text/event-stream"},
+        content=b'data: {"choices":[{"delta":{"content":"hi"},"finish_reason":"stop"}]}\n\ndata: [DONE]\n\n',
+    )
+    httpx_mock.add_exception(httpx.ConnectError("down"), is_reusable=True)
+
+    proxy_app = importlib.import_module("prompt_passage.proxy_app")
+    with TestClient(proxy_app.app) as client:
+        client.post("/provider/test-model/chat/completions", json={})
+        with client.stream("POST", "/provider/test-model/chat/completions", json={"stream": True}) as resp:
+            b"".join(resp.iter_bytes())
+        client.post("/provider/test-model/responses", json={})
+        metrics = client.get("/metrics")
+
+    assert metrics.headers["content-type"].startswith("text/plain; version=0.0.4")
+    text = metrics.text
+    chat = 'provider="test-model",endpoint="chat/completions"'
+    assert f'prompt_passage_requests_total{{{chat},status="200"}} 2' in text
+    assert 'prompt_passage_requests_total{provider="test-model",endpoint="responses",status="502"} 1' in text
+    assert f"prompt_passage_requests_in_flight{{{chat}}} 0" in text
+    assert f"prompt_passage_stream_ttft_seconds_count{{{chat}}} 1" in text
+    assert f'prompt_passage_tokens_sum{{{chat},type="completion"}} 8' in text
+    assert f'prompt_passage_finish_reasons_total{{{chat},reason="stop"}} 1' in text
+
+
+def test_hedged_stream_uses_first_byte(monkeypatch: pytest.MonkeyPatch, tmp_path: Path, httpx_mock: HTTPXMock) -> None:
+    cfg_file = tmp_path / ".prompt-passage.yaml"
+    cfg_data = {
+        "providers": {
+            "hedged": {
+                "model": "m",
+                "auth": {"type": "apikey", "key": "k"},
+                # The slow deployment is (almost) always picked first.
+                "deployments": [
+                    {"name": "slow", "endpoints": {"base_url": "https://slow.upstream"}, "weight": 1000000},
+                    {"name": "fast", "endpoints": {"base_url": "https://fast.upstream"}, "weight": 0.001},
+                ],
+                "hedge": {"delay": 0.05, "max_ratio": 1.0},
+            }
+        }
+    }
+    cfg_file.write_text(yaml.dump(cfg_data))
+    monkeypatch.setenv("HOME", str(tmp_path))
+
+    async def stalled() -> typing.AsyncIterator[bytes]:
+        await asyncio.sleep(5)
+        yield b"data: slow\n\n"
+
+    async def slow(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(200, headers={"content-type": "text/event-stream"}, stream=GeneratorStream(stalled()))
+
+    httpx_mock.add_callback(slow, url="https://slow.upstream/chat/completions")
+    httpx_mock.add_response(
+        url="https://fast.upstream/chat/completions",
+        headers={"content-type": "text/event-stream"},
+        content=b"data: fast\n\ndata: [DONE]\n\n",
+    )
+
+    proxy_app = importlib.import_module("prompt_passage.proxy_app")
+    with TestClient(proxy_app.app) as client:
+        started = time.perf_counter()
+        with client.stream("POST", "/provider/hedged/chat/completions", json={"stream": True}) as resp:
+            body = b"".join(resp.iter_bytes())
+        elapsed = time.perf_counter() - started
+        stats = client.get("/stats").json()
+
+    assert body == b"data: fast\n\ndata: [DONE]\n\n"
+    assert elapsed < 2
+    assert stats["hedging"]["hedged"]["hedged"] == 1
+    assert stats["hedging"]["hedged"]["hedge_wins"] == 1
+    assert all(d["outstanding"] == 0 for d in stats["deployments"]["hedged"])
+
+
+def test_large_bodies_are_prepared_off_the_loop(
+    monkeypatch: pytest.MonkeyPatch, tmp_path: Path, httpx_mock: HTTPXMock
+) -> None:
+    cfg_file = tmp_path / ".prompt-passage.yaml"
+    cfg_data = {
+        "service": {"offload": {"min_bytes": 1000}},
+        "providers": {
+            "p": {
+                "endpoints": {"base_url": "https://mock.upstream"},
+                "model": "m",
+                "auth": {"type": "apikey", "key": "k"},
+                "transform": [{"rename": {"messages": "input"}}],
+            }
+        },
+    }
+    cfg_file.write_text(yaml.dump(cfg_data))
+    monkeypatch.setenv("HOME", str(tmp_path))
+    httpx_mock.add_response(json={"ok": True}, is_reusable=True)
+
+    proxy_app = importlib.import_module("prompt_passage.proxy_app")
+    big = [{"role": "user", "content": "x" * 2000}]
+    with TestClient(proxy_app.app) as client:
+        client.post("/provider/p/chat/completions", json={"messages": [{"role": "user", "content": "hi"}]})
+        resp = client.post("/provider/p/chat/completions", json={"messages": big})
+        stats = client.get("/stats").json()
+
+    assert resp.status_code == 200
+    assert json.loads(httpx_mock.get_requests()[1].content) == {"input": big}
+    assert stats["offload"]["offloaded"] == 1
+    assert stats["offload"]["inline"] == 1
+    assert stats["offload"]["in_processes"] == 1
+    assert stats["event_loop"]["stalls"] >= 0
+
+
+def test_admin_reload_swaps_providers(monkeypatch: pytest.MonkeyPatch, tmp_path: Path, httpx_mock: HTTPXMock) -> None:
+    cfg_file = tmp_path / ".prompt-passage.yaml"
+
+    def write(providers: list[str]) -> None:
+        cfg_data = {
+            "service": {"auth": {"type": "apikey", "key": "svc-key"}},
+            "providers": {
+                name: {
+                    "endpoints": {"base_url": f"https://{name}.upstream"},
+                    "model": "m",
+                    "auth": {"type": "apikey", "key": "k"},
+                }
+                for name in providers
+            },
+        }
+        cfg_file.write_text(yaml.dump(cfg_data))
+
+    write(["a"])
+    monkeypatch.setenv("HOME", str(tmp_path))
+    monkeypatch.setenv("PROMPT_PASSAGE_SUPERVISOR", "4242")
+    signalled: list[tuple[int, int]] = []
+    monkeypatch.setattr(os, "kill", lambda pid, signum: signalled.append((pid, signum)))
+    httpx_mock.add_response(url="https://a.upstream/chat/completions", json={"from": "a"}, is_reusable=True)
+    httpx_mock.add_response(url="https://b.upstream/chat/completions", json={"from": "b"})
+
+    proxy_app = importlib.import_module("prompt_passage.proxy_app")
+    with TestClient(proxy_app.app, headers={"Authorization": "Bearer svc-key"}) as client:
+        assert client.post("/provider/b/chat/completions", json={}).status_code == 404
+        before = proxy_app._state
+
+        write(["a", "b"])
+        assert client.post("/admin/reload", headers={"Authorization": "Bearer other"}).status_code == 401
+        reloaded = client.post("/admin/reload")
+        assert reloaded.status_code == 200
+        assert reloaded.json()["providers"] == {"added": ["b"], "removed": [], "changed": [], "unchanged": ["a"]}
+        assert proxy_app._state.balancers["a"] is before.balancers["a"]
+        assert client.post("/provider/b/chat/completions", json={}).json() == {"from": "b"}
+
+        bad = {"endpoints": {"base_url": "https://a.upstream"}, "model": "m", "auth": {"type": "x", "key": "sk-secret"}}
+        cfg_file.write_text(yaml.dump({"providers": {"a": bad}}))
+        rejected = client.post("/admin/reload")
+        assert rejected.status_code == 400
+        assert client.post("/provider/a/chat/completions", json={}).json() == {"from": "a"}
+        stats = client.get("/stats").json()
+
+    assert "sk-secret" not in rejected.text
+    assert signalled == [(4242, signal.SIGHUP)]  # the other workers reload after a valid file only
+    assert stats["reload"]["reloads"] == 1
+    assert stats["reload"]["failures"] == 1
+    assert "providers.a.auth" in stats["reload"]["last_error"]
+    assert "sk-secret" not in stats["reload"]["last_error"]
+
+
+def test_admin_reload_needs_service_auth(monkeypatch: pytest.MonkeyPatch, create_config: Path) -> None:
+    monkeypatch.setenv("HOME", str(create_config.parent))
+    monkeypatch.setenv("TEST_API_KEY_ENV", "dummy")
+
+    proxy_app = importlib.import_module("prompt_passage.proxy_app")
+    with TestClient(proxy_app.app) as client:
+        resp = client.post("/admin/reload")
+
+    assert resp.status_code == 403
+
+
+def test_compressed_bodies_end_to_end(monkeypatch: pytest.MonkeyPatch, tmp_path: Path, httpx_mock: HTTPXMock) -> None:
+    cfg_file = tmp_path / ".prompt-passage.yaml"
+    cfg_data = {
+        "service": {"compression": {"min_bytes": 1000}},
+        "providers": {
+            "p": {
+                "endpoints": {"base_url": "https://mock.upstream"},
+                "model": "remote-model",
+                "auth": {"type": "apikey", "key": "k"},
+                "request_compression": {"encoding": "gzip", "min_bytes": 100},
+            }
+        },
+    }
+    cfg_file.write_text(yaml.dump(cfg_data))
+    monkeypatch.setenv("HOME", str(tmp_path))
+    completion = {"choices": [{"message": {"content": "row " * 1000}}], "usage": {"total_tokens": 5}}
+    httpx_mock.add_response(json=completion, is_reusable=True)
+
+    proxy_app = importlib.import_module("prompt_passage.proxy_app")
+    history = {"model": "local", "messages": [{"role": "user", "content": "again " * 500}]}
+    with TestClient(proxy_app.app) as client:
+        # A gzip request body is decoded before the model is rewritten, then re-compressed upstream.
+        headers = {"Content-Encoding": "gzip", "Content-Type": "application/json", "Accept-Encoding": "gzip"}
+        with client.stream(
+            "POST", "/provider/p/chat/completions", content=gzip.compress(json.dumps(history).encode()), headers=headers
+        ) as resp:
+            raw = b"".join(resp.iter_raw())
+        assert resp.status_code == 200
+        assert resp.headers["content-encoding"] == "gzip"
+        assert json.loads(gzip.decompress(raw)) == completion
+
+        identity = client.post(
+            "/provider/p/chat/completions", json={"messages": []}, headers={"Accept-Encoding": "identity"}
+        )
+        assert "content-encoding" not in identity.headers and identity.json() == completion
+
+        unsupported = client.post(
+            "/provider/p/chat/completions", content=b"x", headers={"Content-Encoding": "compress"}
+        )
+        corrupt = client.post("/provider/p/chat/completions", content=b"x", headers={"Content-Encoding": "gzip"})
+        stats = client.get("/stats").json()
+
+    assert unsupported.status_code == 415
+    assert corrupt.status_code == 400
+    upstream = httpx_mock.get_requests()
+    assert upstream[0].headers["content-encoding"] == "gzip"
+    assert json.loads(gzip.decompress(upstream[0].content))["model"] == "remote-model"
+    # Bodies below request_compression.min_bytes are sent as they are.
+    assert "content-encoding" not in upstream[1].headers
+    assert stats["compression"]["requests_decoded"] == 1
+    assert stats["compression"]["upstream_requests_compressed"] == 1
+    assert stats["compression"]["responses_compressed"] == 1
+
+
+def test_compressed_upstream_body_is_relayed_as_is(
+    monkeypatch: pytest.MonkeyPatch, create_config: Path, httpx_mock: HTTPXMock
+) -> None:
+    monkeypatch.setenv("HOME", str(create_config.parent))
+    monkeypatch.setenv("TEST_API_KEY_ENV", "secret-token")
+    payload = json.dumps({"choices": [], "usage": {"total_tokens": 3}}).encode()
+    encoded = gzip.compress(payload, mtime=0)
+    httpx_mock.add_response(
+        url="https://mock.upstream/chat/completions",
+        content=encoded,
+        headers={"Content-Encoding": "gzip", "Content-Type": "application/json"},
+        is_reusable=True,
+    )
+
+    proxy_app = importlib.import_module("prompt_passage.proxy_app")
+    with TestClient(proxy_app.app) as client:
+        with client.stream(
+            "POST", "/provider/test-model/chat/completions", json={}, headers={"Accept-Encoding": "gzip"}
+        ) as resp:
+            raw = b"".join(resp.iter_raw())
+        plain = client.post("/provider/test-model/chat/completions", json={}, headers={"Accept-Encoding": "identity"})
+
+    assert resp.headers["content-encoding"] == "gzip" and raw == encoded
+    assert "content-encoding" not in plain.headers and plain.content == payload
+
+
+def test_upstream_rejecting_compression_gets_plain_bodies(
+    monkeypatch: pytest.MonkeyPatch, tmp_path: Path, httpx_mock: HTTPXMock
+) -> None:
+    cfg_file = tmp_path / ".prompt-passage.yaml"
+    cfg_data = {
+        "providers": {
+            "p": {
+                "endpoints": {"base_url": "https://mock.upstream"},
+                "model": "m",
+                "auth": {"type": "apikey", "key": "k"},
+                "request_compression": {"min_bytes": 0},
+            }
+        },
+    }
+    cfg_file.write_text(yaml.dump(cfg_data))
+    monkeypatch.setenv("HOME", str(tmp_path))
+    httpx_mock.add_response(status_code=415)
+    httpx_mock.add_response(json={"ok": True}, is_reusable=True)
+
+    proxy_app = importlib.import_module("prompt_passage.proxy_app")
+    with TestClient(proxy_app.app) as client:
+        first = client.post("/provider/p/chat/completions", json={"messages": []})
+        second = client.post("/provider/p/chat/completions", json={"messages": []})
+
+    assert first.json() == {"ok": True} and second.json() == {"ok": True}
+    sent = [r.headers.get("content-encoding") for r in httpx_mock.get_requests()]
+    assert sent == ["gzip", None, None]
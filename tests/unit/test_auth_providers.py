@@ -0,0 +1,75 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from prompt_passage.auth_providers import ApiKeyProvider, AzureCliProvider, AzureCredential
+
+
+class CountingCred:
+    def __init__(self, lifetime: float = 3600.0, delay: float = 0.0) -> None:
+        self.calls = 0
+        self.lifetime = lifetime
+        self.delay = delay
+        self._lock = threading.Lock()
+
+    def get_token(self, scope: str) -> object:
+        with self._lock:
+            self.calls += 1
+            n = self.calls
+        time.sleep(self.delay)
+        return type("Tok", (), {"token": f"tok-{n}", "expires_on": time.time() + self.lifetime})()
+
+
+def _credential(monkeypatch: pytest.MonkeyPatch, cred: CountingCred, **kwargs: float) -> AzureCredential:
+    monkeypatch.setattr("azure.identity.DefaultAzureCredential", lambda: cred)
+    return AzureCredential(**kwargs)
+
+
+def test_api_key_provider() -> None:
+    assert asyncio.run(ApiKeyProvider("k").get_token()) == "k"
+
+
+def test_azure_token_is_cached(monkeypatch: pytest.MonkeyPatch) -> None:
+    cred = CountingCred()
+    provider = AzureCliProvider(_credential(monkeypatch, cred))
+
+    async def run() -> list[str]:
+        return [await provider.get_token() for _ in range(5)]
+
+    assert asyncio.run(run()) == ["tok-1"] * 5
+    assert cred.calls == 1
+
+
+def test_azure_token_single_flight(monkeypatch: pytest.MonkeyPatch) -> None:
+    cred = CountingCred(delay=0.05)
+    provider = AzureCliProvider(_credential(monkeypatch, cred))
+
+    async def run() -> list[str]:
+        return list(await asyncio.gather(*(provider.get_token() for _ in range(20))))
+
+    assert set(asyncio.run(run())) == {"tok-1"}
+    assert cred.calls == 1
+
+
+def test_azure_token_refreshed_ahead_of_expiry(monkeypatch: pytest.MonkeyPatch) -> None:
+    # Tokens live for 100s; with a 200s margin every hit is inside the refresh window.
+    cred = CountingCred(lifetime=100.0)
+    provider = AzureCliProvider(_credential(monkeypatch, cred, refresh_margin=200.0, min_validity=10.0))
+
+    async def run() -> tuple[str, str, str]:
+        first = await provider.get_token()
+        second = await provider.get_token()  # served from cache, refresh kicked off
+        await asyncio.sleep(0.05)
+        third = await provider.get_token()
+        return first, second, third
+
+    first, second, third = asyncio.run(run())
+    assert first == "tok-1"
+    assert second == "tok-1"
+    assert third == "tok-2"
+
+
+def test_azure_providers_share_credential() -> None:
+    assert AzureCliProvider()._credential is AzureCliProvider()._credential
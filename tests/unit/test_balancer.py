@@ -0,0 +1,58 @@
+from collections import Counter
+
+from prompt_passage.balancer import Balancer
+from prompt_passage.config import DeploymentCfg, ProviderEndpoints
+
+
+def _deployment(name: str, weight: float = 1.0) -> DeploymentCfg:
+    return DeploymentCfg(name=name, endpoints=ProviderEndpoints(base_url=f"https://{name}.example"), weight=weight)
+
+
+def test_idle_traffic_follows_weights() -> None:
+    balancer = Balancer([_deployment("a", 3.0), _deployment("b", 1.0)], "least_outstanding")
+    picks: Counter[str] = Counter()
+    for _ in range(4000):
+        ticket = balancer.pick(stream=False)
+        picks[ticket.deployment.label] += 1
+        ticket.done()
+    assert 0.7 < picks["a"] / 4000 < 0.8
+
+
+def test_least_outstanding_avoids_busy_deployment() -> None:
+    balancer = Balancer([_deployment("a"), _deployment("b")], "least_outstanding")
+    busy = [balancer.pick(stream=False) for _ in range(20)]
+    assert max(s.outstanding for s in balancer.states) - min(s.outstanding for s in balancer.states) <= 4
+    for ticket in busy:
+        ticket.done()
+    assert all(s.outstanding == 0 for s in balancer.states)
+
+
+def test_ewma_prefers_faster_deployment() -> None:
+    balancer = Balancer([_deployment("fast"), _deployment("slow")], "ewma")
+    fast, slow = balancer.states
+    fast.latency, slow.latency = 0.1, 2.0
+    fast.ttft, slow.ttft = 3.0, 0.2
+    assert Counter(balancer.pick(stream=False).deployment.label for _ in range(200))["fast"] > 120
+    assert Counter(balancer.pick(stream=True).deployment.label for _ in range(200))["slow"] > 120
+
+
+def test_ticket_records_once() -> None:
+    balancer = Balancer([_deployment("a")], "ewma")
+    ticket = balancer.pick(stream=True)
+    ticket.first_byte()
+    ticket.done(ok=False)
+    ticket.done()
+    stats = balancer.stats()[0]
+    assert stats["outstanding"] == 0
+    assert stats["failures"] == 1
+    assert stats["ttft_ms"] is not None and stats["latency_ms"] is None
+
+
+def test_abandoned_ticket_is_not_a_failure() -> None:
+    balancer = Balancer([_deployment("a"), _deployment("b")], "ewma")
+    ticket = balancer.pick(stream=False)
+    ticket.abandon()
+    ticket.done(ok=False)
+    state = ticket.state
+    assert state.outstanding == 0 and state.failures == 0
+    assert state.latency is not None
@@ -0,0 +1,130 @@
+import json
+from pathlib import Path
+from typing import Any
+
+import httpx
+import pytest
+import yaml
+from pytest_httpx import HTTPXMock
+
+from prompt_passage.batch import completed_ids, load_requests, main
+
+
+def _config(tmp_path: Path) -> Path:
+    provider = {
+        "endpoints": {"base_url": "https://mock.upstream"},
+        "model": "remote-model",
+        "auth": {"type": "apikey", "key": "k"},
+        "retry": {"max_retries": 0},
+    }
+    path = tmp_path / "config.yaml"
+    path.write_text(yaml.dump({"providers": {"p": provider}}))
+    return path
+
+
+def _completion(request: httpx.Request) -> httpx.Response:
+    body = json.loads(request.content)
+    content = body["messages"][0]["content"]
+    return httpx.Response(
+        200,
+        json={
+            "model": body["model"],
+            "choices": [{"message": {"content": content.upper()}}],
+            "usage": {"prompt_tokens": 3, "completion_tokens": 2, "total_tokens": 5},
+        },
+    )
+
+
+def _write_input(path: Path, prompts: list[str]) -> None:
+    lines = [
+        json.dumps(
+            {"custom_id": p, "url": "/v1/chat/completions", "body": {"model": "x", "messages": [{"content": p}]}}
+        )
+        for p in prompts
+    ]
+    path.write_text("\n".join(lines) + "\n")
+
+
+def _results(path: Path) -> dict[str, Any]:
+    return {r["custom_id"]: r for r in map(json.loads, path.read_text().splitlines())}
+
+
+def test_load_requests_accepts_envelopes_and_bodies(tmp_path: Path) -> None:
+    path = tmp_path / "in.jsonl"
+    path.write_text(
+        json.dumps({"custom_id": "a", "url": "/v1/responses", "body": {"input": "x", "stream": True}})
+        + "\n\n"
+        + json.dumps({"messages": [], "stream": True, "stream_options": {"include_usage": True}})
+        + "\n"
+        + json.dumps({"input": "y"})
+        + "\n"
+    )
+
+    requests = load_requests(path)
+
+    assert [(r.custom_id, r.route) for r in requests] == [
+        ("a", "responses"),
+        ("line-3", "chat/completions"),
+        ("line-4", "responses"),
+    ]
+    assert json.loads(requests[0].body) == {"input": "x"}
+    assert json.loads(requests[1].body) == {"messages": []}
+
+
+def test_load_requests_rejects_duplicate_ids(tmp_path: Path) -> None:
+    path = tmp_path / "in.jsonl"
+    _write_input(path, ["a", "a"])
+    with pytest.raises(ValueError, match="Line 2 repeats custom_id 'a'"):
+        load_requests(path)
+
+
+def test_batch_writes_results_and_totals(
+    tmp_path: Path, httpx_mock: HTTPXMock, capsys: pytest.CaptureFixture[str]
+) -> None:
+    httpx_mock.add_callback(_completion, url="https://mock.upstream/chat/completions", is_reusable=True)
+    inp, out = tmp_path / "in.jsonl", tmp_path / "out.jsonl"
+    _write_input(inp, ["a", "b", "c"])
+
+    status = main([str(inp), "-o", str(out), "--provider", "p", "--config", str(_config(tmp_path))])
+
+    assert status == 0
+    results = _results(out)
+    assert set(results) == {"a", "b", "c"}
+    assert results["b"]["response"]["status_code"] == 200
+    assert results["b"]["response"]["body"]["choices"][0]["message"]["content"] == "B"
+    assert results["b"]["response"]["body"]["model"] == "remote-model"
+    assert results["b"]["error"] is None
+    printed = capsys.readouterr().out
+    assert "succeeded" in printed and "         3" in printed
+    assert "prompt tokens               9" in printed
+
+
+def test_batch_resumes_after_crash_and_backs_off(tmp_path: Path, httpx_mock: HTTPXMock) -> None:
+    httpx_mock.add_response(url="https://mock.upstream/chat/completions", status_code=429, headers={"retry-after": "0"})
+    httpx_mock.add_callback(_completion, url="https://mock.upstream/chat/completions", is_reusable=True)
+    inp, out = tmp_path / "in.jsonl", tmp_path / "out.jsonl"
+    _write_input(inp, ["a", "b"])
+    done = {"custom_id": "a", "response": {"status_code": 200, "body": {}}, "error": None}
+    out.write_text(json.dumps(done) + '\n{"custom_id": "b", "resp')  # cut short by a crash
+
+    status = main([str(inp), "-o", str(out), "--provider", "p", "--config", str(_config(tmp_path))])
+
+    assert status == 0
+    lines = [json.loads(line) for line in out.read_text().splitlines()]
+    assert [r["custom_id"] for r in lines] == ["a", "b"]
+    assert lines[1]["attempts"] == 2
+    assert len(httpx_mock.get_requests()) == 2
+
+
+def test_completed_ids_can_leave_failures_to_retry(tmp_path: Path) -> None:
+    out = tmp_path / "out.jsonl"
+    records = [
+        {"custom_id": "a", "response": {"status_code": 400, "body": {}}, "error": {"message": "Status 400"}},
+        {"custom_id": "b", "response": None, "error": {"message": "boom"}},
+        {"custom_id": "b", "response": {"status_code": 200, "body": {}}, "error": None},
+    ]
+    out.write_text("".join(json.dumps(r) + "\n" for r in records))
+
+    assert completed_ids(out) == {"a", "b"}
+    assert completed_ids(out, include_failed=False) == {"b"}
+    assert completed_ids(tmp_path / "missing.jsonl") == set()
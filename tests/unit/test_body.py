@@ -0,0 +1,78 @@
+import json
+from typing import Any
+
+import pytest
+
+from prompt_passage import body as body_mod
+from prompt_passage.body import prepare_request_body
+
+
+def test_matching_model_forwards_original_bytes() -> None:
+    raw = b'{"model":  "m", "stream": true, "messages": []}'
+    prepared = prepare_request_body(raw, "m")
+    assert prepared.content is raw
+    assert prepared.stream is True
+    assert not prepared.rewritten
+
+
+def test_missing_model_forwards_original_bytes() -> None:
+    raw = b'{"input": "hello"}'
+    prepared = prepare_request_body(raw, "m")
+    assert prepared.content is raw
+    assert prepared.parsed == {"input": "hello"}
+
+
+def test_model_is_spliced_in_place() -> None:
+    raw = b'{"messages": [{"role": "user", "content": "say \\"model\\": \\"x\\""}], "model" : "local"}'
+    prepared = prepare_request_body(raw, "remote")
+    assert prepared.rewritten
+    assert prepared.content == raw.replace(b'"local"', b'"remote"')
+
+
+def test_nested_model_key_falls_back_to_reencode() -> None:
+    raw = b'{"model": "local", "metadata": {"model": "local"}}'
+    prepared = prepare_request_body(raw, "remote")
+    assert json.loads(prepared.content) == {"model": "remote", "metadata": {"model": "local"}}
+
+
+def test_non_string_model_is_reencoded() -> None:
+    prepared = prepare_request_body(b'{"model": 5}', "remote")
+    assert json.loads(prepared.content) == {"model": "remote"}
+
+
+def test_transform_reencodes() -> None:
+    def transform(obj: dict[str, Any]) -> dict[str, Any]:
+        obj["input"] = obj.pop("messages")
+        return obj
+
+    prepared = prepare_request_body(b'{"model": "m", "messages": [1]}', "m", transform)
+    assert json.loads(prepared.content) == {"model": "m", "input": [1]}
+
+
+@pytest.mark.parametrize("raw", [b"", b"not json", b"[1, 2]", b'"model"'])
+def test_non_object_bodies_pass_through(raw: bytes) -> None:
+    prepared = prepare_request_body(raw, "m")
+    assert prepared.content is raw
+    assert prepared.parsed is None
+
+
+def test_stdlib_codec_fallback(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(body_mod, "orjson", None)
+    prepared = prepare_request_body(b'{"model": "a", "x": {"model": "b"}, "t": "\xc3\xa9"}', "m")
+    assert json.loads(prepared.content) == {"model": "m", "x": {"model": "b"}, "t": "é"}
+
+
+def test_extract_usage_from_tail() -> None:
+    content = json.dumps({"choices": [{"message": {"content": "x" * 100_000}}], "usage": {"total_tokens": 7}})
+    assert body_mod.extract_usage(content.encode()) == {"total_tokens": 7}
+
+
+def test_extract_usage_ignores_escaped_keys() -> None:
+    content = json.dumps({"choices": [{"message": {"content": "x" * 100_000 + '{"usage": {"a": 1}}'}}]})
+    assert body_mod.extract_usage(content.encode()) is None
+
+
+def test_extract_usage_small_body_full_parse() -> None:
+    content = json.dumps({"usage": {"total_tokens": 3}, "tail": "y" * 10_000})
+    assert body_mod.extract_usage(content.encode()) == {"total_tokens": 3}
+    assert body_mod.extract_usage(b"not json") is None
@@ -0,0 +1,132 @@
+import asyncio
+import time
+
+import httpx
+import pytest
+from pytest_httpx import HTTPXMock
+
+from prompt_passage.breaker import CircuitBreaker, CircuitOpenError, Prober
+from prompt_passage.config import CircuitBreakerCfg, ProbeCfg, RetryCfg, parse_config
+from prompt_passage.forwarder import Forwarder
+
+URL = "https://a.example/chat/completions"
+
+
+def test_opens_on_failure_rate_and_recovers_half_open(monkeypatch: pytest.MonkeyPatch) -> None:
+    breaker = CircuitBreaker("https://a.example", CircuitBreakerCfg(window=4, min_calls=4, open_seconds=5))
+    for ok in (True, False, True, False):
+        breaker.before_call()
+        breaker.record(ok, 0.1)
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpenError) as err:
+        breaker.before_call()
+    assert 0 < err.value.retry_after <= 5
+
+    now = time.monotonic()
+    monkeypatch.setattr(time, "monotonic", lambda: now + 6)
+    assert breaker.state == "half_open"
+    breaker.before_call()
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    breaker.record(True, 0.1)
+    assert breaker.state == "closed"
+
+
+def test_half_open_failure_reopens(monkeypatch: pytest.MonkeyPatch) -> None:
+    breaker = CircuitBreaker("o", CircuitBreakerCfg(window=1, min_calls=1, open_seconds=1))
+    breaker.record(False, 0.0)
+    now = time.monotonic()
+    monkeypatch.setattr(time, "monotonic", lambda: now + 2)
+    breaker.before_call()
+    breaker.record(False, 0.0)
+    assert breaker.state == "open"
+    assert breaker.opened == 2
+
+
+def test_slow_calls_trip_the_breaker() -> None:
+    breaker = CircuitBreaker("o", CircuitBreakerCfg(window=2, min_calls=2, slow_call_seconds=1.0, slow_call_rate=1.0))
+    breaker.record(True, 1.5)
+    assert breaker.state == "closed"
+    breaker.record(True, 2.0)
+    assert breaker.state == "open"
+
+
+def test_probe_closes_open_circuit(httpx_mock: HTTPXMock) -> None:
+    httpx_mock.add_response(url="https://a.example/models", status_code=503)
+    httpx_mock.add_response(url="https://a.example/models", status_code=401)
+    cfg = CircuitBreakerCfg(window=1, min_calls=1, probe=ProbeCfg(interval=60, path="models"))
+    breaker = CircuitBreaker("https://a.example", cfg)
+    breaker.record(False, 0.0)
+
+    async def run() -> None:
+        async with httpx.AsyncClient() as client:
+            prober = Prober(breaker, "https://a.example/models", lambda: client)
+            breaker.probe_result(await prober.check())
+            assert breaker.state == "open"
+            breaker.probe_result(await prober.check())
+
+    asyncio.run(run())
+    assert breaker.state == "closed"
+
+
+def test_forwarder_fails_fast_when_open(httpx_mock: HTTPXMock) -> None:
+    httpx_mock.add_exception(httpx.ConnectError("down"))
+    raw = {
+        "a": {
+            "endpoints": {"base_url": "https://a.example"},
+            "model": "m",
+            "auth": {"type": "apikey", "key": "k"},
+            "circuit_breaker": {"window": 1, "min_calls": 1},
+        }
+    }
+    fwd = Forwarder(parse_config({"providers": raw}).providers)
+
+    async def run() -> None:
+        try:
+            with pytest.raises(httpx.ConnectError):
+                await fwd.forward(URL, b"{}", {}, RetryCfg(max_retries=0))
+            with pytest.raises(CircuitOpenError):
+                await fwd.forward(URL, b"{}", {}, RetryCfg(max_retries=0))
+        finally:
+            await fwd.aclose()
+
+    asyncio.run(run())
+    assert not fwd.available(URL)
+    assert fwd.health()["https://a.example"]["state"] == "open"
+
+
+def test_cancelled_half_open_trial_frees_its_slot(httpx_mock: HTTPXMock) -> None:
+    async def _hang(request: httpx.Request) -> httpx.Response:
+        await asyncio.sleep(60)
+        return httpx.Response(200)
+
+    httpx_mock.add_callback(_hang, url=URL)
+    httpx_mock.add_response(url=URL, json={})
+    raw = {
+        "a": {
+            "endpoints": {"base_url": "https://a.example"},
+            "model": "m",
+            "auth": {"type": "apikey", "key": "k"},
+            "circuit_breaker": {"window": 1, "min_calls": 1, "open_seconds": 0.01},
+        }
+    }
+    fwd = Forwarder(parse_config({"providers": raw}).providers)
+    breaker = fwd.breakers["https://a.example"]
+    breaker.record(False, 0.0)
+    time.sleep(0.02)
+    assert breaker.state == "half_open"
+
+    async def run() -> None:
+        try:
+            trial = asyncio.create_task(fwd.forward(URL, b"{}", {}, RetryCfg(max_retries=0)))
+            await asyncio.sleep(0.05)
+            trial.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await trial
+            resp = await fwd.forward(URL, b"{}", {}, RetryCfg(max_retries=0))
+            assert resp.status_code == 200
+        finally:
+            await fwd.aclose()
+
+    asyncio.run(run())
+    assert breaker.state == "closed"
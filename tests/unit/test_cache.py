@@ -0,0 +1,155 @@
+import asyncio
+import os
+import time
+from pathlib import Path
+
+import pytest
+
+from prompt_passage.cache import (
+    CachedResponse,
+    DiskResponseCache,
+    MemoryResponseCache,
+    ResponseCache,
+    cache_key,
+    is_deterministic,
+)
+
+
+def _entry(body: bytes) -> CachedResponse:
+    return CachedResponse(200, ((b"content-type", b"application/json"),), body, stream=False)
+
+
+def test_cache_key_is_canonical() -> None:
+    a = cache_key("p", "https://x/chat", {"model": "m", "temperature": 0, "messages": []})
+    b = cache_key("p", "https://x/chat", {"messages": [], "temperature": 0, "model": "m"})
+    assert a == b
+    assert a != cache_key("q", "https://x/chat", {"model": "m", "temperature": 0, "messages": []})
+    assert a != cache_key("p", "https://x/responses", {"model": "m", "temperature": 0, "messages": []})
+
+
+def test_is_deterministic() -> None:
+    assert is_deterministic({"temperature": 0})
+    assert is_deterministic({"seed": 1, "temperature": 1})
+    assert not is_deterministic({"temperature": 0.7})
+    assert not is_deterministic({})
+
+
+def test_lru_eviction_by_size() -> None:
+    cache = MemoryResponseCache(max_bytes=300, max_entry_bytes=300)
+    cache.put("a", _entry(b"a" * 100), ttl=60)
+    cache.put("b", _entry(b"b" * 100), ttl=60)
+    assert cache.get("a") is not None  # a is now most recently used
+    cache.put("c", _entry(b"c" * 100), ttl=60)
+
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.get("c") is not None
+    stats = cache.stats()
+    assert stats["evictions"] == 1
+    assert stats["entries"] == 2
+    assert stats["hits"] == 3
+    assert stats["misses"] == 1
+
+
+def test_oversized_entries_are_not_stored() -> None:
+    cache = MemoryResponseCache(max_bytes=1000, max_entry_bytes=50)
+    cache.put("a", _entry(b"a" * 100), ttl=60)
+    assert cache.get("a") is None
+    assert cache.stats()["bytes"] == 0
+
+
+def test_entries_expire(monkeypatch: pytest.MonkeyPatch) -> None:
+    cache = MemoryResponseCache(max_bytes=1000, max_entry_bytes=1000)
+    now = time.monotonic()
+    monkeypatch.setattr("prompt_passage.cache.time.monotonic", lambda: now)
+    cache.put("a", _entry(b"x"), ttl=10)
+    assert cache.get("a") is not None
+
+    monkeypatch.setattr("prompt_passage.cache.time.monotonic", lambda: now + 11)
+    assert cache.get("a") is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_disk_cache_shared_and_persistent(tmp_path: Path) -> None:
+    path = tmp_path / "cache" / "responses.db"
+    writer = DiskResponseCache(path, max_bytes=10_000, max_entry_bytes=10_000)
+    reader = DiskResponseCache(path, max_bytes=10_000, max_entry_bytes=10_000)  # e.g. another worker
+    entry = CachedResponse(200, ((b"content-type", b"text/event-stream"),), b"data: x\n\n" * 50, stream=True)
+    writer.put("k", entry, ttl=60)
+
+    found = reader.get("k")
+    assert found is not None
+    assert found[1] == entry
+    writer.close()
+    reader.close()
+
+    restarted = DiskResponseCache(path, max_bytes=10_000, max_entry_bytes=10_000)
+    assert restarted.get("k") is not None
+    assert restarted.stats()["bytes"] < len(entry.body)  # stored compressed
+    restarted.close()
+
+
+def test_disk_cache_evicts_least_recently_used(tmp_path: Path) -> None:
+    cache = DiskResponseCache(tmp_path / "c.db", max_bytes=350, max_entry_bytes=10_000)  # two entries fit
+    blobs = {k: os.urandom(100) for k in "abc"}  # incompressible
+    cache.put("a", _entry(blobs["a"]), ttl=60)
+    cache.put("b", _entry(blobs["b"]), ttl=60)
+    assert cache.get("a") is not None
+    cache.put("c", _entry(blobs["c"]), ttl=60)
+
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.stats()["evictions"] == 1
+    cache.close()
+
+
+def test_disk_cache_keeps_a_running_size(tmp_path: Path) -> None:
+    path = tmp_path / "c.db"
+    cache = DiskResponseCache(path, max_bytes=1000, max_entry_bytes=10_000)  # about eight entries fit
+    for n in range(20):
+        cache.put(f"k{n}", _entry(os.urandom(100)), ttl=60)
+    cache.put("k19", _entry(os.urandom(50)), ttl=60)  # replaced with a smaller body
+    cache.put("gone", _entry(b"x"), ttl=-1)
+
+    stats = cache.stats()
+    (total,) = cache._conn.execute("SELECT SUM(size) FROM responses").fetchone()
+    assert stats["bytes"] == total <= 1000
+    assert stats["evictions"] == 20 - stats["entries"]
+    cache.close()
+    reopened = DiskResponseCache(path, max_bytes=1000, max_entry_bytes=10_000)
+    assert reopened.stats()["bytes"] == total
+    reopened.close()
+
+
+def test_disk_cache_writes_access_times_in_batches(tmp_path: Path) -> None:
+    cache = DiskResponseCache(tmp_path / "c.db", max_bytes=1000, max_entry_bytes=1000)
+    cache.put("a", _entry(b"x"), ttl=60)
+    (before,) = cache._conn.execute("SELECT last_access FROM responses").fetchone()
+    time.sleep(0.01)
+    assert cache.get("a") is not None
+    assert cache._conn.execute("SELECT last_access FROM responses").fetchone() == (before,)
+    assert cache._conn.in_transaction is False
+    cache.close()
+
+    reopened = DiskResponseCache(tmp_path / "c.db", max_bytes=1000, max_entry_bytes=1000)
+    (after,) = reopened._conn.execute("SELECT last_access FROM responses").fetchone()
+    assert after > before  # written on close
+    reopened.close()
+
+
+def test_disk_cache_expiry(tmp_path: Path) -> None:
+    cache = DiskResponseCache(tmp_path / "c.db", max_bytes=1000, max_entry_bytes=1000)
+    cache.put("a", _entry(b"x"), ttl=-1)
+    assert cache.get("a") is None
+    cache.close()
+
+
+def test_tiered_cache_promotes_disk_hits(tmp_path: Path) -> None:
+    disk = DiskResponseCache(tmp_path / "c.db", max_bytes=1000, max_entry_bytes=1000)
+    disk.put("a", _entry(b"x"), ttl=60)
+    memory = MemoryResponseCache(max_bytes=1000, max_entry_bytes=1000)
+    cache = ResponseCache(memory, disk)
+
+    assert asyncio.run(cache.get("a")) == _entry(b"x")
+    assert memory.get("a") == _entry(b"x")
+    cache.close()
@@ -1,7 +1,9 @@
 import importlib
+import os
 from pathlib import Path
 import yaml
 import pytest
+from fastapi.testclient import TestClient
 
 
 def _create_basic_config(path: Path) -> None:
@@ -87,3 +89,92 @@ def test_cli_partial_https(monkeypatch: pytest.MonkeyPatch, tmp_path: Path) -> N
     assert called.get("ssl_certfile") == "/c.pem"
     assert "ssl_keyfile" not in called
     assert "ssl_ca_certs" not in called
+
+
+def test_cli_uses_config_argument(monkeypatch: pytest.MonkeyPatch, tmp_path: Path) -> None:
+    cfg = tmp_path / "custom.yaml"
+    _create_basic_config(cfg)
+    monkeypatch.setenv("HOME", str(tmp_path / "missing"))
+    monkeypatch.delenv("PROMPT_PASSAGE_CONFIG_PATH", raising=False)
+
+    called: dict[str, object] = {}
+
+    def dummy_run(app: object, **kwargs: object) -> None:
+        called["app"] = app
+
+    cli = importlib.import_module("prompt_passage.cli")
+    monkeypatch.setattr(cli.uvicorn, "run", dummy_run)
+    monkeypatch.setattr("sys.argv", ["prog", "--config", str(cfg)])
+
+    cli.main()
+
+    # The default config path does not exist, so startup only succeeds if the
+    # app reuses the configuration the CLI already parsed.
+    with TestClient(called["app"]) as client:  # type: ignore[arg-type]
+        resp = client.post("/provider/missing", json={})
+        assert resp.status_code == 404
+
+
+def test_cli_profile_startup(
+    monkeypatch: pytest.MonkeyPatch, tmp_path: Path, capsys: pytest.CaptureFixture[str]
+) -> None:
+    cfg = tmp_path / ".prompt-passage.yaml"
+    _create_basic_config(cfg)
+    monkeypatch.setenv("HOME", str(tmp_path))
+
+    cli = importlib.import_module("prompt_passage.cli")
+    monkeypatch.setattr(cli.uvicorn, "run", lambda *a, **k: pytest.fail("should not serve"))
+    monkeypatch.setattr("sys.argv", ["prog", "--profile-startup"])
+
+    cli.main()
+
+    out = capsys.readouterr().out
+    assert "Startup profile:" in out
+    for phase in ("load config", "import app", "build app", "app startup", "total"):
+        assert phase in out
+
+
+def test_cli_workers_use_supervisor(monkeypatch: pytest.MonkeyPatch, tmp_path: Path) -> None:
+    cfg = tmp_path / "custom.yaml"
+    _create_basic_config(cfg)
+    monkeypatch.delenv("PROMPT_PASSAGE_CONFIG_PATH", raising=False)
+
+    called: dict[str, object] = {}
+
+    def dummy_run_workers(workers: int, kwargs: dict[str, object]) -> int:
+        called.update(kwargs, workers=workers)
+        return 0
+
+    cli = importlib.import_module("prompt_passage.cli")
+    supervisor = importlib.import_module("prompt_passage.supervisor")
+    monkeypatch.setattr(supervisor, "run_workers", dummy_run_workers)
+    monkeypatch.setattr(cli.uvicorn, "run", lambda *a, **k: pytest.fail("app object cannot be run with workers"))
+    monkeypatch.setattr("sys.argv", ["prog", "--config", str(cfg), "--workers", "3"])
+
+    with pytest.raises(SystemExit) as exc:
+        cli.main()
+
+    assert exc.value.code == 0
+    assert called["workers"] == 3
+    # Workers load the file the CLI validated; monkeypatch restores the variable.
+    assert os.environ["PROMPT_PASSAGE_CONFIG_PATH"] == str(cfg)
+
+
+def test_cli_batch_subcommand(monkeypatch: pytest.MonkeyPatch) -> None:
+    seen: list[list[str]] = []
+
+    def dummy_batch_main(argv: list[str]) -> int:
+        seen.append(argv)
+        return 1
+
+    cli = importlib.import_module("prompt_passage.cli")
+    batch = importlib.import_module("prompt_passage.batch")
+    monkeypatch.setattr(batch, "main", dummy_batch_main)
+    monkeypatch.setattr(cli.uvicorn, "run", lambda *a, **k: pytest.fail("batch must not serve"))
+    monkeypatch.setattr("sys.argv", ["prog", "batch", "in.jsonl", "-o", "out.jsonl", "--provider", "p"])
+
+    with pytest.raises(SystemExit) as exc:
+        cli.main()
+
+    assert exc.value.code == 1
+    assert seen == [["in.jsonl", "-o", "out.jsonl", "--provider", "p"]]
@@ -0,0 +1,91 @@
+import asyncio
+from typing import Awaitable, Callable
+
+import pytest
+
+from prompt_passage.coalesce import SingleFlight, coalesce_key
+
+
+def test_coalesce_key() -> None:
+    assert coalesce_key("p", "e", b"{}") == coalesce_key("p", "e", b"{}")
+    assert coalesce_key("p", "e", b"{}") != coalesce_key("p", "e", b"{ }")
+    assert coalesce_key("p", "e1", b"{}") != coalesce_key("p", "e", b"1{}")
+
+
+def test_identical_calls_share_one_upstream_call() -> None:
+    flight: SingleFlight[str] = SingleFlight()
+    calls = 0
+
+    def upstream(name: str) -> Callable[[], Awaitable[str]]:
+        async def call() -> str:
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.01)
+            return name
+
+        return call
+
+    async def run() -> list[str]:
+        same = [flight.do("k", upstream(f"k-{i}"), max_waiters=10) for i in range(5)]
+        return list(await asyncio.gather(*same, flight.do("other", upstream("other"), max_waiters=10)))
+
+    results = asyncio.run(run())
+    assert results == ["k-0"] * 5 + ["other"]
+    assert calls == 2
+    assert flight.stats() == {"upstream_calls": 2, "saved_calls": 4, "overflow": 0, "in_flight": 0}
+
+
+def test_max_waiters_overflow_runs_separately() -> None:
+    flight: SingleFlight[int] = SingleFlight()
+    calls = 0
+
+    async def upstream() -> int:
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return calls
+
+    async def run() -> list[int]:
+        return list(await asyncio.gather(*(flight.do("k", upstream, max_waiters=2) for _ in range(4))))
+
+    asyncio.run(run())
+    assert calls == 2
+    assert flight.stats()["saved_calls"] == 2
+    assert flight.stats()["overflow"] == 1
+
+
+def test_errors_reach_every_waiter() -> None:
+    flight: SingleFlight[int] = SingleFlight()
+
+    async def upstream() -> int:
+        await asyncio.sleep(0.01)
+        raise RuntimeError("boom")
+
+    async def run() -> list[object]:
+        return list(
+            await asyncio.gather(*(flight.do("k", upstream, max_waiters=5) for _ in range(3)), return_exceptions=True)
+        )
+
+    results = asyncio.run(run())
+    assert all(isinstance(r, RuntimeError) for r in results)
+
+
+def test_cancelled_leader_does_not_cancel_waiters() -> None:
+    flight: SingleFlight[str] = SingleFlight()
+
+    async def upstream() -> str:
+        await asyncio.sleep(0.02)
+        return "ok"
+
+    async def run() -> str:
+        leader = asyncio.ensure_future(flight.do("k", upstream, max_waiters=5))
+        await asyncio.sleep(0)
+        waiter = asyncio.ensure_future(flight.do("k", upstream, max_waiters=5))
+        await asyncio.sleep(0)
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        result: str = await waiter
+        return result
+
+    assert asyncio.run(run()) == "ok"
@@ -0,0 +1,52 @@
+import gzip
+import zlib
+
+import pytest
+
+from prompt_passage.compression import UnsupportedEncoding, available, decode, encode, negotiate
+
+
+def test_decode_gzip_and_deflate() -> None:
+    body = b'{"messages": []}' * 100
+    assert decode(gzip.compress(body), "gzip", 1 << 20) == body
+    assert decode(zlib.compress(body), "deflate", 1 << 20) == body
+    # Several gzip members, as written by concatenating compressed files.
+    assert decode(gzip.compress(b"ab") + gzip.compress(b"cd"), "x-gzip", 100) == b"abcd"
+    # Codings are undone in reverse order of application.
+    assert decode(zlib.compress(gzip.compress(body)), "gzip, deflate", 1 << 20) == body
+    assert decode(body, "identity", 1) == body
+
+
+def test_decode_rejects_bad_bodies() -> None:
+    with pytest.raises(UnsupportedEncoding):
+        decode(b"data", "br", 100)
+    with pytest.raises(ValueError, match="more than 1000 bytes"):
+        decode(gzip.compress(b"x" * 1001), "gzip", 1000)
+    with pytest.raises(ValueError, match="Invalid gzip"):
+        decode(b"not gzip", "gzip", 1000)
+    with pytest.raises(ValueError, match="Truncated"):
+        decode(gzip.compress(b"x" * 1000)[:-10], "gzip", 10_000)
+
+
+def test_encode_round_trips() -> None:
+    body = b"repetitive " * 1000
+    compressed = encode(body, "gzip", 5)
+    assert len(compressed) < len(body) // 10
+    assert decode(compressed, "gzip", len(body)) == body
+    if available("zstd"):
+        assert decode(encode(body, "zstd", 3), "zstd", len(body)) == body
+    else:
+        with pytest.raises(UnsupportedEncoding):
+            encode(body, "zstd", 3)
+
+
+def test_negotiate() -> None:
+    offered = ["zstd", "gzip"]
+    assert negotiate("gzip, deflate", offered) == "gzip"
+    assert negotiate("gzip, zstd", offered) == "zstd"
+    assert negotiate("zstd;q=0.5, gzip", offered) == "gzip"
+    assert negotiate("gzip;q=0, *", offered) == "zstd"
+    assert negotiate("*;q=0", offered) is None
+    assert negotiate("", offered) is None
+    assert negotiate("identity", offered) is None
+    assert negotiate("x-gzip", ["gzip"]) == "gzip"
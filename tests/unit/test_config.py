@@ -1,4 +1,6 @@
+import asyncio
 from pathlib import Path
+from typing import Any
 
 import pytest
 from pydantic import ValidationError
@@ -190,3 +192,97 @@ def test_default_config_path_home(monkeypatch: pytest.MonkeyPatch) -> None:
     monkeypatch.delenv("PROMPT_PASSAGE_CONFIG_PATH", raising=False)
     monkeypatch.setenv("HOME", "/tmp/home")
     assert default_config_path() == Path("/tmp/home/.prompt-passage.yaml")
+
+
+def test_parse_config_body_log() -> None:
+    raw = {
+        "providers": {
+            "p1": {
+                "endpoints": {"base_url": "https://example.com"},
+                "model": "m",
+                "auth": {"type": "apikey", "key": "k"},
+                "body_log": {"level": "debug", "max_bytes": 100, "sample_rate": 0.5},
+            },
+            "p2": {
+                "endpoints": {"base_url": "https://example.com"},
+                "model": "m",
+                "auth": {"type": "apikey", "key": "k"},
+            },
+        }
+    }
+    cfg = parse_config(raw)
+    assert cfg.providers["p1"].body_log.max_bytes == 100
+    assert cfg.providers["p2"].body_log.level == "info"
+
+    raw["providers"]["p1"]["body_log"] = {"sample_rate": 2}
+    with pytest.raises(ValidationError):
+        parse_config(raw)
+
+
+def test_parse_config_deployments() -> None:
+    raw: dict[str, Any] = {
+        "providers": {
+            "p1": {
+                "model": "m",
+                "auth": {"type": "apikey", "key": "shared"},
+                "deployments": [
+                    {"name": "east", "endpoints": {"base_url": "https://east.example"}, "weight": 2},
+                    {"endpoints": {"base_url": "https://west.example"}, "auth": {"type": "apikey", "key": "own"}},
+                ],
+            },
+            "p2": {
+                "endpoints": {"base_url": "https://example.com"},
+                "model": "m",
+                "auth": {"type": "apikey", "key": "k"},
+            },
+        }
+    }
+    cfg = parse_config(raw)
+    east, west = cfg.providers["p1"].all_deployments
+    assert (east.label, east.weight) == ("east", 2)
+    assert asyncio.run(east.token_provider.get_token()) == "shared"
+    assert asyncio.run(west.token_provider.get_token()) == "own"
+    assert west.label == "https://west.example"
+    assert [d.chat_endpoint for d in cfg.providers["p2"].all_deployments] == ["https://example.com/chat/completions"]
+
+    del raw["providers"]["p1"]["auth"]
+    with pytest.raises(ValidationError, match="no 'auth'"):
+        parse_config(raw)
+
+    raw["providers"]["p2"]["deployments"] = [{"endpoints": {"base_url": "https://other.example"}}]
+    with pytest.raises(ValidationError):
+        parse_config(raw)
+
+
+def test_parse_config_fallback_must_exist() -> None:
+    raw: dict[str, Any] = {
+        "providers": {
+            "p1": {
+                "endpoints": {"base_url": "https://example.com"},
+                "model": "m",
+                "auth": {"type": "apikey", "key": "k"},
+                "fallback": ["p2"],
+            }
+        }
+    }
+    with pytest.raises(ValidationError, match="Fallback provider 'p2'"):
+        parse_config(raw)
+    raw["providers"]["p1"]["fallback"] = ["p1"]
+    with pytest.raises(ValidationError, match="itself"):
+        parse_config(raw)
+
+
+def test_parse_config_hedge_needs_two_deployments() -> None:
+    with pytest.raises(ValidationError):
+        parse_config(
+            {
+                "providers": {
+                    "single": {
+                        "endpoints": {"base_url": "https://a.example"},
+                        "model": "m",
+                        "auth": {"type": "apikey", "key": "k"},
+                        "hedge": {"delay": 1},
+                    }
+                }
+            }
+        )
@@ -0,0 +1,128 @@
+import asyncio
+from typing import Any
+
+import httpx
+import pytest
+from pytest_httpx import HTTPXMock
+
+from prompt_passage import forwarder as forwarder_mod
+from prompt_passage.config import parse_config
+from prompt_passage.forwarder import Forwarder, upstream_ttfb
+
+
+def _forwarder(providers: dict[str, Any]) -> Forwarder:
+    raw = {
+        name: {"model": "m", "auth": {"type": "apikey", "key": "k"}, **provider} for name, provider in providers.items()
+    }
+    return Forwarder(parse_config({"providers": raw}).providers)
+
+
+def test_pool_per_upstream_host(httpx_mock: HTTPXMock) -> None:
+    httpx_mock.add_response(url="https://a.example/chat/completions", json={})
+    httpx_mock.add_response(url="https://b.example/chat/completions", json={})
+    fwd = _forwarder(
+        {
+            "a": {"endpoints": {"base_url": "https://a.example"}, "pool": {"max_connections": 4, "http2": False}},
+            "b": {"endpoints": {"base_url": "https://B.example/"}},
+            "b2": {"endpoints": {"base_url": "https://b.example/v2"}},
+        }
+    )
+
+    async def run() -> None:
+        await fwd.forward("https://a.example/chat/completions", b"{}", {})
+        await fwd.forward("https://b.example/chat/completions", b"{}", {})
+        await fwd.aclose()
+
+    asyncio.run(run())
+    assert fwd.pool("https://a.example/x") is not fwd.pool("https://b.example/x")
+    assert fwd.pool("https://b.example/x") is fwd.pool("https://B.EXAMPLE/v2/x")
+    stats = fwd.stats()
+    assert set(stats) == {"https://a.example", "https://b.example"}
+    assert stats["https://a.example"]["max_connections"] == 4
+    assert stats["https://b.example"]["max_connections"] == 100
+
+
+def test_http2_without_h2_falls_back(monkeypatch: pytest.MonkeyPatch, caplog: pytest.LogCaptureFixture) -> None:
+    monkeypatch.setattr(forwarder_mod, "_http2_available", lambda: False)
+    fwd = _forwarder({"a": {"endpoints": {"base_url": "https://a.example"}, "pool": {"http2": True}}})
+    pool = fwd.pool("https://a.example/chat/completions")
+    assert pool.http2 is False
+    assert "h2" in caplog.text
+    asyncio.run(fwd.aclose())
+
+
+def test_pool_wait_is_recorded_once_per_request() -> None:
+    fwd = _forwarder({"a": {"endpoints": {"base_url": "https://a.example"}}})
+    pool = fwd.pool("https://a.example")
+
+    async def run() -> None:
+        trace = pool.extensions()["trace"]
+        await trace("connection.connect_tcp.started", {})
+        await trace("http11.send_request_headers.started", {})
+        await fwd.aclose()
+
+    asyncio.run(run())
+    stats = pool.stats()
+    assert stats["requests"] == 1
+    assert stats["wait_ms_max"] >= stats["wait_ms_avg"] >= 0
+
+
+def test_upstream_ttfb_from_trace() -> None:
+    fwd = _forwarder({"a": {"endpoints": {"base_url": "https://a.example"}}})
+    pool = fwd.pool("https://a.example")
+
+    async def run() -> httpx.Response:
+        extensions = pool.extensions()
+        await extensions["trace"]("http11.receive_response_headers.complete", {})
+        request = httpx.Request("POST", "https://a.example", extensions=extensions)
+        await fwd.aclose()
+        return httpx.Response(200, request=request)
+
+    response = asyncio.run(run())
+    ttfb = upstream_ttfb(response)
+    assert ttfb is not None and ttfb >= 0
+    assert upstream_ttfb(httpx.Response(200, request=httpx.Request("GET", "https://a.example"))) is None
+
+
+def test_reconfigure_keeps_unchanged_pools_and_drains_retired_ones(httpx_mock: HTTPXMock) -> None:
+    httpx_mock.add_response(url="https://a.example/chat/completions", json={}, is_reusable=True)
+    httpx_mock.add_response(url="https://b.example/chat/completions", json={})
+    a = {"model": "m", "auth": {"type": "apikey", "key": "k"}, "endpoints": {"base_url": "https://a.example"}}
+    b = {"model": "m", "auth": {"type": "apikey", "key": "k"}, "endpoints": {"base_url": "https://b.example"}}
+    fwd = Forwarder(parse_config({"providers": {"a": a, "b": b}}).providers, drain_timeout=5)
+
+    async def run() -> None:
+        await fwd.forward("https://a.example/chat/completions", b"{}", {})
+        await fwd.forward("https://b.example/chat/completions", b"{}", {})
+        kept, retired = fwd.pool("https://a.example/x"), fwd.pool("https://b.example/x")
+        fwd.reconfigure(parse_config({"providers": {"a": a}}).providers)
+        assert fwd.pool("https://a.example/x") is kept
+        assert fwd.draining == 1
+        await asyncio.sleep(0)
+        await asyncio.sleep(0)
+        assert retired.client.is_closed and fwd.draining == 0
+        await fwd.forward("https://a.example/chat/completions", b"{}", {})
+        await fwd.aclose()
+
+    asyncio.run(run())
+    assert set(fwd.stats()) == {"https://a.example"}
+
+
+def test_streams_count_as_active_until_closed(httpx_mock: HTTPXMock) -> None:
+    httpx_mock.add_response(url="https://a.example/chat/completions", content=b"data: {}\n\n")
+    httpx_mock.add_exception(httpx.ConnectError("refused"), url="https://a.example/chat/completions")
+    fwd = _forwarder({"a": {"endpoints": {"base_url": "https://a.example"}}})
+    pool = fwd.pool("https://a.example")
+
+    async def run() -> None:
+        response = await fwd.stream("https://a.example/chat/completions", b"{}", {})
+        assert pool.active() == 1
+        # Reading the stream to its end closes it.
+        assert [chunk async for chunk in response.aiter_raw()] == [b"data: {}\n\n"]
+        assert pool.active() == 0
+        with pytest.raises(httpx.ConnectError):
+            await fwd.stream("https://a.example/chat/completions", b"{}", {})
+        assert pool.active() == 0
+        await fwd.aclose()
+
+    asyncio.run(run())
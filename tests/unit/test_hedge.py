@@ -0,0 +1,106 @@
+import asyncio
+import typing
+
+import httpx
+import pytest
+
+from prompt_passage.config import HedgeCfg
+from prompt_passage.hedge import HedgePolicy, hedged, read_first_byte
+
+
+async def _noop(_: str) -> None:
+    return None
+
+
+def test_slow_primary_is_hedged_and_cancelled() -> None:
+    started: list[str] = []
+    cancelled: list[str] = []
+
+    async def attempt() -> str:
+        name = f"attempt{len(started)}"
+        started.append(name)
+        try:
+            await asyncio.sleep(1.0 if name == "attempt0" else 0.01)
+        except asyncio.CancelledError:
+            cancelled.append(name)
+            raise
+        return name
+
+    policy = HedgePolicy(HedgeCfg(delay=0.02, max_ratio=1.0))
+    result = asyncio.run(hedged(policy, False, attempt, lambda: True, _noop))
+    assert result == "attempt1"
+    assert cancelled == ["attempt0"]
+    assert policy.stats()["hedged"] == 1 and policy.stats()["hedge_wins"] == 1
+
+
+def test_fast_primary_is_not_hedged() -> None:
+    calls: list[int] = []
+
+    async def attempt() -> str:
+        calls.append(1)
+        return "ok"
+
+    policy = HedgePolicy(HedgeCfg(delay=0.05))
+    assert asyncio.run(hedged(policy, False, attempt, lambda: True, _noop)) == "ok"
+    assert len(calls) == 1 and policy.hedged == 0
+
+
+def test_budget_and_eligibility_limit_hedging() -> None:
+    async def attempt() -> str:
+        await asyncio.sleep(0.03)
+        return "ok"
+
+    async def run(policy: HedgePolicy, can_hedge: bool) -> None:
+        for _ in range(3):
+            await hedged(policy, False, attempt, lambda: can_hedge, _noop)
+
+    no_budget = HedgePolicy(HedgeCfg(delay=0.001, max_ratio=0.0))
+    asyncio.run(run(no_budget, True))
+    assert no_budget.hedged == 0 and no_budget.budget.exhausted == 3
+
+    single = HedgePolicy(HedgeCfg(delay=0.001, max_ratio=1.0))
+    asyncio.run(run(single, False))
+    assert single.hedged == 0
+
+
+def test_failed_attempts_raise_primary_error() -> None:
+    async def attempt() -> str:
+        await asyncio.sleep(0.02)
+        raise httpx.ConnectError("down")
+
+    policy = HedgePolicy(HedgeCfg(delay=0.001, max_ratio=1.0))
+    with pytest.raises(httpx.ConnectError):
+        asyncio.run(hedged(policy, False, attempt, lambda: True, _noop))
+    assert policy.hedged == 1
+
+
+def test_percentile_delay_after_min_samples() -> None:
+    policy = HedgePolicy(HedgeCfg(delay=2.0, percentile=90, min_samples=10))
+    for i in range(9):
+        policy.record(False, i / 10)
+    assert policy.delay(False) == 2.0
+    policy.record(False, 0.9)
+    assert policy.delay(False) == pytest.approx(0.8)
+    assert policy.delay(True) == 2.0
+
+
+def test_hedge_config_needs_a_trigger() -> None:
+    with pytest.raises(ValueError):
+        HedgeCfg()
+
+
+def test_read_first_byte_keeps_the_chunk() -> None:
+    async def body() -> typing.AsyncIterator[bytes]:
+        for chunk in (b"data: 1\n\n", b"data: 2\n\n"):
+            yield chunk
+
+    async def run() -> bytes:
+        transport = httpx.MockTransport(lambda request: httpx.Response(200, content=body()))
+        async with httpx.AsyncClient(transport=transport) as client:
+            response = await client.send(client.build_request("POST", "https://a.example"), stream=True)
+            await read_first_byte(response)
+            chunks = [chunk async for chunk in response.aiter_raw()]
+            await response.aclose()
+        return b"".join(chunks)
+
+    assert asyncio.run(run()) == b"data: 1\n\ndata: 2\n\n"
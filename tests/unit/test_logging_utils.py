@@ -0,0 +1,45 @@
+import logging
+import queue
+
+import pytest
+
+from prompt_passage.config import BodyLogCfg
+from prompt_passage.logging_utils import BodyText, _DeferredQueueHandler, body_logger, body_sampled, log_body
+
+
+def test_body_text_truncates() -> None:
+    assert str(BodyText(b"abc", 10)) == "abc"
+    assert str(BodyText(b"abcdef", 3)) == "abc... [3 more bytes]"
+
+
+def test_body_text_is_lazy() -> None:
+    q: queue.SimpleQueue[logging.LogRecord] = queue.SimpleQueue()
+    handler = _DeferredQueueHandler(q)
+    rendered = []
+
+    class Probe:
+        def __str__(self) -> str:
+            rendered.append(True)
+            return "probe"
+
+    record = logging.LogRecord("x", logging.INFO, __file__, 1, "%s", (Probe(),), None)
+    handler.handle(record)
+
+    assert not rendered
+    assert q.get_nowait().getMessage() == "probe"
+    assert rendered
+
+
+def test_body_sampled_respects_level_and_rate(caplog: pytest.LogCaptureFixture) -> None:
+    with caplog.at_level(logging.INFO, logger=body_logger.name):
+        assert body_sampled(BodyLogCfg())
+        assert not body_sampled(BodyLogCfg(level="off"))
+        assert not body_sampled(BodyLogCfg(level="debug"))
+        assert not body_sampled(BodyLogCfg(sample_rate=0.0))
+
+
+def test_log_body_truncates(caplog: pytest.LogCaptureFixture) -> None:
+    with caplog.at_level(logging.INFO, logger=body_logger.name):
+        log_body(BodyLogCfg(max_bytes=4), "Outgoing body", b'{"messages": []}')
+
+    assert caplog.messages == ['Outgoing body (16 bytes):\n{"me... [12 more bytes]']
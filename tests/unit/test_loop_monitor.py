@@ -0,0 +1,48 @@
+import asyncio
+import time
+
+from prompt_passage.config import LoopMonitorCfg
+from prompt_passage.loop_monitor import LoopMonitor
+from prompt_passage.metrics import Metrics
+
+
+def test_stall_is_attributed_to_the_tracked_request() -> None:
+    metrics = Metrics()
+    monitor = LoopMonitor(LoopMonitorCfg(interval=0.01, stall_threshold=0.1), metrics)
+
+    async def handler() -> None:
+        monitor.track("test/chat/completions (20000000 bytes)")
+        time.sleep(0.3)
+
+    async def run() -> None:
+        monitor.start()
+        await asyncio.sleep(0.05)
+        await asyncio.create_task(handler())
+        await asyncio.sleep(0.05)
+        await monitor.stop()
+
+    asyncio.run(run())
+    stats = monitor.stats()
+    assert stats["max_lag_ms"] >= 200
+    assert "test/chat/completions (20000000 bytes)" in [s["request"] for s in stats["recent_stalls"]]
+    assert "prompt_passage_event_loop_lag_seconds_count" in metrics.render()
+
+
+def test_untracked_and_finished_tasks_are_not_blamed() -> None:
+    monitor = LoopMonitor(LoopMonitorCfg(interval=0.01, stall_threshold=0.1))
+
+    async def finished() -> None:
+        monitor.track("done")
+
+    async def run() -> None:
+        monitor.start()
+        await asyncio.create_task(finished())
+        await asyncio.sleep(0.02)
+        time.sleep(0.3)
+        await asyncio.sleep(0.05)
+        await monitor.stop()
+
+    asyncio.run(run())
+    assert monitor.stalls >= 1
+    assert all(stall["request"] is None for stall in monitor.recent)
+    assert not monitor._labels
@@ -0,0 +1,39 @@
+from prompt_passage.metrics import Histogram, Metrics, endpoint_label
+
+
+def test_histogram_renders_cumulative_buckets() -> None:
+    histogram = Histogram("latency_seconds", "Latency.", ("provider",), (0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 3.0):
+        histogram.observe(("a",), value)
+    out: list[str] = []
+    histogram.render(out)
+    assert out == [
+        "# HELP latency_seconds Latency.",
+        "# TYPE latency_seconds histogram",
+        'latency_seconds_bucket{provider="a",le="0.1"} 2',
+        'latency_seconds_bucket{provider="a",le="1"} 3',
+        'latency_seconds_bucket{provider="a",le="+Inf"} 4',
+        'latency_seconds_sum{provider="a"} 3.65',
+        'latency_seconds_count{provider="a"} 4',
+    ]
+
+
+def test_observation_records_once() -> None:
+    metrics = Metrics()
+    observation = metrics.start('we"ird', "chat/completions", 100)
+    observation.first_token()
+    observation.finish(200, 2048, {"prompt_tokens": 10, "completion_tokens": 20})
+    observation.finish(500)
+
+    text = metrics.render()
+    assert 'prompt_passage_requests_total{provider="we\\"ird",endpoint="chat/completions",status="200"} 1' in text
+    assert 'prompt_passage_requests_in_flight{provider="we\\"ird",endpoint="chat/completions"} 0' in text
+    assert 'status="500"' not in text
+    assert 'prompt_passage_tokens_count{provider="we\\"ird",endpoint="chat/completions",type="completion"} 1' in text
+    assert "prompt_passage_stream_ttft_seconds_count" in text
+    assert "prompt_passage_completion_tokens_per_second_count" in text
+
+
+def test_endpoint_label_is_bounded() -> None:
+    assert endpoint_label("responses") == "responses"
+    assert endpoint_label("models?api-version=1") == "other"
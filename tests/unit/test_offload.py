@@ -0,0 +1,103 @@
+import asyncio
+import json
+import threading
+import time
+
+from prompt_passage.body import prepare_request_body
+from prompt_passage.cache import cache_key
+from prompt_passage.config import OffloadCfg, TransformOp
+from prompt_passage.offload import Offloader, prepare_detached
+
+
+def _thread_name(_: bytes) -> str:
+    return threading.current_thread().name
+
+
+def test_small_bodies_run_inline_and_large_ones_in_the_pool() -> None:
+    offloader = Offloader(OffloadCfg(min_bytes=1024, max_workers=2))
+
+    async def run() -> tuple[str, str]:
+        small = await offloader.run(10, _thread_name, b"x" * 10)
+        large = await offloader.run(4096, _thread_name, b"x" * 4096)
+        return small, large
+
+    small, large = asyncio.run(run())
+    offloader.shutdown()
+    assert small == threading.current_thread().name
+    assert large.startswith("prompt-passage-body")
+    assert offloader.stats() == {"min_bytes": 1024, "offloaded": 1, "in_processes": 0, "inline": 1, "running": 0}
+
+
+def test_offloaded_work_does_not_block_the_loop() -> None:
+    offloader = Offloader(OffloadCfg(min_bytes=0))
+    release = threading.Event()
+    ticks: list[int] = []
+
+    def blocking() -> str:
+        release.wait(5)
+        return "done"
+
+    async def run() -> str:
+        work = asyncio.ensure_future(offloader.run(1, blocking))
+        for i in range(5):
+            await asyncio.sleep(0.001)
+            ticks.append(i)
+        release.set()
+        result: str = await work
+        return result
+
+    assert asyncio.run(run()) == "done"
+    offloader.shutdown()
+    assert ticks == [0, 1, 2, 3, 4]
+
+
+def test_detached_body_keeps_scalars_and_the_cache_key() -> None:
+    raw = json.dumps({"model": "a", "temperature": 0, "messages": [{"content": "hi"}], "seed": None}).encode()
+    steps = [TransformOp.model_validate({"set": {"max_tokens": 5}})]
+
+    prepared = prepare_detached(raw, "m", steps, True)
+
+    full = prepare_request_body(raw, "m", lambda body: {**body, "max_tokens": 5})
+    assert prepared.content == full.content
+    assert prepared.parsed == {"model": "m", "temperature": 0, "seed": None, "max_tokens": 5}
+    assert prepared.canonical is not None
+    assert full.parsed is not None
+    assert cache_key("p", "chat/completions", prepared.canonical) == cache_key("p", "chat/completions", full.parsed)
+    assert prepare_detached(raw, "m", None, False).canonical is None
+
+
+def test_json_parsing_in_worker_processes_keeps_the_loop_responsive() -> None:
+    message = {"role": "user", "content": "hello", "name": "n", "meta": {"a": 1, "b": [1, 2, 3]}}
+    body = json.dumps({"model": "a", "messages": [message] * 150_000}).encode()
+    started = time.perf_counter()
+    prepare_request_body(body, "m")
+    inline_seconds = time.perf_counter() - started
+    offloader = Offloader(OffloadCfg(min_bytes=1024, processes=1))
+
+    async def run() -> float:
+        loop = asyncio.get_running_loop()
+        # Start the worker process first; the measurement is of the parse alone.
+        await offloader.run_in_process(2048, prepare_detached, b"{}", "m", None, False)
+        worst = 0.0
+        done = False
+
+        async def tick() -> None:
+            nonlocal worst
+            while not done:
+                before = loop.time()
+                await asyncio.sleep(0.001)
+                worst = max(worst, loop.time() - before - 0.001)
+
+        ticker = asyncio.create_task(tick())
+        prepared = await offloader.run_in_process(len(body), prepare_detached, body, "m", None, False)
+        done = True
+        await ticker
+        assert prepared.rewritten and prepared.parsed == {"model": "m"}
+        return worst
+
+    try:
+        worst_lag = asyncio.run(run())
+    finally:
+        offloader.shutdown()
+    assert offloader.stats()["in_processes"] == 2
+    assert worst_lag < inline_seconds / 3, (worst_lag, inline_seconds)
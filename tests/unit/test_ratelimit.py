@@ -0,0 +1,70 @@
+import asyncio
+
+import pytest
+
+from prompt_passage.config import RateLimitCfg
+from prompt_passage.ratelimit import RateLimiter, RateLimitExceeded, TokenBucket, estimate_tokens
+
+
+def test_estimate_tokens() -> None:
+    body = b"x" * 400
+    assert estimate_tokens(body, {"max_tokens": 50}, 1024) == 150
+    assert estimate_tokens(body, {"max_output_tokens": 7}, 1024) == 107
+    assert estimate_tokens(body, {}, 1024) == 1124
+    assert estimate_tokens(body, None, 0) == 100
+
+
+def test_token_bucket_refills_over_time() -> None:
+    bucket = TokenBucket(6000)
+    assert bucket.wait_time(6000) == 0
+    bucket.take(6000)
+    assert 0.9 < bucket.wait_time(100) <= 1.0
+    assert bucket.wait_time(10_000) <= 60.0
+
+
+def test_try_take_takes_all_or_nothing() -> None:
+    bucket = TokenBucket(6000)
+    assert bucket.try_take(5000) == 0
+    assert 9.9 < bucket.try_take(2000) <= 10.0
+    assert bucket.level == pytest.approx(1000, abs=1)
+
+
+def test_fail_fast_when_over_quota() -> None:
+    limiter = RateLimiter("p", RateLimitCfg(rpm=1))
+
+    async def run() -> None:
+        await limiter.acquire(0)
+        with pytest.raises(RateLimitExceeded) as err:
+            await limiter.acquire(0)
+        assert 59 < err.value.retry_after <= 60
+
+    asyncio.run(run())
+    assert limiter.stats()["rejected"] == 1
+
+
+def test_requests_queue_up_to_max_wait() -> None:
+    limiter = RateLimiter("p", RateLimitCfg(rpm=6000, max_wait=1.0))
+    assert limiter.requests is not None
+    limiter.requests.level = 0
+
+    async def run() -> None:
+        await asyncio.gather(limiter.acquire(0), limiter.acquire(0))
+
+    asyncio.run(run())
+    stats = limiter.stats()
+    assert stats["admitted"] == 2
+    assert stats["delayed"] == 2
+
+
+def test_reservation_settles_with_actual_usage() -> None:
+    limiter = RateLimiter("p", RateLimitCfg(tpm=60_000))
+
+    async def run() -> None:
+        reservation = await limiter.acquire(10_000)
+        assert limiter.tokens is not None
+        assert limiter.tokens.level == pytest.approx(50_000, abs=10)
+        reservation.settle(2_000)
+        reservation.settle(9_000)  # only the first settlement counts
+        assert limiter.tokens.level == pytest.approx(58_000, abs=10)
+
+    asyncio.run(run())
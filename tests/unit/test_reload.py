@@ -0,0 +1,59 @@
+import asyncio
+import os
+from pathlib import Path
+from typing import Any
+
+import pytest
+import yaml
+
+from prompt_passage.config import ReloadCfg, RootConfig
+from prompt_passage.reload import ConfigReloader
+
+
+def _write(path: Path, model: str) -> None:
+    provider = {"endpoints": {"base_url": "https://a.example"}, "model": model, "auth": {"type": "apikey", "key": "k"}}
+    path.write_text(yaml.dump({"providers": {"a": provider}}))
+
+
+def test_invalid_file_keeps_the_running_config(tmp_path: Path) -> None:
+    path = tmp_path / "config.yaml"
+    _write(path, "m1")
+    applied: list[str] = []
+    reloader = ConfigReloader(path, ReloadCfg(), lambda cfg: applied.append(cfg.providers["a"].model))
+
+    asyncio.run(reloader.reload())
+    path.write_text("providers: {}\n")
+    with pytest.raises(ValueError):
+        asyncio.run(reloader.reload())
+
+    assert applied == ["m1"]
+    assert reloader.stats()["reloads"] == 1 and reloader.stats()["failures"] == 1
+    assert (
+        reloader.stats()["last_error"]
+        == "providers: Value error, The 'providers' mapping in the configuration cannot be empty."
+    )
+
+
+def test_watch_reloads_changed_file(tmp_path: Path) -> None:
+    path = tmp_path / "config.yaml"
+    _write(path, "m1")
+    applied: list[Any] = []
+
+    def apply(cfg: RootConfig) -> None:
+        applied.append(cfg.providers["a"].model)
+
+    reloader = ConfigReloader(path, ReloadCfg(watch=True, interval=0.01), apply)
+
+    async def run() -> None:
+        reloader.start()
+        await asyncio.sleep(0.05)
+        _write(path, "m2")
+        os.utime(path, ns=(1, 1))
+        for _ in range(100):
+            if applied:
+                break
+            await asyncio.sleep(0.01)
+        await reloader.stop()
+
+    asyncio.run(run())
+    assert applied == ["m2"]
@@ -0,0 +1,118 @@
+import asyncio
+from email.utils import formatdate
+import time
+
+import httpx
+import pytest
+from pytest_httpx import HTTPXMock
+
+from prompt_passage.config import RetryCfg, parse_config
+from prompt_passage.forwarder import Forwarder
+from prompt_passage.retry import RetryBudget, backoff, retry_after
+
+URL = "https://a.example/chat/completions"
+
+
+def _forwarder(budget: RetryBudget | None = None) -> Forwarder:
+    raw = {"a": {"endpoints": {"base_url": "https://a.example"}, "model": "m", "auth": {"type": "apikey", "key": "k"}}}
+    return Forwarder(parse_config({"providers": raw}).providers, budget)
+
+
+def test_retry_after_headers() -> None:
+    assert retry_after(httpx.Headers({"retry-after-ms": "250", "retry-after": "9"})) == 0.25
+    assert retry_after(httpx.Headers({"retry-after": "3"})) == 3.0
+    assert retry_after(httpx.Headers({"retry-after": "soon"})) is None
+    assert retry_after(httpx.Headers({})) is None
+    date = formatdate(time.time() + 60, usegmt=True)
+    delay = retry_after(httpx.Headers({"retry-after": date}))
+    assert delay is not None and 55 < delay <= 60
+
+
+def test_backoff_is_capped_and_jittered() -> None:
+    policy = RetryCfg(backoff_base=1.0, backoff_max=4.0)
+    assert all(0 <= backoff(policy, 10) <= 4.0 for _ in range(100))
+    assert len({backoff(policy, 1) for _ in range(10)}) > 1
+
+
+def test_budget_limits_retries() -> None:
+    budget = RetryBudget(ratio=0.5, min_per_second=0.1, window=10.0)
+    for _ in range(4):
+        budget.record_request()
+    assert [budget.try_spend() for _ in range(4)] == [True, True, True, False]
+    assert budget.stats() == {"retries": 3, "budget_exhausted": 1}
+
+
+def test_retries_429_honouring_retry_after_ms(httpx_mock: HTTPXMock) -> None:
+    httpx_mock.add_response(url=URL, status_code=429, headers={"retry-after-ms": "10"})
+    httpx_mock.add_response(url=URL, status_code=503)
+    httpx_mock.add_response(url=URL, json={"ok": True})
+    fwd = _forwarder()
+
+    async def run() -> httpx.Response:
+        try:
+            resp: httpx.Response = await fwd.forward(URL, b"{}", {}, RetryCfg(max_retries=2, backoff_base=0.01))
+            return resp
+        finally:
+            await fwd.aclose()
+
+    resp = asyncio.run(run())
+    assert resp.status_code == 200
+    assert fwd.retry_budget.retries == 2
+
+
+def test_long_retry_after_is_returned(httpx_mock: HTTPXMock) -> None:
+    httpx_mock.add_response(url=URL, status_code=429, headers={"retry-after": "120"})
+    fwd = _forwarder()
+
+    async def run() -> httpx.Response:
+        try:
+            resp: httpx.Response = await fwd.forward(URL, b"{}", {}, RetryCfg())
+            return resp
+        finally:
+            await fwd.aclose()
+
+    assert asyncio.run(run()).status_code == 429
+
+
+def test_errors_outside_policy_are_raised(httpx_mock: HTTPXMock) -> None:
+    httpx_mock.add_exception(httpx.ReadTimeout("slow"))
+    fwd = _forwarder()
+
+    async def run() -> None:
+        try:
+            await fwd.stream(URL, b"{}", {}, RetryCfg(max_retries=3))
+        finally:
+            await fwd.aclose()
+
+    with pytest.raises(httpx.ReadTimeout):
+        asyncio.run(run())
+
+
+def test_stream_retries_connect_errors_before_first_byte(httpx_mock: HTTPXMock) -> None:
+    httpx_mock.add_exception(httpx.ConnectError("down"))
+    httpx_mock.add_response(url=URL, content=b"data: 1\n\n")
+    fwd = _forwarder()
+
+    async def run() -> bytes:
+        try:
+            resp: httpx.Response = await fwd.stream(URL, b"{}", {}, RetryCfg(backoff_base=0.01))
+            return await resp.aread()
+        finally:
+            await fwd.aclose()
+
+    assert asyncio.run(run()) == b"data: 1\n\n"
+
+
+def test_exhausted_budget_returns_failure(httpx_mock: HTTPXMock) -> None:
+    httpx_mock.add_response(url=URL, status_code=500)
+    fwd = _forwarder(RetryBudget(ratio=0.0, min_per_second=0.0))
+
+    async def run() -> httpx.Response:
+        try:
+            resp: httpx.Response = await fwd.forward(URL, b"{}", {}, RetryCfg(max_retries=3))
+            return resp
+        finally:
+            await fwd.aclose()
+
+    assert asyncio.run(run()).status_code == 500
+    assert fwd.retry_budget.exhausted == 1
@@ -0,0 +1,89 @@
+import multiprocessing
+import time
+from pathlib import Path
+
+from prompt_passage.metrics import Metrics
+from prompt_passage.shared import SharedState, forget_worker
+
+
+def _take(directory: str, amount: float) -> None:
+    shared = SharedState(directory)
+    shared.bucket("p/tpm", 6000).take(amount)
+    shared.close()
+
+
+def _grab(directory: str, results: "multiprocessing.Queue[int]") -> None:
+    shared = SharedState(directory)
+    bucket = shared.bucket("p/rpm", 60)
+    results.put(sum(1 for _ in range(40) if bucket.try_take(1) == 0))
+    shared.close()
+
+
+def test_shared_buckets_never_grant_the_same_units_twice(tmp_path: Path) -> None:
+    shared = SharedState(tmp_path)
+    bucket = shared.bucket("p/rpm", 60)
+    context = multiprocessing.get_context("spawn")
+    results: "multiprocessing.Queue[int]" = context.Queue()
+    processes = [context.Process(target=_grab, args=(str(tmp_path), results)) for _ in range(4)]
+    started = time.monotonic()
+    for process in processes:
+        process.start()
+    granted = sum(results.get(timeout=30) for _ in processes)
+    for process in processes:
+        process.join(30)
+
+    # 60 to begin with, refilled at one a second.
+    assert 60 <= granted <= 60 + time.monotonic() - started
+    assert bucket.level < 1
+    shared.close()
+
+
+def test_buckets_are_shared_between_processes(tmp_path: Path) -> None:
+    shared = SharedState(tmp_path)
+    bucket = shared.bucket("p/tpm", 6000)
+    assert bucket.level == 6000
+
+    started = time.monotonic()
+    process = multiprocessing.get_context("spawn").Process(target=_take, args=(str(tmp_path), 5000))
+    process.start()
+    process.join(30)
+
+    assert process.exitcode == 0
+    # Refilled at 100 tokens/s while the other process ran.
+    assert 1000 <= bucket.level <= 1000 + 100 * (time.monotonic() - started)
+    # A changed quota is a different bucket.
+    assert shared.bucket("p/tpm", 60).level == 60
+    shared.close()
+
+
+def test_metrics_snapshots_add_up(tmp_path: Path) -> None:
+    worker, other = SharedState(tmp_path), SharedState(tmp_path)
+    other._snapshot = tmp_path / "metrics-1"
+    mine, theirs = Metrics(), Metrics()
+    mine.start("p", "chat/completions", 100).finish(200, 10)
+    for _ in range(2):
+        theirs.start("p", "chat/completions", 100).finish(200, 10)
+    theirs.start("p", "responses", 100)
+    other.publish(theirs.snapshot())
+
+    text = mine.render(worker.snapshots())
+    chat = 'provider="p",endpoint="chat/completions"'
+    assert f'prompt_passage_requests_total{{{chat},status="200"}} 3' in text
+    assert f'prompt_passage_request_duration_seconds_count{{{chat},status="200"}} 3' in text
+    assert 'prompt_passage_requests_in_flight{provider="p",endpoint="responses"} 1' in text
+
+    forget_worker(tmp_path, 1)
+    retired = mine.render(worker.snapshots())
+    assert f'prompt_passage_requests_total{{{chat},status="200"}} 3' in retired
+    assert f'prompt_passage_request_duration_seconds_count{{{chat},status="200"}} 3' in retired
+    assert 'prompt_passage_requests_in_flight{provider="p",endpoint="responses"}' not in retired
+    assert not (tmp_path / "metrics-1").exists()
+
+    # A second exited worker adds to the retired totals.
+    other._snapshot = tmp_path / "metrics-2"
+    other.publish(theirs.snapshot())
+    forget_worker(tmp_path, 2)
+    assert f'prompt_passage_requests_total{{{chat},status="200"}} 5' in mine.render(worker.snapshots())
+    assert len(worker.snapshots()) == 1
+    worker.close()
+    other.close()
@@ -0,0 +1,55 @@
+from prompt_passage.sse import StreamAccountant
+
+CHAT = (
+    b'data: {"choices":[{"delta":{"role":"assistant","content":""}}],"usage":null}\n\n'
+    b'data: {"choices":[{"delta":{"content":"Hel"}}],"usage":null}\n\n'
+    b'data: {"choices":[{"delta":{"content":"lo"},"finish_reason":null}],"usage":null}\n\n'
+    b'data: {"choices":[{"delta":{},"finish_reason":"stop"}],"usage":null}\n\n'
+    b'data: {"choices":[],"usage":{"prompt_tokens":5,"completion_tokens":2,"total_tokens":7}}\n\n'
+    b"data: [DONE]\n\n"
+)
+
+
+def _feed(data: bytes, size: int) -> StreamAccountant:
+    accountant = StreamAccountant()
+    for start in range(0, len(data), size):
+        accountant.feed(data[start : start + size])
+    return accountant
+
+
+def test_chat_stream_across_any_chunking() -> None:
+    for size in (1, 3, 7, 64, len(CHAT)):
+        accountant = _feed(CHAT, size)
+        assert accountant.events == 6
+        assert accountant.deltas == 2
+        assert accountant.finish_reason == "stop"
+        assert accountant.usage == {"prompt_tokens": 5, "completion_tokens": 2, "total_tokens": 7}
+        assert accountant.done
+        assert accountant.first_token_at is not None
+
+
+def test_counts_deltas_without_usage() -> None:
+    accountant = _feed(CHAT.replace(b'"usage":{"prompt_tokens":5,"completion_tokens":2,"total_tokens":7}', b""), 5)
+    assert accountant.usage is None
+    assert accountant.reported_usage() == {"completion_tokens": 2, "estimated": True}
+
+
+def test_responses_events_with_crlf() -> None:
+    stream = (
+        b"event: response.output_text.delta\r\n"
+        b'data: {"type":"response.output_text.delta","delta":"Hi"}\r\n\r\n'
+        b": keep-alive\r\n\r\n"
+        b"event: response.completed\r\n"
+        b'data: {"type":"response.completed","response":{"status":"completed",\r\n'
+        b'data: "usage":{"input_tokens":3,"output_tokens":1}}}\r\n\r\n'
+    )
+    accountant = _feed(stream, 4)
+    assert accountant.deltas == 1
+    assert accountant.finish_reason == "completed"
+    assert accountant.usage == {"input_tokens": 3, "output_tokens": 1}
+
+
+def test_no_events() -> None:
+    accountant = _feed(b'data: {"choices":[]}\n\n', 8)
+    assert accountant.reported_usage() is None
+    assert accountant.first_token_at is None
@@ -0,0 +1,41 @@
+from typing import Any
+
+from prompt_passage.config import parse_config
+from prompt_passage.state import build_state
+
+
+def _config(providers: dict[str, Any], service: dict[str, Any] | None = None) -> Any:
+    raw = {
+        name: {"model": "m", "auth": {"type": "apikey", "key": "k"}, **provider} for name, provider in providers.items()
+    }
+    return parse_config({"providers": raw, **({"service": service} if service else {})})
+
+
+def test_unchanged_providers_keep_their_runtime_objects() -> None:
+    a = {"endpoints": {"base_url": "https://a.example"}, "transform": [{"delete": ["n"]}]}
+    b = {"endpoints": {"base_url": "https://b.example"}, "rate_limit": {"requests_per_minute": 10}}
+    first, changes = build_state(_config({"a": a, "b": b}))
+    assert changes.added == ["a", "b"]
+
+    b_changed = {**b, "model": "other"}
+    second, changes = build_state(_config({"a": a, "b": b_changed, "c": a}), first)
+    assert changes.as_dict() == {"added": ["c"], "removed": [], "changed": ["b"], "unchanged": ["a"]}
+    assert second.providers["a"] is first.providers["a"]
+    assert second.balancers["a"] is first.balancers["a"]
+    assert second.providers["b"].model == "other"
+    assert second.limiters["b"] is not first.limiters["b"]
+
+    third, changes = build_state(_config({"a": a}), second)
+    assert changes.removed == ["b", "c"]
+    assert set(third.providers) == {"a"}
+
+
+def test_admission_is_rebuilt_only_when_its_limits_change() -> None:
+    a = {"endpoints": {"base_url": "https://a.example"}, "max_concurrency": 4}
+    first, _ = build_state(_config({"a": a}))
+    assert first.admission is not None
+    second, _ = build_state(_config({"a": a, "b": {"endpoints": {"base_url": "https://b.example"}}}), first)
+    assert second.admission is first.admission
+    third, _ = build_state(_config({"a": {**a, "max_concurrency": 8}}), second)
+    assert third.admission is not first.admission
+    assert third.admission is not None and third.admission.provider_limits == {"a": 8}
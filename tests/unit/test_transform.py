@@ -0,0 +1,107 @@
+from typing import Any
+
+import pytest
+from pydantic import ValidationError
+
+from prompt_passage.config import ProviderCfg, parse_config
+
+
+def _provider(transform: Any) -> ProviderCfg:
+    cfg = parse_config(
+        {
+            "providers": {
+                "p": {
+                    "endpoints": {"base_url": "https://a.example"},
+                    "model": "m",
+                    "auth": {"type": "apikey", "key": "k"},
+                    "transform": transform,
+                }
+            }
+        }
+    )
+    return cfg.providers["p"]
+
+
+def test_rename_delete_set_default_move() -> None:
+    provider = _provider(
+        [
+            {"rename": {"messages": "input", "options.seed": "random_seed"}},
+            {"delete": ["n", "logit_bias", "absent.key"]},
+            {"set": {"store": False, "metadata.source": "proxy"}},
+            {"default": {"max_output_tokens": 1024, "temperature": 1}},
+            {"move": {"response_format": "text.format"}},
+        ]
+    )
+    body = {
+        "messages": [{"role": "user", "content": "hi"}],
+        "options": {"seed": 7},
+        "n": 1,
+        "temperature": 0,
+        "response_format": {"type": "json_object"},
+    }
+    assert provider.apply_transform(body) == {
+        "input": [{"role": "user", "content": "hi"}],
+        "options": {"random_seed": 7},
+        "temperature": 0,
+        "store": False,
+        "metadata": {"source": "proxy"},
+        "max_output_tokens": 1024,
+        "text": {"format": {"type": "json_object"}},
+    }
+
+
+def test_conditional_steps() -> None:
+    provider = _provider(
+        [
+            {
+                "if": {"equals": {"stream": True}, "missing": "stream_options"},
+                "then": [{"set": {"stream_options": {"include_usage": True}}}],
+                "else": [{"delete": ["stream_options"]}],
+            }
+        ]
+    )
+    streamed = provider.apply_transform({"stream": True})
+    assert streamed == {"stream": True, "stream_options": {"include_usage": True}}
+    assert provider.apply_transform({"stream": False, "stream_options": {}}) == {"stream": False}
+    # Values written by ``set`` are copied, so requests never share them.
+    streamed["stream_options"]["include_usage"] = False
+    assert provider.apply_transform({"stream": True})["stream_options"] == {"include_usage": True}
+
+
+def test_steps_never_overwrite_values_that_are_not_objects(caplog: pytest.LogCaptureFixture) -> None:
+    provider = _provider(
+        [
+            {"set": {"text.format": "json", "extra.flag": True}},
+            {"default": {"text.verbosity": "low"}},
+            {"move": {"response_format": "text.format", "a": "a.b"}},
+        ]
+    )
+    body = {"text": "hello", "response_format": {"type": "json"}, "a": 1}
+    assert provider.apply_transform(body) == {
+        "text": "hello",
+        "response_format": {"type": "json"},
+        "a": {"b": 1},
+        "extra": {"flag": True},
+    }
+    assert "'text.format' runs through a value that is not an object" in caplog.text
+
+
+def test_jq_transform_still_supported() -> None:
+    provider = _provider(".messages as $m | .input=$m | del(.messages)")
+    assert provider.apply_transform({"messages": [1]}) == {"input": [1]}
+
+
+@pytest.mark.parametrize(
+    "step",
+    [
+        {},
+        {"rename": {"a": "b"}, "delete": ["c"]},
+        {"delete": ["c"], "then": [{"delete": ["d"]}]},
+        {"unknown": ["c"]},
+        {"if": {}, "then": [{"delete": ["d"]}]},
+        {"if": {"equals": {}}, "then": [{"delete": ["d"]}]},
+    ],
+)
+def test_invalid_steps(step: dict[str, Any]) -> None:
+    with pytest.raises(ValidationError):
+        _provider([step])